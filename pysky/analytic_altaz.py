@@ -0,0 +1,191 @@
+"""This module converts equatorial coordinates to altitude and azimuth with NumPy."""
+import astropy.units as u
+import numpy as np
+from astropy.coordinates import SkyCoord
+
+from .logger import Logger
+
+# Largest angular error in degrees the analytic engine is expected to make.
+# It skips nutation (< 20"), annual aberration (< 21"), the equation of the
+# equinoxes (< 17") and UT1 - UTC (< 14").
+ERROR_BOUND = 0.03
+
+J2000 = 2451545.0
+
+
+def local_sidereal_time(jd: np.ndarray, longitude: float) -> np.ndarray:
+    """
+    Compute the local mean sidereal time.
+
+    :param jd: Julian dates (UTC, used as UT1).
+    :param longitude: East longitude of the location in degrees.
+    :return: Local sidereal times in degrees.
+    """
+    jd = np.asarray(jd, dtype=float)
+    centuries = (jd - J2000) / 36525.0
+    gmst = (
+        280.46061837
+        + 360.98564736629 * (jd - J2000)
+        + 0.000387933 * centuries**2
+        - centuries**3 / 38710000.0
+    )
+    return (gmst + longitude) % 360.0
+
+
+def precess(ra: np.ndarray, dec: np.ndarray, jd: float) -> tuple:
+    """
+    Precess J2000 coordinates to the mean equator and equinox of a date.
+
+    :param ra: Right ascensions in degrees.
+    :param dec: Declinations in degrees.
+    :param jd: Julian date of the equinox to precess to.
+    :return: Tuple of the precessed right ascensions and declinations in degrees.
+    """
+    centuries = (jd - J2000) / 36525.0
+    zeta, z, theta = np.radians(
+        np.array(
+            [
+                2306.2181 * centuries
+                + 0.30188 * centuries**2
+                + 0.017998 * centuries**3,
+                2306.2181 * centuries
+                + 1.09468 * centuries**2
+                + 0.018203 * centuries**3,
+                2004.3109 * centuries
+                - 0.42665 * centuries**2
+                - 0.041833 * centuries**3,
+            ]
+        )
+        / 3600.0
+    )
+    rotation = np.array(
+        [
+            [
+                np.cos(zeta) * np.cos(theta) * np.cos(z) - np.sin(zeta) * np.sin(z),
+                -np.sin(zeta) * np.cos(theta) * np.cos(z) - np.cos(zeta) * np.sin(z),
+                -np.sin(theta) * np.cos(z),
+            ],
+            [
+                np.cos(zeta) * np.cos(theta) * np.sin(z) + np.sin(zeta) * np.cos(z),
+                -np.sin(zeta) * np.cos(theta) * np.sin(z) + np.cos(zeta) * np.cos(z),
+                -np.sin(theta) * np.sin(z),
+            ],
+            [
+                np.cos(zeta) * np.sin(theta),
+                -np.sin(zeta) * np.sin(theta),
+                np.cos(theta),
+            ],
+        ]
+    )
+    ra = np.radians(ra)
+    dec = np.radians(dec)
+    vector = np.stack(
+        np.broadcast_arrays(
+            np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)
+        ),
+        axis=-1,
+    )
+    x, y, z = np.moveaxis(vector @ rotation.T, -1, 0)
+    return np.degrees(np.arctan2(y, x)) % 360.0, np.degrees(
+        np.arcsin(np.clip(z, -1, 1))
+    )
+
+
+def equatorial_to_altaz(
+    ra: np.ndarray, dec: np.ndarray, lst: np.ndarray, latitude: float
+) -> tuple:
+    """
+    Convert right ascensions and declinations to altitudes and azimuths.
+
+    Uses the plain spherical triangle of the hour angle, so it ignores
+    precession, nutation, aberration and refraction.
+
+    :param ra: Right ascensions in degrees.
+    :param dec: Declinations in degrees.
+    :param lst: Local sidereal times in degrees, broadcastable against ra.
+    :param latitude: Latitude of the location in degrees.
+    :return: Tuple of the altitude and azimuth arrays in degrees.
+    """
+    hour_angle = np.radians(np.asarray(lst) - np.asarray(ra))
+    dec = np.radians(dec)
+    lat = np.radians(latitude)
+    sin_alt = np.sin(dec) * np.sin(lat) + np.cos(dec) * np.cos(lat) * np.cos(hour_angle)
+    alt = np.arcsin(np.clip(sin_alt, -1.0, 1.0))
+    az = np.arctan2(
+        -np.cos(dec) * np.sin(hour_angle),
+        np.sin(dec) * np.cos(lat) - np.cos(dec) * np.sin(lat) * np.cos(hour_angle),
+    )
+    return np.degrees(alt), np.degrees(az) % 360.0
+
+
+def altaz(
+    ra: np.ndarray, dec: np.ndarray, jd: np.ndarray, latitude: float, longitude: float
+) -> tuple:
+    """
+    Compute the altitudes and azimuths of J2000 coordinates within ERROR_BOUND.
+
+    The coordinates are precessed once to the middle of the given dates,
+    since precession over a night is far below the error bound, and then
+    converted with the local sidereal time of every date.
+
+    :param ra: J2000 right ascensions in degrees.
+    :param dec: J2000 declinations in degrees.
+    :param jd: Julian dates (UTC), broadcastable against ra.
+    :param latitude: Latitude of the location in degrees.
+    :param longitude: East longitude of the location in degrees.
+    :return: Tuple of the altitude and azimuth arrays in degrees.
+    """
+    jd = np.asarray(jd, dtype=float)
+    ra, dec = precess(ra, dec, float(np.mean(jd)))
+    return equatorial_to_altaz(ra, dec, local_sidereal_time(jd, longitude), latitude)
+
+
+def angular_error(alt1, az1, alt2, az2) -> np.ndarray:
+    """
+    Compute the angular distance between two sets of horizontal coordinates.
+
+    :param alt1: First altitudes in degrees.
+    :param az1: First azimuths in degrees.
+    :param alt2: Second altitudes in degrees.
+    :param az2: Second azimuths in degrees.
+    :return: Array of the distances in degrees.
+    """
+    alt1, az1, alt2, az2 = map(np.radians, (alt1, az1, alt2, az2))
+    haversine = (
+        np.sin((alt2 - alt1) / 2.0) ** 2
+        + np.cos(alt1) * np.cos(alt2) * np.sin((az2 - az1) / 2.0) ** 2
+    )
+    return np.degrees(2.0 * np.arcsin(np.sqrt(np.clip(haversine, 0.0, 1.0))))
+
+
+def accuracy_check(ra: np.ndarray, dec: np.ndarray, context: object) -> float:
+    """
+    Compare the analytic engine against the astropy transform.
+
+    :param ra: J2000 right ascensions in degrees.
+    :param dec: J2000 declinations in degrees.
+    :param context: ObservingContext of the run.
+    :return: Largest angular error in degrees at the start and end times.
+    """
+    ra = np.asarray(ra, dtype=float).reshape((-1, 1))
+    dec = np.asarray(dec, dtype=float).reshape((-1, 1))
+    if ra.size == 0:
+        return 0.0
+    reference = SkyCoord(ra=ra * u.deg, dec=dec * u.deg).transform_to(context.frame)
+    alt, az = altaz(
+        ra,
+        dec,
+        context.times.jd,
+        context.location.lat.degree,
+        context.location.lon.degree,
+    )
+    max_error = float(
+        np.max(angular_error(alt, az, reference.alt.degree, reference.az.degree))
+    )
+    lvl = 20 if max_error <= ERROR_BOUND else 30
+    Logger.log(
+        f"Analytic engine maximum error is {max_error * 3600:.1f} arcsec over "
+        + f"{ra.size} objects (bound {ERROR_BOUND * 3600:.0f} arcsec).",
+        lvl,
+    )
+    return max_error
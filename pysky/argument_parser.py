@@ -43,6 +43,81 @@ def cli_parse():
         default=1,
         type=int,
     )
+    parser.add_argument(
+        "-tl",
+        "--timeline",
+        help="Report objects visible at any time of the range "
+        + "with their rise, transit and set times.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        help="Engine computing altitudes and azimuths, the astropy transforms "
+        + "or the faster analytic approximation.",
+        choices=["astropy", "analytic"],
+        type=str,
+    )
+    parser.add_argument(
+        "-ca",
+        "--check-accuracy",
+        help="Report the largest error of the analytic engine against astropy.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-ee",
+        "--ephemeris-engine",
+        help="Query the ephemerides of the Sun, the Moon and the planets "
+        + "from JPL Horizons or compute them locally without the network.",
+        choices=["horizons", "local"],
+        type=str,
+    )
+    parser.add_argument(
+        "-c",
+        "--catalog",
+        help="Path of a large CSV or FITS star catalogue to check, "
+        + "with name, ra, dec and vmag columns. Can be given more than once.",
+        action="append",
+        type=str,
+    )
+    parser.add_argument(
+        "-nm",
+        "--network-mode",
+        help="Use the remote services live, record their responses "
+        + "or replay the recorded responses without the network.",
+        choices=["live", "record", "replay"],
+        default="live",
+        type=str,
+    )
+    parser.add_argument(
+        "-rd",
+        "--replay-dir",
+        help="Directory of the recorded responses, `data/replay` by default.",
+        default="",
+        type=str,
+    )
+    parser.add_argument(
+        "-rl",
+        "--replay-latency",
+        help="Seconds added to every replayed response.",
+        default=0.0,
+        type=float,
+    )
+    parser.add_argument(
+        "-rf",
+        "--replay-failure-rate",
+        help="Share of the replayed responses failing with a 503 status.",
+        default=0.0,
+        type=float,
+    )
+    parser.add_argument(
+        "-si",
+        "--stand-in",
+        help="URL of a stand-in server started with `python -m pysky.replay` "
+        + "to send all requests to.",
+        default="",
+        type=str,
+    )
     parser.add_argument(
         "-v", "--verbosity", help="Verbosity level (1, 2, 3, 4, 5)", default=2, type=int
     )
@@ -52,6 +127,29 @@ def cli_parse():
     # Sets the number of threads
     Const.THREADS = args.threads
 
+    # Sets the timeline mode
+    Const.TIMELINE = args.timeline
+
+    # Sets the alt/az engine, overriding the user preferences
+    if args.engine is not None:
+        Const.ENGINE = args.engine
+    Const.CHECK_ACCURACY = args.check_accuracy
+
+    # Sets the ephemeris engine, overriding the user preferences
+    if args.ephemeris_engine is not None:
+        Const.EPHEMERIS_ENGINE = args.ephemeris_engine
+
+    # Sets the large catalogues, added to the ones of the user preferences
+    if args.catalog is not None:
+        Const.CATALOGS = Const.CATALOGS + args.catalog
+
+    # Sets the record/replay layer of the remote services
+    Const.NETWORK_MODE = args.network_mode
+    Const.REPLAY_DIR = args.replay_dir
+    Const.REPLAY_LATENCY = args.replay_latency
+    Const.REPLAY_FAILURE_RATE = args.replay_failure_rate
+    Const.STAND_IN_URL = args.stand_in
+
     # Sets the verbosity level
     if args.verbosity == 1:
         Const.VERBOSITY = 50
@@ -1,19 +1,138 @@
 """Get astropy information of ephemeris."""
+import threading
 import time
 
+import astropy.constants
 import astropy.coordinates
-import astropy.time
-import astropy.units
+import astropy.units as u
+import numpy as np
 
 from .const import Const
 from .logger import Logger
 
+# Types of the bodies that are not planets, by lowercase name
+BODY_TYPES = {"sun": "star", "moon": "satellite"}
 
-def get_info(celestial_obj: str):
+# Ephemeris the process is set to, its kernel stays open once loaded
+_EPHEMERIS = None
+_EPHEMERIS_LOCK = threading.Lock()
+
+
+def use_ephemeris() -> str:
+    """
+    Set the solar system ephemeris of the whole process, loading its kernel
+    on the first call only.
+
+    :return: Name of the ephemeris, "jpl" or `Const.LOCAL_EPHEMERIS` with the
+             local engine, which has to work without downloading the kernel.
+    """
+    global _EPHEMERIS
+    ephemeris = "jpl"
+    if Const.EPHEMERIS_ENGINE == "local":
+        ephemeris = Const.LOCAL_EPHEMERIS
+    with _EPHEMERIS_LOCK:
+        if _EPHEMERIS != ephemeris:
+            Logger.log(f"Loading the {ephemeris} solar system ephemeris...")
+            # Set outside of a with block so it is not reloaded by the next call
+            astropy.coordinates.solar_system_ephemeris.set(ephemeris)
+            _EPHEMERIS = ephemeris
+    return ephemeris
+
+
+def get_bodies(bodies: list, times, location) -> dict:
+    """
+    Compute the positions of solar system bodies at every time at once.
+    The position of the observer is computed once and the positions of all
+    the bodies are transformed to its frame together.
+
+    :param bodies: Names of the bodies.
+    :param times: Time, a single one or an array.
+    :param location: EarthLocation of the observer.
+    :return: Dictionary of the names of the bodies to their GCRS SkyCoord with
+             the shape of the times, the ones the ephemeris does not hold are
+             left out.
+    """
+    if len(bodies) == 0:
+        return dict()
+    try:
+        use_ephemeris()
+    except Exception as e:
+        Logger.log("Unable to load the solar system ephemeris!", 40)
+        Logger.log(str(e), 40)
+        return dict()
+    known = astropy.coordinates.solar_system_ephemeris.bodies
+    t1 = time.time()
+    obsgeoloc, obsgeovel = location.get_gcrs_posvel(times)
+    earth = astropy.coordinates.get_body_barycentric("earth", times) + obsgeoloc
+    apparent = dict()
+    for body in bodies:
+        if body.lower() not in known:
+            Logger.log(f"{body} is not in the solar system ephemeris.", 10)
+            continue
+        try:
+            apparent[body] = _apparent_position(body, times, earth)
+        except Exception as e:
+            Logger.log(f"Unable to compute the position of {body}!", 40)
+            Logger.log(str(e), 40)
+    if len(apparent) == 0:
+        return dict()
+
+    # One transformation with a row per body and a column per time
+    gcrs = astropy.coordinates.ICRS(
+        astropy.coordinates.CartesianRepresentation(
+            np.stack([position.xyz for position in apparent.values()], axis=1)
+        )
+    ).transform_to(
+        astropy.coordinates.GCRS(
+            obstime=times, obsgeoloc=obsgeoloc, obsgeovel=obsgeovel
+        )
+    )
+    cartesian = gcrs.cartesian
+    positions = {
+        body: astropy.coordinates.SkyCoord(
+            astropy.coordinates.GCRS(
+                cartesian[row],
+                obstime=times,
+                obsgeoloc=obsgeoloc,
+                obsgeovel=obsgeovel,
+            )
+        )
+        for row, body in enumerate(apparent)
+    }
+    Logger.log(
+        f"Computed the positions of {len(positions)} of {len(bodies)} bodies "
+        + f"in {time.time() - t1:.2f} seconds!"
+    )
+    return positions
+
+
+def _apparent_position(body: str, times, earth) -> object:
+    """
+    :param body: Name of the body.
+    :param times: Time, a single one or an array.
+    :param earth: Barycentric CartesianRepresentation of the observer.
+    :return: Barycentric CartesianRepresentation of the body when the light
+             reaching the observer at the times left it.
+    """
+    light_travel_time = 0.0 * u.s
+    delta = 20.0 * u.s
+    emitted = times
+    while np.any(np.fabs(delta) > 1.0e-8 * u.s):
+        distance = (
+            astropy.coordinates.get_body_barycentric(body, emitted) - earth
+        ).norm()
+        delta = light_travel_time - distance / astropy.constants.c
+        light_travel_time = distance / astropy.constants.c
+        emitted = times - light_travel_time
+    return astropy.coordinates.get_body_barycentric(body, emitted)
+
+
+def get_info(celestial_obj: str, context: object):
     """
     This function uses the astropy module to retrieve
     distance information from the passed celestial object.
     :celestial_obj: Name of the celestial object.
+    :context: ObservingContext of the run.
     :return: List of the location of the object.
     """
 
@@ -21,62 +140,39 @@ def get_info(celestial_obj: str):
     if not isinstance(celestial_obj, str):
         raise TypeError(f"{type(celestial_obj)} is not of type str.")
 
-    try:
-        static_location = astropy.coordinates.EarthLocation.from_geodetic(
-            Const.LATITUDE * astropy.units.deg,
-            Const.LONGITUDE * astropy.units.deg,
-            height=(Const.ELEVATION / 1000.0) * astropy.units.m,
-        )
-
-        # Retrieves the information of the body
-        Logger.log(f"Retrieving coordinates for {celestial_obj}")
-        t1 = time.time()
-        with astropy.coordinates.solar_system_ephemeris.set("jpl"):
-            body_coordinates = astropy.coordinates.get_body(
-                f"{celestial_obj}",
-                astropy.time.Time(
-                    f"{Const.START_YEAR}-"
-                    + f"{Const.START_MONTH}-"
-                    + f"{Const.START_DAY} "
-                    + f"{Const.START_TIME}",
-                    format="iso",
-                ),
-                static_location,
-            )
-
-        Logger.log(f"Retrieved coordinates for {celestial_obj} in {time.time() - t1}!")
-        return (
-            body_coordinates.ra.degree,
-            body_coordinates.dec.degree,
-        )
-
-    except Exception as e:
-        Logger.log(str(e), 50)
+    # Retrieves the information of the body
+    Logger.log(f"Retrieving coordinates for {celestial_obj}")
+    positions = get_bodies([celestial_obj], context.start_time, context.location)
+    if celestial_obj not in positions:
+        return None
+    return (
+        positions[celestial_obj].ra.degree,
+        positions[celestial_obj].dec.degree,
+    )
 
 
-def get_ephemeris_info(body: str, cache_file: dict) -> dict:
+def get_ephemeris_info(bodies: dict, context: object) -> dict:
     """
-    Retrieve the ephemeris information from the given body and update the cache file accordingly.
-    :param body: Object to check.
-    :param atime: astropy.time object.
-    :param cache_file: Cache file.
-    :return: Dictionary of the object.
+    Retrieve the ephemeris information of the given bodies and update their
+    cache records accordingly, with one position computation for all of them.
+    The bodies the ephemeris does not hold keep the coordinates of their
+    records.
+    :param bodies: Dictionary of the objects to their cache records.
+    :param context: ObservingContext of the run.
+    :return: Dictionary of the objects to their updated records.
     """
-    Logger.log(f"Retrieving coordinates for {body}...")
-    ra_dec_tuple = get_info(body)
-    if ra_dec_tuple is None:
-        ra = "-"
-        dec = "-"
-    else:
-        ra, dec = ra_dec_tuple
-    # cache_file[f"{body}"] = {}
-    cache_file[f"{body}"]["Type"] = "planet"
-    cache_file[f"{body}"]["Created"] = time.strftime("%Y-%d-%m %H:%M", time.gmtime())
-    Logger.log(f"Coordinates for {body} retrieved.")
-    Logger.log(f"Writing coordinates for {body} to cache...")
-    try:
-        cache_file[f"{body}"]["Coordinates"] = {"ra": ra, "dec": dec}  # Right ascension
-    except TypeError:
-        print(body)
-    Logger.log(f"Successfully wrote coordinates for {body} to cache!")
-    return cache_file
+    Logger.log(f"Retrieving coordinates for {len(bodies)} bodies...")
+    positions = get_bodies(list(bodies), context.start_time, context.location)
+    created = time.strftime("%Y-%d-%m %H:%M", time.gmtime())
+    for body, record in bodies.items():
+        record["Type"] = BODY_TYPES.get(body.lower(), "planet")
+        record["Created"] = created
+        if body in positions:
+            record["Coordinates"] = {
+                "ra": float(positions[body].ra.degree),
+                "dec": float(positions[body].dec.degree),
+            }
+        elif "Coordinates" not in record:
+            record["Coordinates"] = {"ra": "-", "dec": "-"}
+    Logger.log(f"Successfully wrote coordinates for {len(bodies)} bodies to cache!")
+    return bodies
@@ -0,0 +1,468 @@
+"""This module stores the cache of the celestial objects, one record per object,
+in a SQLite database in WAL mode so reads and writes only touch the objects
+that are used or changed and threads can share it safely."""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from .const import Const
+from .logger import Logger
+
+# Bump and add a migration to MIGRATIONS when the schema changes
+SCHEMA_VERSION = 4
+
+# Shortest lifetime in seconds of ephemeris data, so a window in the past
+# stays cached for the rest of the run
+EPHEMERIS_MIN_TTL = 86400.0
+
+
+class Cache(object):
+    """
+    Per-object cache backed by SQLite.
+
+    Every record is the dictionary of one object stored as JSON. Writes made
+    inside `batch` are committed together, any other write is committed
+    on its own.
+
+    Records expire after `Const.CACHE_TTL_DAYS` unless they are ephemeris
+    data, which is stored with the site and window it was computed for and
+    expires with that window. Beyond `Const.CACHE_MAX_OBJECTS` objects the
+    least recently used ones are evicted.
+
+    Names a service could not resolve are recorded apart with the reason,
+    and skipped until they expire after `Const.FAILURE_TTL_DAYS`.
+
+    The rows of JPL Horizons ephemerides are stored apart as well, one per
+    body, site, step and epoch, so overlapping windows share them.
+
+    Calling sequence:
+        cache = Cache(Path(Const.ROOT_DIR, "data", "cache.sqlite3"))
+        with cache.batch():
+            cache.put("polaris", {"Type": "Star"})
+        cache.get("polaris")
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Path of the database file, created if it does not exist.
+        """
+        self.path = Path(path)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._connection = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+
+    def _migrate(self) -> None:
+        """
+        Bring the schema from its stored user_version up to SCHEMA_VERSION.
+        """
+        with self.batch():
+            version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+            if version > SCHEMA_VERSION:
+                raise RuntimeError(
+                    f"Cache `{self.path}` has schema version {version}, newer "
+                    + f"than the supported version {SCHEMA_VERSION}."
+                )
+            for migration in MIGRATIONS[version:SCHEMA_VERSION]:
+                Logger.log(f"Migrating cache to `{migration.__name__}`...")
+                migration(self)
+            # PRAGMA does not accept parameters
+            self._connection.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    @contextmanager
+    def batch(self):
+        """
+        Group the writes made inside the block in one transaction,
+        which is rolled back if the block raises.
+        """
+        with self._lock:
+            if self._depth == 0:
+                self._connection.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._connection.execute("ROLLBACK")
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                self._connection.execute("COMMIT")
+
+    def get(self, name: str, default=None, window_key=None):
+        """
+        :param name: Name of the object.
+        :param default: Value returned if the object is not cached.
+        :param window_key: Site and window of the run, ephemeris data of
+                           any other one is a miss.
+        :return: Dictionary of the object or the default.
+        """
+        records = self.get_many([name], window_key)
+        return records.get(name, default)
+
+    def get_many(self, names: list, window_key=None, count=True) -> dict:
+        """
+        :param names: Names of the objects.
+        :param window_key: Site and window of the run, ephemeris data of
+                           any other one is a miss.
+        :param count: False to leave the hits and misses as they are, when
+                      the objects were already looked up in the run.
+        :return: Dictionary of the cached objects among the names.
+        """
+        names = list(names)
+        records = dict()
+        with self.batch():
+            # Stay below the SQLite limit of bound parameters
+            for first in range(0, len(names), 500):
+                chunk = names[first : first + 500]
+                rows = self._connection.execute(
+                    "SELECT name, record FROM objects WHERE "
+                    + f"name IN ({', '.join('?' * len(chunk))}) AND expires > ? "
+                    + "AND (window_key IS NULL OR window_key = ?)",
+                    chunk + [time.time(), window_key],
+                ).fetchall()
+                records.update((name, json.loads(record)) for name, record in rows)
+            self._touch(list(records.keys()))
+            if count:
+                self.hits += len(records)
+                self.misses += len(set(names)) - len(records)
+        return records
+
+    def get_all(self, window_key=None) -> dict:
+        """
+        :param window_key: Site and window of the run, ephemeris data of
+                           any other one is left out.
+        :return: Dictionary of every cached object.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT name, record FROM objects WHERE expires > ? "
+                + "AND (window_key IS NULL OR window_key = ?) ORDER BY name",
+                (time.time(), window_key),
+            ).fetchall()
+        return {name: json.loads(record) for name, record in rows}
+
+    def put(self, name: str, record: dict, window_key=None, window_end=None) -> None:
+        """
+        Write the record of an object, replacing the previous one.
+
+        :param name: Name of the object.
+        :param record: Dictionary of the object.
+        :param window_key: Site and window of ephemeris data, None for
+                           static data that expires after Const.CACHE_TTL_DAYS.
+        :param window_end: Unix time of the end of the window of ephemeris data.
+        """
+        self.put_many({name: record}, window_key, window_end)
+
+    def put_many(self, records: dict, window_key=None, window_end=None) -> None:
+        """
+        Write the records of several objects in one transaction.
+
+        :param records: Dictionary of the object names to their records.
+        :param window_key: Site and window of ephemeris data, None for
+                           static data that expires after Const.CACHE_TTL_DAYS.
+        :param window_end: Unix time of the end of the window of ephemeris data.
+        """
+        now = time.time()
+        if window_key is None:
+            expires = now + Const.CACHE_TTL_DAYS * 86400.0
+        else:
+            expires = max(window_end or now, now + EPHEMERIS_MIN_TTL)
+        with self.batch():
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO objects (name, record, updated, expires, "
+                + "accessed, window_key) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        name,
+                        json.dumps(record, sort_keys=True),
+                        now,
+                        expires,
+                        now,
+                        window_key,
+                    )
+                    for name, record in records.items()
+                ],
+            )
+            self._evict_least_recent()
+
+    def get_failures(self, source: str, names: list) -> dict:
+        """
+        :param source: Service that failed to resolve the names.
+        :param names: Names of the objects.
+        :return: Dictionary of the names that recently failed to their reason.
+        """
+        names = list(names)
+        failures = dict()
+        with self._lock:
+            for first in range(0, len(names), 500):
+                chunk = names[first : first + 500]
+                rows = self._connection.execute(
+                    "SELECT name, reason FROM failures WHERE source = ? AND "
+                    + f"name IN ({', '.join('?' * len(chunk))}) AND expires > ?",
+                    [source] + chunk + [time.time()],
+                ).fetchall()
+                failures.update(rows)
+        return failures
+
+    def put_failures(self, source: str, failures: dict) -> None:
+        """
+        Record names a service could not resolve, so they are skipped
+        until they expire after Const.FAILURE_TTL_DAYS.
+
+        :param source: Service that failed to resolve the names.
+        :param failures: Dictionary of the names to the reason of the failure.
+        """
+        now = time.time()
+        with self.batch():
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO failures (source, name, reason, updated, "
+                + "expires) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (source, name, reason, now, now + Const.FAILURE_TTL_DAYS * 86400.0)
+                    for name, reason in failures.items()
+                ],
+            )
+
+    def get_ephemeris(
+        self, body: str, site: str, step: int, first: int, last: int
+    ) -> dict:
+        """
+        :param body: JPL code of the body.
+        :param site: Latitude, longitude and elevation of the site.
+        :param step: Minutes between the rows.
+        :param first: Unix minute of the first row.
+        :param last: Unix minute of the last row.
+        :return: Dictionary of the unix minutes to the stored rows between them.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT epoch, row FROM ephemeris WHERE body = ? AND site = ? AND "
+                + "step = ? AND epoch BETWEEN ? AND ? AND expires > ?",
+                (body, site, step, first, last, time.time()),
+            ).fetchall()
+        return {epoch: json.loads(row) for epoch, row in rows}
+
+    def put_ephemeris(self, body: str, site: str, step: int, rows: dict) -> None:
+        """
+        Write ephemeris rows, which expire after Const.CACHE_TTL_DAYS so
+        refined orbits are picked up.
+
+        :param body: JPL code of the body.
+        :param site: Latitude, longitude and elevation of the site.
+        :param step: Minutes between the rows.
+        :param rows: Dictionary of the unix minutes to the rows.
+        """
+        now = time.time()
+        expires = now + Const.CACHE_TTL_DAYS * 86400.0
+        with self.batch():
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO ephemeris (body, site, step, epoch, row, "
+                + "updated, expires) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (body, site, step, epoch, json.dumps(row), now, expires)
+                    for epoch, row in rows.items()
+                ],
+            )
+
+    def delete(self, names: list) -> None:
+        """
+        :param names: Names of the objects to remove.
+        """
+        with self.batch():
+            self._connection.executemany(
+                "DELETE FROM objects WHERE name = ?", [(name,) for name in names]
+            )
+
+    def evict(self, window_key=None) -> int:
+        """
+        Remove the expired objects, failures and ephemeris rows, the
+        ephemeris data of other sites and windows and the least recently
+        used objects beyond the size cap.
+
+        :param window_key: Site and window of the run.
+        :return: Number of objects evicted.
+        """
+        with self.batch():
+            evicted = self._connection.execute(
+                "DELETE FROM objects WHERE expires <= ? "
+                + "OR (window_key IS NOT NULL AND window_key IS NOT ?)",
+                (time.time(), window_key),
+            ).rowcount
+            self.evictions += evicted
+            evicted += self._evict_least_recent()
+            for table in ("failures", "ephemeris"):
+                self._connection.execute(
+                    f"DELETE FROM {table} WHERE expires <= ?", (time.time(),)
+                )
+        return evicted
+
+    def log_stats(self) -> None:
+        """
+        Log the hits, misses and evictions of the run.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            ratio = self.hits / lookups * 100 if lookups > 0 else 0.0
+            Logger.log(
+                f"Cache: {self.hits} hits, {self.misses} misses ({ratio:.0f}% hit "
+                + f"rate), {self.evictions} evictions, {len(self)} objects."
+            )
+
+    def _touch(self, names: list) -> None:
+        """
+        Mark objects as used now for the least recently used eviction.
+        """
+        self._connection.executemany(
+            "UPDATE objects SET accessed = ? WHERE name = ?",
+            [(time.time(), name) for name in names],
+        )
+
+    def _evict_least_recent(self) -> int:
+        """
+        :return: Number of objects evicted beyond Const.CACHE_MAX_OBJECTS.
+        """
+        excess = len(self) - Const.CACHE_MAX_OBJECTS
+        if excess <= 0:
+            return 0
+        evicted = self._connection.execute(
+            "DELETE FROM objects WHERE name IN "
+            + "(SELECT name FROM objects ORDER BY accessed LIMIT ?)",
+            (excess,),
+        ).rowcount
+        self.evictions += evicted
+        return evicted
+
+    def names(self) -> list:
+        """
+        :return: List of the names of the cached objects.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT name FROM objects ORDER BY name"
+            ).fetchall()
+        return [name for name, in rows]
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM objects WHERE name = ?", (name,)
+            ).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM objects").fetchone()[
+                0
+            ]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+def _create_objects(cache: Cache) -> None:
+    """
+    Create the table of the objects and import the legacy JSON cache file.
+    """
+    cache._connection.execute(
+        "CREATE TABLE IF NOT EXISTS objects ("
+        + "name TEXT PRIMARY KEY, record TEXT NOT NULL, updated REAL NOT NULL)"
+    )
+    legacy_path = Path(cache.path.parent, "cache")
+    if not legacy_path.is_file():
+        return
+    Logger.log(f"Importing the legacy cache file `{legacy_path}`...")
+    try:
+        with open(legacy_path, "r") as legacy_file:
+            legacy = json.loads(legacy_file.read())
+    except (OSError, ValueError) as e:
+        Logger.log("Unable to read the legacy cache file, it is ignored.", 30)
+        Logger.log(str(e), 30)
+        legacy = dict()
+    now = time.time()
+    cache._connection.executemany(
+        "INSERT OR REPLACE INTO objects (name, record, updated) VALUES (?, ?, ?)",
+        [
+            (name, json.dumps(record, sort_keys=True), now)
+            for name, record in legacy.items()
+            if isinstance(record, dict)
+        ],
+    )
+    os.replace(legacy_path, Path(cache.path.parent, "cache.legacy.json"))
+    Logger.log(f"Imported {len(legacy)} objects from the legacy cache file!")
+
+
+def _add_expiry(cache: Cache) -> None:
+    """
+    Add the expiry, last access and ephemeris window of the objects.
+    The existing objects count as static data written at their update time.
+    """
+    for column in ("expires REAL", "accessed REAL", "window_key TEXT"):
+        cache._connection.execute(f"ALTER TABLE objects ADD COLUMN {column}")
+    cache._connection.execute(
+        "UPDATE objects SET expires = updated + ?, accessed = updated",
+        (Const.CACHE_TTL_DAYS * 86400.0,),
+    )
+    # Planets were cached like static data, drop them to be queried again
+    cache._connection.execute(
+        "DELETE FROM objects WHERE lower(json_extract(record, '$.Type')) = 'planet'"
+    )
+    cache._connection.execute(
+        "CREATE INDEX IF NOT EXISTS objects_accessed ON objects (accessed)"
+    )
+
+
+def _add_failures(cache: Cache) -> None:
+    """
+    Create the table of the names the services could not resolve.
+    """
+    cache._connection.execute(
+        "CREATE TABLE IF NOT EXISTS failures (source TEXT NOT NULL, "
+        + "name TEXT NOT NULL, reason TEXT NOT NULL, updated REAL NOT NULL, "
+        + "expires REAL NOT NULL, PRIMARY KEY (source, name))"
+    )
+
+
+def _add_ephemeris(cache: Cache) -> None:
+    """
+    Create the table of the JPL Horizons ephemeris rows.
+    """
+    cache._connection.execute(
+        "CREATE TABLE IF NOT EXISTS ephemeris (body TEXT NOT NULL, "
+        + "site TEXT NOT NULL, step INTEGER NOT NULL, epoch INTEGER NOT NULL, "
+        + "row TEXT NOT NULL, updated REAL NOT NULL, expires REAL NOT NULL, "
+        + "PRIMARY KEY (body, site, step, epoch))"
+    )
+
+
+# Migration from every schema version to the next one, in order
+MIGRATIONS = (_create_objects, _add_expiry, _add_failures, _add_ephemeris)
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_cache() -> Cache:
+    """
+    Return the cache of the application, opening it on the first call.
+
+    :return: The Cache shared by the whole process.
+    """
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = Cache(Path(Const.ROOT_DIR, "data", "cache.sqlite3"))
+        return _CACHE
@@ -0,0 +1,560 @@
+"""This module compiles the JSON data files into memory-mappable NumPy files.
+
+Catalogues become a structured array of their numeric columns and of indices
+into a string table, and key to value maps such as ``jplcodes.json`` become a
+structured array sorted by key. The compiled files are kept in
+``data/compiled``, each with a manifest holding the modification time, size
+and SHA-256 of its source so it is rebuilt whenever the source changes.
+
+Large star catalogues (CSV or FITS files with a name, right ascension,
+declination and V magnitude column) are streamed in chunks into a structured
+array sorted by V magnitude, with the names kept as one UTF-8 buffer, so the
+magnitude cut is a binary search over the memory-mapped columns.
+
+Invoke as `python -m pysky.catalog_compile' to compile every data file.
+"""
+import csv
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from pathlib import Path
+
+import numpy as np
+from astropy.io import fits
+
+from .const import Const
+from .logger import Logger
+
+# Bump when the layout or the contents of the compiled files change
+FORMAT_VERSION = 2
+
+# Numeric columns of a catalogue, any other non-coordinate field is a string
+NUMERIC_FIELDS = ("Brightness", "Distance")
+
+# Suffixes of the large catalogue files
+LARGE_CATALOG_SUFFIXES = (".csv", ".fits", ".fit", ".fts")
+
+# Accepted column names of the large catalogues, compared in lowercase
+COLUMN_ALIASES = {
+    "name": ("name", "id", "main_id", "designation", "hip", "hr", "hd"),
+    "ra": ("ra", "raj2000", "_raj2000", "ra_deg", "radeg", "ra_icrs"),
+    "dec": ("dec", "de", "dej2000", "_dej2000", "dec_deg", "dedeg", "de_icrs"),
+    "vmag": ("vmag", "v", "v_mag", "mag", "magnitude", "brightness"),
+}
+
+SEXAGESIMAL_SEPARATORS = re.compile(r"[\s:hdms°'\"]+")
+
+# Rows read from a large catalogue before they are written out
+CHUNK_ROWS = 65536
+
+LARGE_CATALOG_DTYPE = [
+    ("ra", "<f8"),
+    ("dec", "<f8"),
+    ("vmag", "<f8"),
+    # End of the name in the name buffer, it starts where the previous one ends
+    ("name_end", "<i8"),
+]
+
+_COMPILE_LOCK = threading.Lock()
+
+
+def load_compiled(source) -> tuple:
+    """
+    Memory-map the compiled form of a data file, compiling it when needed.
+
+    :param source: Path of the JSON data file.
+    :return: Tuple of the memory-mapped structured array and string table.
+             The string table is None for key to value maps.
+    """
+    source = Path(source)
+    with _COMPILE_LOCK:
+        if not is_current(source):
+            compile_file(source)
+    table, strings = _compiled_paths(source)
+    if strings.is_file():
+        return np.load(table, mmap_mode="r"), np.load(strings, mmap_mode="r")
+    return np.load(table, mmap_mode="r"), None
+
+
+def is_current(source: Path) -> bool:
+    """
+    Check if the compiled form of a data file matches its source.
+
+    The modification time and size are checked first and the SHA-256 only
+    when they differ, so touching an unchanged file does not cause a rebuild.
+
+    :param source: Path of the JSON data file.
+    :return: True if the compiled form can be used.
+    """
+    manifest_path = _manifest_path(source)
+    table, _ = _compiled_paths(source)
+    try:
+        with open(manifest_path, "r") as manifest_file:
+            manifest = json.loads(manifest_file.read())
+    except (OSError, ValueError):
+        return False
+    if manifest.get("version") != FORMAT_VERSION or not table.is_file():
+        return False
+
+    stat = os.stat(source)
+    if (
+        manifest.get("mtime_ns") == stat.st_mtime_ns
+        and manifest.get("size") == stat.st_size
+    ):
+        return True
+    if manifest.get("sha256") != _sha256(source):
+        return False
+
+    # Same content with a new modification time
+    manifest["mtime_ns"] = stat.st_mtime_ns
+    manifest["size"] = stat.st_size
+    _write_json(manifest_path, manifest)
+    return True
+
+
+def compile_file(source: Path) -> None:
+    """
+    Compile a catalogue or key to value map JSON file, or a large CSV or
+    FITS catalogue.
+
+    :param source: Path of the data file.
+    """
+    Logger.log(f"Compiling `{source.name}`...")
+    stat = os.stat(source)
+    os.makedirs(_compiled_dir(source), exist_ok=True)
+    table_path, strings_path = _compiled_paths(source)
+    if source.suffix.lower() in LARGE_CATALOG_SUFFIXES:
+        rows = _compile_large_catalog(source, table_path, strings_path)
+    else:
+        with open(source, "r") as source_file:
+            data = json.loads(source_file.read())
+        if all(isinstance(value, str) for value in data.values()):
+            table, strings = _compile_map(data), None
+        else:
+            table, strings = _compile_catalog(data)
+
+        _save_npy(table_path, table)
+        if strings is not None:
+            _save_npy(strings_path, strings)
+        elif strings_path.is_file():
+            os.remove(strings_path)
+        rows = len(table)
+    _write_json(
+        _manifest_path(source),
+        {
+            "version": FORMAT_VERSION,
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": _sha256(source),
+        },
+    )
+    Logger.log(f"Compiled `{source.name}` with {rows} rows!")
+
+
+def compile_all(root_dir: str) -> None:
+    """
+    Compile every JSON data file that is out of date.
+
+    :param root_dir: Root directory of this application
+    """
+    for source in sorted(Path(root_dir, "data").glob("*.json")):
+        with _COMPILE_LOCK:
+            if not is_current(source):
+                compile_file(source)
+
+
+def _compile_catalog(data: dict) -> tuple:
+    """
+    :param data: Parsed catalogue, object name to its fields.
+    :return: Tuple of the structured array and the string table.
+    """
+    string_fields = ["Name"]
+    for entry in data.values():
+        for field, value in entry.items():
+            if (
+                field not in NUMERIC_FIELDS
+                and field != "Coordinates"
+                and field not in string_fields
+            ):
+                string_fields.append(field)
+
+    strings = dict()
+    dtype = [("ra", "<f8"), ("dec", "<f8"), ("Brightness", "<f8"), ("Distance", "<f8")]
+    dtype.extend((field, "<i4") for field in string_fields)
+    table = np.zeros(len(data), dtype=dtype)
+    for row, (name, entry) in enumerate(data.items()):
+        table["ra"][row] = sexagesimal_to_degrees(
+            entry["Coordinates"]["ra"], hours=True
+        )
+        table["dec"][row] = sexagesimal_to_degrees(
+            entry["Coordinates"]["dec"], hours=False
+        )
+        for field in NUMERIC_FIELDS:
+            try:
+                table[field][row] = float(entry[field])
+            except (KeyError, TypeError, ValueError):
+                table[field][row] = np.nan
+        for field in string_fields:
+            value = name if field == "Name" else entry.get(field)
+            # Missing fields are -1
+            table[field][row] = (
+                -1 if value is None else strings.setdefault(value, len(strings))
+            )
+    return table, np.array(list(strings.keys()), dtype=str)
+
+
+def _compile_map(data: dict) -> np.ndarray:
+    """
+    :param data: Parsed map of string keys to string values.
+    :return: Structured array of the keys and values sorted by key.
+    """
+    keys = np.array(list(data.keys()), dtype=str)
+    values = np.array(list(data.values()), dtype=str)
+    table = np.zeros(len(data), dtype=[("key", keys.dtype), ("value", values.dtype)])
+    table["key"] = keys
+    table["value"] = values
+    return np.sort(table, order="key")
+
+
+def _compile_large_catalog(source: Path, table_path: Path, names_path: Path) -> int:
+    """
+    Stream a large catalogue into its compiled form sorted by V magnitude.
+
+    The rows are first appended chunk by chunk to temporary files in the
+    order they are read, then copied in magnitude order into the memory-mapped
+    outputs, so neither the text nor the columns are ever held in memory.
+
+    :param source: Path of the CSV or FITS catalogue.
+    :param table_path: Path of the compiled table.
+    :param names_path: Path of the compiled name buffer.
+    :return: Number of rows compiled.
+    """
+    temp_prefix = f"{table_path}.{os.getpid()}"
+    columns_temp = Path(f"{temp_prefix}.columns.tmp")
+    ends_temp = Path(f"{temp_prefix}.ends.tmp")
+    names_temp = Path(f"{temp_prefix}.names.tmp")
+    if source.suffix.lower() == ".csv":
+        chunks = _read_csv_chunks(source)
+    else:
+        chunks = _read_fits_chunks(source)
+
+    rows = 0
+    name_bytes = 0
+    skipped = 0
+    try:
+        with open(columns_temp, "wb") as columns_out, open(
+            ends_temp, "wb"
+        ) as ends_out, open(names_temp, "wb") as names_out:
+            for names, ra, dec, vmag in chunks:
+                # Rows without usable coordinates cannot be checked
+                valid = np.isfinite(ra) & np.isfinite(dec)
+                skipped += int(np.count_nonzero(~valid))
+                encoded = [
+                    name.encode("utf-8")
+                    for name, keep in zip(names, valid.tolist())
+                    if keep
+                ]
+                columns = np.zeros(len(encoded), dtype=LARGE_CATALOG_DTYPE[:3])
+                columns["ra"] = ra[valid]
+                columns["dec"] = dec[valid]
+                columns["vmag"] = vmag[valid]
+                ends = name_bytes + np.cumsum(
+                    [len(name) for name in encoded], dtype="<i8"
+                )
+                columns_out.write(columns.tobytes())
+                ends_out.write(ends.tobytes())
+                names_out.write(b"".join(encoded))
+                rows += len(encoded)
+                if len(ends) > 0:
+                    name_bytes = int(ends[-1])
+        if skipped > 0:
+            Logger.log(
+                f"Skipped {skipped} rows of `{source.name}` without coordinates.", 30
+            )
+        _sort_large_catalog(
+            columns_temp, ends_temp, names_temp, rows, table_path, names_path
+        )
+    finally:
+        for temp_path in (columns_temp, ends_temp, names_temp):
+            if temp_path.is_file():
+                os.remove(temp_path)
+    return rows
+
+
+def _sort_large_catalog(
+    columns_temp: Path,
+    ends_temp: Path,
+    names_temp: Path,
+    rows: int,
+    table_path: Path,
+    names_path: Path,
+) -> None:
+    """
+    Copy the streamed rows into the compiled files in V magnitude order.
+
+    Unknown magnitudes are NaN and sort last.
+    """
+    table_temp = Path(f"{table_path}.{os.getpid()}.tmp")
+    names_out_temp = Path(f"{names_path}.{os.getpid()}.tmp")
+    if rows == 0:
+        _save_npy(table_path, np.zeros(0, dtype=LARGE_CATALOG_DTYPE))
+        _save_npy(names_path, np.zeros(0, dtype=np.uint8))
+        return
+
+    columns = np.memmap(columns_temp, dtype=LARGE_CATALOG_DTYPE[:3], mode="r")
+    ends = np.memmap(ends_temp, dtype="<i8", mode="r")
+    names = np.memmap(names_temp, dtype=np.uint8, mode="r") if ends[-1] > 0 else None
+    starts = np.concatenate(([0], ends[:-1]))
+    order = np.argsort(columns["vmag"], kind="stable")
+    lengths = (ends - starts)[order]
+    sorted_ends = np.cumsum(lengths)
+
+    table = np.lib.format.open_memmap(
+        table_temp, mode="w+", dtype=LARGE_CATALOG_DTYPE, shape=(rows,)
+    )
+    names_out = np.lib.format.open_memmap(
+        names_out_temp, mode="w+", dtype=np.uint8, shape=(int(sorted_ends[-1]),)
+    )
+    for first in range(0, rows, CHUNK_ROWS):
+        last = min(first + CHUNK_ROWS, rows)
+        chunk = order[first:last]
+        for field in ("ra", "dec", "vmag"):
+            table[field][first:last] = columns[field][chunk]
+        table["name_end"][first:last] = sorted_ends[first:last]
+
+        # Gather the bytes of every name of the chunk at once
+        out_start = int(sorted_ends[first - 1]) if first > 0 else 0
+        out_end = int(sorted_ends[last - 1])
+        if out_end > out_start:
+            chunk_starts = sorted_ends[first:last] - lengths[first:last]
+            offsets = np.repeat(starts[chunk] - chunk_starts, lengths[first:last])
+            names_out[out_start:out_end] = names[
+                offsets + np.arange(out_start, out_end)
+            ]
+    table.flush()
+    names_out.flush()
+    del table, names_out, columns, ends, names
+    os.replace(table_temp, table_path)
+    os.replace(names_out_temp, names_path)
+
+
+def _read_csv_chunks(source: Path):
+    """
+    Read a CSV catalogue with a header row in chunks of CHUNK_ROWS rows.
+
+    :param source: Path of the CSV file.
+    :return: Generator of tuples of the names and the arrays of the right
+             ascensions, declinations and V magnitudes.
+    """
+    with open(source, "r", newline="") as csv_file:
+        reader = csv.reader(csv_file)
+        header = next(reader, None)
+        if header is None:
+            return
+        columns = _find_columns([field.strip() for field in header], source)
+        chunk = list()
+        for line in reader:
+            if len(line) == 0:
+                continue
+            chunk.append(line)
+            if len(chunk) == CHUNK_ROWS:
+                yield _parse_rows(chunk, columns)
+                chunk = list()
+        if len(chunk) > 0:
+            yield _parse_rows(chunk, columns)
+
+
+def _read_fits_chunks(source: Path):
+    """
+    Read the first table of a FITS catalogue in chunks of CHUNK_ROWS rows.
+
+    :param source: Path of the FITS file.
+    :return: Generator of tuples of the names and the arrays of the right
+             ascensions, declinations and V magnitudes.
+    """
+    with fits.open(source, memmap=True) as hdu_list:
+        hdu = next((hdu for hdu in hdu_list if isinstance(hdu, fits.BinTableHDU)), None)
+        if hdu is None:
+            hdu = next(
+                (hdu for hdu in hdu_list if isinstance(hdu, fits.TableHDU)), None
+            )
+        if hdu is None:
+            raise ValueError(f"`{source.name}` has no table.")
+        names, ra, dec, vmag = _find_columns(hdu.columns.names, source)
+        for first in range(0, hdu.data.shape[0], CHUNK_ROWS):
+            chunk = hdu.data[first : first + CHUNK_ROWS]
+            yield (
+                [str(name).strip() for name in chunk.field(names)],
+                _to_degrees(chunk.field(ra), hours=True),
+                _to_degrees(chunk.field(dec), hours=False),
+                _to_magnitudes(chunk.field(vmag)),
+            )
+
+
+def _find_columns(header: list, source: Path) -> tuple:
+    """
+    :param header: Column names of the catalogue.
+    :param source: Path of the catalogue, for the error message.
+    :return: Tuple of the indices of the name, right ascension, declination
+             and V magnitude columns.
+    """
+    lowered = [str(column).lower() for column in header]
+    found = list()
+    for column, aliases in COLUMN_ALIASES.items():
+        match = next((alias for alias in aliases if alias in lowered), None)
+        if match is None:
+            raise ValueError(
+                f"`{source.name}` has no {column} column, expected one of "
+                + ", ".join(aliases)
+            )
+        found.append(lowered.index(match))
+    return tuple(found)
+
+
+def _parse_rows(chunk: list, columns: tuple) -> tuple:
+    """
+    :param chunk: Rows of a CSV catalogue as lists of strings.
+    :param columns: Indices of the name, right ascension, declination
+                    and V magnitude columns.
+    :return: Tuple of the names and the arrays of the right ascensions,
+             declinations and V magnitudes.
+    """
+    names, ra, dec, vmag = columns
+    width = max(columns) + 1
+    chunk = [line + [""] * (width - len(line)) for line in chunk]
+    return (
+        [line[names].strip() for line in chunk],
+        _to_degrees([line[ra] for line in chunk], hours=True),
+        _to_degrees([line[dec] for line in chunk], hours=False),
+        _to_magnitudes([line[vmag] for line in chunk]),
+    )
+
+
+def _to_degrees(values, hours: bool) -> np.ndarray:
+    """
+    Convert catalogue angles to degrees.
+
+    Plain numbers are taken as degrees. Sexagesimal values such as
+    `05 34 31.9' or `-22:01:03' are hours for the right ascension and
+    degrees for the declination.
+
+    :param values: Numbers or strings of the angles.
+    :param hours: True for right ascensions.
+    :return: Array of the angles in degrees, NaN where unreadable.
+    """
+    values = np.asarray(values)
+    try:
+        return values.astype(float)
+    except ValueError:
+        pass
+    angles = np.full(len(values), np.nan)
+    for row, value in enumerate(values.tolist()):
+        if isinstance(value, bytes):
+            value = value.decode("ascii", "replace")
+        parts = [part for part in SEXAGESIMAL_SEPARATORS.split(str(value)) if part]
+        # Blank cells stay NaN and their rows are dropped
+        if len(parts) == 0:
+            continue
+        try:
+            if len(parts) == 1:
+                angles[row] = float(parts[0])
+                continue
+            sign = -1.0 if parts[0].startswith("-") else 1.0
+            angle = abs(float(parts[0])) + sum(
+                float(part) / 60 ** (power + 1) for power, part in enumerate(parts[1:])
+            )
+        except ValueError:
+            continue
+        angles[row] = sign * angle * (15.0 if hours else 1.0)
+    return angles
+
+
+def sexagesimal_to_degrees(parts: list, hours: bool) -> float:
+    """
+    Convert a sexagesimal angle to degrees, its sign applying to the whole
+    angle so `[-26, 31, 32]' is -26.53 degrees.
+
+    :param parts: Degrees or hours, minutes and seconds.
+    :param hours: True for right ascensions.
+    :return: The angle in degrees.
+    """
+    sign = -1.0 if any(math.copysign(1.0, part) < 0 for part in parts) else 1.0
+    angle = sum(abs(part) / 60**power for power, part in enumerate(parts))
+    return sign * angle * (15.0 if hours else 1.0)
+
+
+def _to_magnitudes(values) -> np.ndarray:
+    """
+    :param values: Numbers or strings of the V magnitudes.
+    :return: Array of the magnitudes, NaN where unknown.
+    """
+    values = np.asarray(values)
+    try:
+        return values.astype(float)
+    except ValueError:
+        pass
+    magnitudes = np.full(len(values), np.nan)
+    for row, value in enumerate(values.tolist()):
+        if isinstance(value, bytes):
+            value = value.decode("ascii", "replace")
+        try:
+            magnitudes[row] = float(value)
+        except ValueError:
+            continue
+    return magnitudes
+
+
+def _compiled_dir(source: Path) -> Path:
+    return Path(Const.ROOT_DIR, "data", "compiled")
+
+
+def _compiled_stem(source: Path) -> str:
+    """
+    Files of the data directory keep their name, any other file gets a hash
+    of its path so catalogues with the same name do not collide.
+    """
+    source = Path(source).resolve()
+    if source.parent == Path(Const.ROOT_DIR, "data").resolve():
+        return source.stem
+    return f"{source.stem}-{hashlib.sha256(str(source).encode()).hexdigest()[:12]}"
+
+
+def _compiled_paths(source: Path) -> tuple:
+    directory = _compiled_dir(source)
+    stem = _compiled_stem(source)
+    return Path(directory, f"{stem}.npy"), Path(directory, f"{stem}.strings.npy")
+
+
+def _manifest_path(source: Path) -> Path:
+    return Path(_compiled_dir(source), f"{_compiled_stem(source)}.manifest.json")
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as data_file:
+        for chunk in iter(lambda: data_file.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _save_npy(path: Path, array: np.ndarray) -> None:
+    """Write the array next to its destination and move it in place."""
+    temp_path = Path(f"{path}.{os.getpid()}.tmp")
+    with open(temp_path, "wb") as npy_out:
+        np.save(npy_out, array, allow_pickle=False)
+    os.replace(temp_path, path)
+
+
+def _write_json(path: Path, data: dict) -> None:
+    """Write the JSON next to its destination and move it in place."""
+    temp_path = Path(f"{path}.{os.getpid()}.tmp")
+    with open(temp_path, "w") as json_out:
+        json.dump(data, json_out, indent=4)
+    os.replace(temp_path, path)
+
+
+if __name__ == "__main__":
+    compile_all(Const.ROOT_DIR)
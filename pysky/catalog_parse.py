@@ -1,10 +1,214 @@
 """This module parses the MessierCatalog.json and CaldwellCatalog.json and return them as dictionaries"""
-import json
 import os
+import threading
 from pathlib import Path
+
+import numpy as np
+
+from .catalog_compile import load_compiled
 from .const import Const
 
 
+class CatalogRegistry(object):
+    """
+    Catalogue loaded once and kept in memory with its columns as NumPy arrays.
+
+    The columns are memory-mapped from the compiled form of the catalogue,
+    which is rebuilt whenever the JSON file changes.
+
+    Calling sequence:
+        messier = CatalogRegistry(Path(Const.ROOT_DIR, "data", "MessierCatalogue.json"))
+        messier.ra[messier.index["M31"]]
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Path of the catalogue JSON file.
+        """
+        table, strings = load_compiled(path)
+        self.names = strings[table["Name"]]
+        self.index = {name: row for row, name in enumerate(self.names.tolist())}
+        self.ra = table["ra"]
+        self.dec = table["dec"]
+        # Magnitudes and distances given as text are NaN
+        self.magnitude = table["Brightness"]
+        self.distance = table["Distance"]
+        self.type = strings[table["Type"]]
+        self._table = table
+        self._strings = strings
+        self._entries = None
+
+    @property
+    def entries(self) -> dict:
+        """
+        Catalogue as the dictionary of the JSON file, built on first access.
+        """
+        if self._entries is None:
+            string_fields = [
+                field
+                for field in self._table.dtype.names
+                if self._table.dtype[field].kind == "i" and field != "Name"
+            ]
+            entries = dict()
+            for row, name in enumerate(self.names.tolist()):
+                entry = {
+                    field: str(self._strings[self._table[field][row]])
+                    for field in string_fields
+                    if self._table[field][row] >= 0
+                }
+                entry["Brightness"] = _to_value(self.magnitude[row])
+                entry["Distance"] = _to_value(self.distance[row])
+                entry["Coordinates"] = {
+                    "ra": float(self.ra[row]),
+                    "dec": float(self.dec[row]),
+                }
+                entries[name] = entry
+            self._entries = entries
+        return self._entries
+
+    def __contains__(self, celestial_obj) -> bool:
+        return celestial_obj in self.index
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+class CompiledMap(object):
+    """
+    Read-only string to string map memory-mapped from a compiled JSON file.
+
+    Calling sequence:
+        jplcodes = CompiledMap(Path(Const.ROOT_DIR, "data", "jplcodes.json"))
+        jplcodes["venus"]
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Path of the JSON map file.
+        """
+        table, _ = load_compiled(path)
+        self._keys = table["key"]
+        self._values = table["value"]
+
+    def __getitem__(self, key: str) -> str:
+        row = int(np.searchsorted(self._keys, key))
+        if row < len(self._keys) and self._keys[row] == key:
+            return str(self._values[row])
+        raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class LargeCatalog(object):
+    """
+    Large CSV or FITS star catalogue memory-mapped from its compiled form,
+    with the rows sorted by V magnitude.
+
+    Calling sequence:
+        catalog = LargeCatalog(Path("hipparcos.csv"))
+        bright = catalog.bright_count(Const.MIN_V)
+        catalog.ra[:bright], catalog.dec[:bright], catalog.get_names(bright)
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Path of the catalogue file.
+        """
+        table, names = load_compiled(path)
+        self.name = Path(path).stem
+        self.ra = table["ra"]
+        self.dec = table["dec"]
+        # Unknown magnitudes are NaN and sorted last
+        self.magnitude = table["vmag"]
+        self._name_ends = table["name_end"]
+        self._names = names
+
+    def bright_count(self, min_v: float) -> int:
+        """
+        Count the objects at least as bright as a magnitude, which are the
+        first rows since the catalogue is sorted.
+
+        :param min_v: Faintest V magnitude to count.
+        :return: Number of the objects.
+        """
+        return int(np.searchsorted(self.magnitude, min_v, side="right"))
+
+    def get_names(self, stop: int) -> list:
+        """
+        Decode the names of the first rows.
+
+        :param stop: Number of rows to decode.
+        :return: List of the names.
+        """
+        if stop == 0:
+            return list()
+        ends = self._name_ends[:stop]
+        buffer = bytes(self._names[: int(ends[-1])])
+        starts = np.concatenate(([0], ends[:-1])).tolist()
+        return [
+            buffer[start:end].decode("utf-8")
+            for start, end in zip(starts, ends.tolist())
+        ]
+
+    def __len__(self) -> int:
+        return len(self.magnitude)
+
+
+_REGISTRIES = dict()
+_REGISTRIES_LOCK = threading.Lock()
+
+
+def get_registry(root_dir: str, filename: str) -> CatalogRegistry:
+    """
+    Return the registry of a catalogue, loading it on the first call.
+
+    :param root_dir: Root directory of this application
+    :param filename: Name of the catalogue file in the data directory.
+    :return: The CatalogRegistry shared by the whole process.
+    """
+    return _get_shared(CatalogRegistry, root_dir, filename)
+
+
+def get_map(root_dir: str, filename: str) -> CompiledMap:
+    """
+    Return a key to value data file such as `jplcodes.json`, loading it on the first call.
+
+    :param root_dir: Root directory of this application
+    :param filename: Name of the map file in the data directory.
+    :return: The CompiledMap shared by the whole process.
+    """
+    return _get_shared(CompiledMap, root_dir, filename)
+
+
+def get_large_catalog(path: str) -> LargeCatalog:
+    """
+    Return a large CSV or FITS catalogue, compiling it if it changed.
+
+    :param path: Path of the catalogue file.
+    :return: The LargeCatalog shared by the whole process.
+    """
+    return _get_shared(LargeCatalog, path=Path(path).expanduser().resolve())
+
+
+def _get_shared(cls, root_dir=None, filename=None, path=None):
+    if path is None:
+        if not isinstance(root_dir, str):
+            root_dir = Path(os.path.dirname(os.path.realpath(__file__)))
+        path = Path(root_dir, "data", filename)
+    with _REGISTRIES_LOCK:
+        if path not in _REGISTRIES:
+            _REGISTRIES[path] = cls(path)
+        return _REGISTRIES[path]
+
+
 def parse_messier(root_dir: str) -> dict:
     """
     This function parses VisibleMessierCatalog.json and returns the json object as dictionary
@@ -12,11 +216,7 @@ def parse_messier(root_dir: str) -> dict:
     :param root_dir: Root directory of this application
     :return: A Python dictionary of the MessierCatalogue.json
     """
-    if not isinstance(root_dir, str):
-        root_dir = Path(os.path.dirname(os.path.realpath(__file__)))
-    messier_path = Path(root_dir, "data", "MessierCatalogue.json")
-    messier_file = json.loads(open(messier_path, "r").read())
-    return messier_file
+    return get_registry(root_dir, "MessierCatalogue.json").entries
 
 
 def check_messier(celestial_obj):
@@ -25,10 +225,7 @@ def check_messier(celestial_obj):
     :param celestial_obj: Object to check in the messier catalog.
     :return: The object if it exists
     """
-    messier_catalog = parse_messier(Const.ROOT_DIR)
-    if celestial_obj in messier_catalog:
-        return True
-    return False
+    return celestial_obj in get_registry(Const.ROOT_DIR, "MessierCatalogue.json")
 
 
 def parse_caldwell(root_dir: str) -> dict:
@@ -38,11 +235,7 @@ def parse_caldwell(root_dir: str) -> dict:
     :param root_dir: Root directory of this application
     :return: A Python dictionary of the CaldwellCatalogue.json
     """
-    if not isinstance(root_dir, str):
-        root_dir = Path(os.path.dirname(os.path.realpath((__file__))))
-    caldwell_path = Path(root_dir, "data", "CaldwellCatalogue.json")
-    caldwell_file = json.loads(open(caldwell_path, "r").read())
-    return caldwell_file
+    return get_registry(root_dir, "CaldwellCatalogue.json").entries
 
 
 def check_caldwell(celestial_obj):
@@ -51,7 +244,15 @@ def check_caldwell(celestial_obj):
     :param celestial_obj: Object to check in the caldwell catalouge.
     :return: The object if it exists
     """
-    caldwell_catalog = parse_caldwell(Const.ROOT_DIR)
-    if celestial_obj in caldwell_catalog:
-        return True
-    return False
+    return celestial_obj in get_registry(Const.ROOT_DIR, "CaldwellCatalogue.json")
+
+
+def _to_value(value: float):
+    """
+    Convert a compiled numeric column value back to its catalogue value.
+    :param value: Value to convert.
+    :return: The float, or "-" if the value is NaN.
+    """
+    if np.isnan(value):
+        return "-"
+    return float(value)
@@ -1,79 +1,270 @@
 """This module is used to see if an object is visible."""
 import astropy.units as u
-from astroplan import Observer
-from astropy.coordinates import EarthLocation
-from astropy.time import Time
+import numpy as np
+from astropy.coordinates import SkyCoord
 
+from . import analytic_altaz
 from .const import Const
 from .logger import Logger
 
+# Classes returned by classify_declinations
+NEVER_VISIBLE = 0
+NEEDS_CHECK = 1
+ALWAYS_VISIBLE = 2
 
-def is_object_visible(celestial_obj: object, secz_max: float) -> tuple:
+# Degrees of slack for precession, nutation and aberration which the
+# declination classes do not account for
+DECLINATION_MARGIN = 1.0
+
+
+def classify_declinations(
+    dec: np.ndarray, latitude: float, secz_max: float
+) -> np.ndarray:
+    """
+    Classify objects by the altitudes their declination allows at a latitude.
+
+    An object culminates at 90 - |latitude - dec| degrees and reaches its
+    lowest altitude at |latitude + dec| - 90 degrees, so objects whose upper
+    culmination is below the sec(z) limit never become visible and objects
+    whose lower culmination is above it never stop being visible.
+
+    :param dec: Array of declinations in degrees.
+    :param latitude: Latitude of the location in degrees.
+    :param secz_max: Maximum viewing angle.
+    :return: Array of NEVER_VISIBLE, NEEDS_CHECK or ALWAYS_VISIBLE per object.
+    """
+    dec = np.asarray(dec, dtype=float)
+    min_alt = np.degrees(np.arcsin(1.0 / secz_max))
+    classes = np.full(dec.shape, NEEDS_CHECK)
+    classes[90.0 - np.abs(latitude - dec) < min_alt - DECLINATION_MARGIN] = (
+        NEVER_VISIBLE
+    )
+    classes[np.abs(latitude + dec) - 90.0 > min_alt + DECLINATION_MARGIN] = (
+        ALWAYS_VISIBLE
+    )
+    return classes
+
+
+def horizontal_coordinates(
+    ra: np.ndarray, dec: np.ndarray, times: object, frame: object, context: object
+) -> tuple:
+    """
+    Compute the altitudes and azimuths of every object at every time.
+
+    Uses the analytic engine when Const.ENGINE is "analytic" and the
+    astropy AltAz transform otherwise.
+
+    :param ra: Right ascensions in degrees.
+    :param dec: Declinations in degrees.
+    :param times: astropy Time array to compute the positions at.
+    :param frame: AltAz frame of the same times.
+    :param context: ObservingContext of the run.
+    :return: Tuple of the altitude and azimuth arrays in degrees of shape
+             (objects, times).
+    """
+    ra = np.asarray(ra, dtype=float).reshape((-1, 1))
+    dec = np.asarray(dec, dtype=float).reshape((-1, 1))
+    if Const.ENGINE == "analytic":
+        return analytic_altaz.altaz(
+            ra,
+            dec,
+            times.jd,
+            context.location.lat.degree,
+            context.location.lon.degree,
+        )
+    altaz = SkyCoord(ra=ra * u.deg, dec=dec * u.deg).transform_to(frame)
+    return altaz.alt.degree, altaz.az.degree
+
+
+def batch_visibility(
+    ra: np.ndarray, dec: np.ndarray, secz_max: float, context: object
+) -> dict:
+    """
+    Check which objects are visible in the set start and end times.
+
+    Every coordinate is transformed to AltAz for both times in a single
+    call, so the cost no longer scales with one transform per object.
+
+    :param ra: Right ascensions of the objects in degrees.
+    :param dec: Declinations of the objects in degrees.
+    :param secz_max: Maximum viewing angle.
+    :param context: ObservingContext of the run.
+    :return: Dictionary of alt, az and secz arrays in degrees of shape
+             (objects, 2) where column 0 is the start and column 1 the end
+             time, and the boolean "visible" array of the same shape.
+    """
+    Logger.log(f"Checking sec(z) for {np.size(ra)} objects.")
+    alt, az = horizontal_coordinates(ra, dec, context.times, context.frame, context)
+    if Const.ENGINE == "analytic" and Const.CHECK_ACCURACY:
+        analytic_altaz.accuracy_check(ra, dec, context)
+    with np.errstate(divide="ignore"):
+        secz = 1.0 / np.sin(np.radians(alt))
+    visible = (secz > 0) & (secz < secz_max)
+    Logger.log(f"Found {int(np.count_nonzero(visible.any(axis=1)))} visible objects.")
+    return {"alt": alt, "az": az, "secz": secz, "visible": visible}
+
+
+def is_object_visible(celestial_obj: object, secz_max: float, context: object) -> tuple:
     """
     Check if the object is visible in the set start and end times.
 
     :param celestial_obj: object to view (FixedTarget())
     :param secz_max: Maximum viewing angle.
+    :param context: ObservingContext of the run.
     :return: starting altitude, azimuth and ending altitude, azimuth.
     """
-    location = Observer(
-        location=EarthLocation.from_geodetic(
-            lon=(Const.LONGITUDE * u.deg), lat=(Const.LATITUDE * u.deg), height=(Const.ELEVATION * u.m)
-        ),
-        name="location",
-        timezone="UTC",
+    Logger.log(f"Checking sec(z) for {celestial_obj.name}.")
+    altaz = batch_visibility(
+        celestial_obj.coord.ra.degree, celestial_obj.coord.dec.degree, secz_max, context
     )
-    start_time = Time(
-        f"{Const.START_YEAR}-"
-        + f"{Const.START_MONTH}-"
-        + f"{Const.START_DAY} "
-        + f"{Const.START_TIME}",
-        format="iso",
+    start_alt, start_az, end_alt, end_az = "-", "-", "-", "-"
+    if altaz["visible"][0, 0]:
+        start_alt = altaz["alt"][0, 0]
+        start_az = altaz["az"][0, 0]
+    if altaz["visible"][0, 1]:
+        end_alt = altaz["alt"][0, 1]
+        end_az = altaz["az"][0, 1]
+    return start_alt, start_az, end_alt, end_az
+
+
+def visibility_timeline(
+    ra: np.ndarray, dec: np.ndarray, secz_max: float, context: object, tolerance=1.0
+) -> dict:
+    """
+    Find when every object is above the sec(z) limit during the whole window.
+
+    The altitudes of all objects are sampled over the time grid in one
+    transform. The sec(z) crossings and the transits found between samples
+    are then refined together by bisecting a cubic interpolation of the
+    samples, so the refinement needs no further transforms.
+
+    :param ra: Right ascensions of the objects in degrees.
+    :param dec: Declinations of the objects in degrees.
+    :param secz_max: Maximum viewing angle.
+    :param context: ObservingContext of the run.
+    :param tolerance: Precision of the refined times in seconds.
+    :return: Dictionary of the "rise", "set" and "transit" times as Julian
+             dates (NaN when they are not inside the window), the "max_alt"
+             in degrees and the boolean "visible" array, one item per object.
+    """
+    count = np.size(ra)
+    min_alt = np.degrees(np.arcsin(1.0 / secz_max))
+    grid_jd = context.time_grid.jd
+    Logger.log(f"Sampling the altitude of {count} objects at {len(grid_jd)} times.")
+    timeline = {
+        "rise": np.full(count, np.nan),
+        "set": np.full(count, np.nan),
+        "transit": np.full(count, np.nan),
+        "max_alt": np.full(count, np.nan),
+        "visible": np.zeros(count, dtype=bool),
+    }
+    if count == 0:
+        return timeline
+
+    alt, _ = horizontal_coordinates(
+        ra, dec, context.time_grid, context.grid_frame, context
     )
-    end_time = Time(
-        f"{Const.END_YEAR}-"
-        + f"{Const.END_MONTH}-"
-        + f"{Const.END_DAY} "
-        + f"{Const.END_TIME}",
-        format="iso",
+    above = alt > min_alt
+    slope = np.gradient(alt, axis=1)
+    step = (grid_jd[-1] - grid_jd[0]) / (len(grid_jd) - 1)
+    iterations = max(int(np.ceil(np.log2(step * 86400.0 / tolerance))), 1)
+
+    # First rising and last setting crossing between two samples
+    rising = ~above[:, :-1] & above[:, 1:]
+    setting = above[:, :-1] & ~above[:, 1:]
+    rise_rows = np.flatnonzero(rising.any(axis=1))
+    set_rows = np.flatnonzero(setting.any(axis=1))
+    if len(rise_rows) > 0:
+        first = np.argmax(rising[rise_rows], axis=1)
+        timeline["rise"][rise_rows] = grid_jd[0] + step * _bisect(
+            lambda x: _hermite(alt[rise_rows], slope[rise_rows], x)[0] - min_alt,
+            first.astype(float),
+            first + 1.0,
+            True,
+            iterations,
+        )
+    if len(set_rows) > 0:
+        last = setting.shape[1] - 1 - np.argmax(setting[set_rows, ::-1], axis=1)
+        timeline["set"][set_rows] = grid_jd[0] + step * _bisect(
+            lambda x: _hermite(alt[set_rows], slope[set_rows], x)[0] - min_alt,
+            last.astype(float),
+            last + 1.0,
+            False,
+            iterations,
+        )
+
+    # Transits are the roots of the altitude rate between the neighbours
+    # of the highest sample, peaks on the edges are not transits
+    peak = np.argmax(alt, axis=1)
+    timeline["max_alt"] = alt[np.arange(count), peak]
+    transit_rows = np.flatnonzero((peak > 0) & (peak < len(grid_jd) - 1))
+    if len(transit_rows) > 0:
+        transit = _bisect(
+            lambda x: _hermite(alt[transit_rows], slope[transit_rows], x)[1],
+            peak[transit_rows] - 1.0,
+            peak[transit_rows] + 1.0,
+            False,
+            iterations + 1,
+        )
+        timeline["transit"][transit_rows] = grid_jd[0] + step * transit
+        timeline["max_alt"][transit_rows] = np.maximum(
+            timeline["max_alt"][transit_rows],
+            _hermite(alt[transit_rows], slope[transit_rows], transit)[0],
+        )
+
+    timeline["visible"] = timeline["max_alt"] > min_alt
+    Logger.log(
+        f"Found {int(np.count_nonzero(timeline['visible']))} objects "
+        + "visible during the window."
     )
-    Logger.log(f"Checking sec(z) for {celestial_obj.name}.")
-    start_secz = location.altaz(start_time, celestial_obj).secz
-    end_secz = location.altaz(end_time, celestial_obj).secz
-    start_altaz = location.altaz(start_time, celestial_obj)
-    end_altaz = location.altaz(end_time, celestial_obj)
-
-    try:
-        if 0 < start_secz < secz_max:
-            Logger.log(
-                f"Found starting sec(z) = {start_secz} for {celestial_obj.name}."
-            )
-            Logger.log(
-                f"Zenith={start_altaz.zen} "
-                + f"Altitiude={start_altaz.alt}"
-                + f"Azimuth={start_altaz.az}"
-            )
-            start_alt = start_altaz.alt
-            start_az = start_altaz.az
-        else:
-            start_alt = "-"
-            start_az = "-"
-        if 0 < end_secz < secz_max:
-            Logger.log(f"Found ending sec(z) = {end_secz} for {celestial_obj.name}.")
-            Logger.log(
-                f"Zenith={start_altaz.zen} "
-                + f"Altitiude={start_altaz.alt}"
-                + f"Azimuth={start_altaz.az}"
-            )
-            end_alt = end_altaz.alt
-            end_az = end_altaz.az
-        else:
-            end_alt = "-"
-            end_az = "-"
-        return start_alt, start_az, end_alt, end_az
-    except ValueError as e:
-        Logger.log(f"Could not find sec(z) for {celestial_obj.name}.", 40)
-        Logger.log(str(e), 40)
-        Logger.log(start_secz, 40)
-        return "-", "-", "-", "-"
-    return "-", "-", "-", "-"
+    return timeline
+
+
+def _hermite(values: np.ndarray, slopes: np.ndarray, x: np.ndarray) -> tuple:
+    """
+    Evaluate the cubic Hermite interpolation of sampled rows.
+
+    :param values: Array of shape (rows, samples).
+    :param slopes: Derivatives of the values per sample, same shape.
+    :param x: Fractional sample index to evaluate at, one per row.
+    :return: Tuple of the interpolated values and their derivatives per sample.
+    """
+    index = np.clip(np.floor(x).astype(int), 0, values.shape[1] - 2)
+    s = x - index
+    rows = np.arange(values.shape[0])
+    p0 = values[rows, index]
+    p1 = values[rows, index + 1]
+    m0 = slopes[rows, index]
+    m1 = slopes[rows, index + 1]
+    value = (
+        (2 * s**3 - 3 * s**2 + 1) * p0
+        + (s**3 - 2 * s**2 + s) * m0
+        + (-2 * s**3 + 3 * s**2) * p1
+        + (s**3 - s**2) * m1
+    )
+    derivative = (
+        (6 * s**2 - 6 * s) * p0
+        + (3 * s**2 - 4 * s + 1) * m0
+        + (-6 * s**2 + 6 * s) * p1
+        + (3 * s**2 - 2 * s) * m1
+    )
+    return value, derivative
+
+
+def _bisect(func, lo: np.ndarray, hi: np.ndarray, increasing: bool, iterations: int):
+    """
+    Refine the roots of a function bracketed between lo and hi elementwise.
+
+    :param func: Function of an array of positions returning an array.
+    :param lo: Lower brackets.
+    :param hi: Upper brackets.
+    :param increasing: Whether the function goes from negative to positive.
+    :param iterations: Number of times the brackets are halved.
+    :return: Array of the refined positions.
+    """
+    for _ in range(iterations):
+        mid = (lo + hi) / 2.0
+        later = (func(mid) < 0) == increasing
+        lo = np.where(later, mid, lo)
+        hi = np.where(later, hi, mid)
+    return (lo + hi) / 2.0
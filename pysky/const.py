@@ -22,3 +22,39 @@ class Const(object):
     MIN_V = 4.5
     SECZ_MAX = 3.0
     MOON_PHASE = ""
+    TIMELINE = False
+    # Empty until set by the command line or the user preferences,
+    # anything other than "analytic" uses astropy
+    ENGINE = ""
+    CHECK_ACCURACY = False
+    # Empty until set by the command line or the user preferences, "local"
+    # computes the Sun, the Moon and the planets instead of querying JPL Horizons
+    EPHEMERIS_ENGINE = ""
+    # Solar system ephemeris of astropy used by the local engine
+    LOCAL_EPHEMERIS = "builtin"
+    # Largest error in degrees of the ephemerides interpolated between samples
+    EPHEMERIS_TOLERANCE = 0.01
+    # Paths of the large CSV or FITS catalogues to check
+    CATALOGS = []
+    # Days the SIMBAD properties of an object and its SkyView image stay cached
+    CACHE_TTL_DAYS = 30.0
+    # Objects kept in the cache, the least recently used are evicted beyond it
+    CACHE_MAX_OBJECTS = 10000
+    # Days a name SIMBAD or JPL Horizons could not resolve is skipped
+    FAILURE_TTL_DAYS = 7.0
+    # Objects whose SkyView images are downloaded at once
+    SKYVIEW_CONCURRENCY = 4
+    # Seconds before a request to a remote service times out
+    HTTP_TIMEOUT = 30.0
+    # Retries of a request that failed or returned 429/5xx
+    HTTP_RETRIES = 3
+    # "live", "record" to store the responses in the replay corpus
+    # or "replay" to answer every request from it
+    NETWORK_MODE = "live"
+    # Directory of the replay corpus, empty for `data/replay`
+    REPLAY_DIR = ""
+    # Seconds added to and share of failures among the replayed responses
+    REPLAY_LATENCY = 0.0
+    REPLAY_FAILURE_RATE = 0.0
+    # URL of a stand-in server (`python -m pysky.replay`) receiving all requests
+    STAND_IN_URL = ""
@@ -1,36 +1,44 @@
 """Main module that calls all relevant modules."""
-import json
 import os
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-import astropy
 import astropy.units as u
+import numpy as np
 from astroplan import FixedTarget
 from astropy.coordinates import SkyCoord
-from tqdm import tqdm
+from astropy.time import Time
 
+from .analytic_altaz import altaz as analytic_altaz
 from .argument_parser import cli_parse
 from .astro_info import get_ephemeris_info
-from .catalog_parse import parse_caldwell, parse_messier
-from .check_sky import is_object_visible
+from .cache import get_cache
+from .catalog_compile import sexagesimal_to_degrees
+from .catalog_parse import get_large_catalog, get_registry
+from .check_sky import (
+    ALWAYS_VISIBLE,
+    NEEDS_CHECK,
+    NEVER_VISIBLE,
+    batch_visibility,
+    classify_declinations,
+    visibility_timeline,
+)
 from .const import Const
-from .image_manipulation import overlay_text
+from .http_client import concurrency
+from .image_manipulation import img_garbage_collection, overlay_text
 from .jpl_horizons_query import ephemeris_query
+from .local_ephemeris import local_ephemeris
 from .logger import Logger
 from .output import to_html_list, to_html_table, generate_plot
-from .prefs import check_integrity, read_user_prefs
-from .simbad import (
-    get_brightness,
-    get_classification,
-    get_constellation,
-    get_distance,
-    get_ra_dec,
-)
-from .skyview import get_skyview_img
+from .prefs import check_integrity, clean_cache, read_user_prefs
+from .simbad import resolve_objects, to_cache_records
+from .skyview import fetch_images
 from .moonphase import phase_calculation
+from .observing_context import ObservingContext
 from astroplan import download_IERS_A
 
+TIMELINE_COLUMNS = ("Rise (UTC)", "Transit (UTC)", "Set (UTC)", "Max Alt. (°)")
+
 
 def invoke():
     """
@@ -40,224 +48,92 @@ def invoke():
     cli_parse()
 
     download_IERS_A()
+    # The cache limits of the preferences apply from the moment it is opened
+    USER_OBJECTS = read_user_prefs()
     check_integrity()
 
-    CALDWELL_OBJECTS = parse_caldwell(Const.ROOT_DIR)
-    MESSIER_OBJECTS = parse_messier(Const.ROOT_DIR)
-    USER_OBJECTS = read_user_prefs()
+    CALDWELL_OBJECTS = get_registry(Const.ROOT_DIR, "CaldwellCatalogue.json")
+    MESSIER_OBJECTS = get_registry(Const.ROOT_DIR, "MessierCatalogue.json")
+    CONTEXT = ObservingContext()
+    clean_cache(CONTEXT.window_key)
+    img_garbage_collection()
 
     STARS, EPHEMERIS = query_jpl_horizons(USER_OBJECTS)
-
-    EPHEMERIS_BODIES = list(EPHEMERIS.keys())
+    STARS = skip_failures("simbad", STARS)
 
     # api and returns the the list of stars
-    invoke_skyview(STARS)
-    # Open cache file
-    cache_path = Path(Const.ROOT_DIR, "data", "cache")
-    cache_file = json.loads(open(cache_path, "r").read())
-    for star in STARS:
-        cache_file = set_simbad_values(star, cache_file)
-    temp_cache = {**cache_file, **EPHEMERIS}
-    # Dump cache file
-    with open(cache_path, "w") as json_out:
-        json.dump(temp_cache, json_out, indent=4, sort_keys=True)
-    cache_file = json.loads(open(cache_path, "r").read())
-
-    set_img_txt(STARS)
-    # Iterate through the ephemeris to add information
-    for body in tqdm(EPHEMERIS_BODIES):
-        cache_file = get_ephemeris_info(body, cache_file)
-
-    # Dump cache file
-    with open(cache_path, "w") as json_out:
-        json.dump(cache_file, json_out, indent=4, sort_keys=True)
-
+    STAR_IMAGES = invoke_skyview(STARS)
+    # Only the records of the queried objects are read and written
+    CACHE = get_cache()
+    cached_stars = CACHE.get_many(STARS)
+    Logger.log(
+        f"Found {len(cached_stars)} of {len(STARS)} objects in the cache, "
+        + "querying simbad for the rest..."
+    )
+    # One bulk query fills the cache for every missing star
+    resolved = resolve_objects([star for star in STARS if star not in cached_stars])
+    CACHE.put_many(to_cache_records(resolved))
+    CACHE.put_failures("simbad", resolved.meta["unresolved"])
+
+    set_img_txt(list(STAR_IMAGES), STAR_IMAGES)
+    # The positions of every body are computed at once
+    EPHEMERIS.update(get_ephemeris_info(EPHEMERIS, CONTEXT))
+    # Ephemeris data is only valid for the site and window of the run
+    CACHE.put_many(EPHEMERIS, CONTEXT.window_key, CONTEXT.end_time.unix)
+
+    # Objects of earlier runs stay cached but are not reported
+    cache_file = run_records(CACHE, STARS + list(EPHEMERIS), CONTEXT.window_key)
     visible_objs = dict()
+    cache_stars = dict()
     for star in cache_file:
-        Logger.log("Gathering zen, altitude, and " + f"azimuth for {star}...")
         try:
-            start_altitude, start_azimuth, end_altitude, end_azimuth = get_visible(
-                star,
-                cache_file[star]["Coordinates"]["ra"],
-                cache_file[star]["Coordinates"]["dec"],
-            )
+            cache_stars[star] = cache_file[star]["Coordinates"]
         except KeyError:
             continue
-        if (
-            start_altitude != "-"
-            and start_azimuth != "-"
-            and end_altitude != "-"
-            and end_azimuth != "-"
-        ):
+    Logger.log(
+        f"Gathering zen, altitude, and azimuth for {len(cache_stars)} objects..."
+    )
+    ras = [coordinates.get("ra", "-") for coordinates in cache_stars.values()]
+    decs = [coordinates.get("dec", "-") for coordinates in cache_stars.values()]
+    altaz = get_visible(list(cache_stars.keys()), ras, decs, CONTEXT)
+    timeline = None
+    if Const.TIMELINE:
+        timeline = get_timeline(list(cache_stars.keys()), ras, decs, CONTEXT)
+    for star in altaz:
+        if is_visible(star, altaz, timeline):
             Logger.log(f"Successfully gathered data for {star}!\n")
-            visible = {str(star): dict()}
-            if start_altitude != "-":
-                visible[star]["Start Alt."] = round(
-                    float(start_altitude.to_string(decimal=True))
-                )
-            else:
-                visible[star]["Start Alt."] = "-"
-            if start_azimuth != "-":
-                visible[star]["Start Az."] = round(
-                    float(start_azimuth.to_string(decimal=True))
-                )
-            else:
-                visible[star]["Start Az."] = "-"
-            if end_altitude != "-":
-                visible[star]["End Alt."] = round(
-                    float(end_altitude.to_string(decimal=True))
-                )
-            else:
-                visible[star]["End Alt."] = "-"
-            if end_azimuth != "-":
-                visible[star]["End Az."] = round(
-                    float(end_azimuth.to_string(decimal=True))
-                )
-            else:
-                visible[star]["End Az."] = "-"
-            visible_objs.update(visible)
-
-    # Dump cache file
-    with open(cache_path, "w") as json_out:
-        json.dump(cache_file, json_out, indent=4, sort_keys=True)
-    cache_file = json.loads(open(cache_path, "r").read())
-
-    # Iterate through the ephemeris to add information
-    for body in tqdm(EPHEMERIS_BODIES):
-        cache_file = get_ephemeris_info(body, cache_file)
-
-    # Dump cache file
-    with open(cache_path, "w") as json_out:
-        json.dump(cache_file, json_out, indent=4, sort_keys=True)
-
-    visible_messier = dict()
-    visible = dict()
-    for m_obj in MESSIER_OBJECTS.keys():
-        if (
-            not isinstance(MESSIER_OBJECTS[str(m_obj)]["Brightness"], str)
-            and MESSIER_OBJECTS[str(m_obj)]["Brightness"] <= Const.MIN_V
-        ):
-            Logger.log("Gathering zen, altitude, and " + f"azimuth for {m_obj}...")
-            start_altitude, start_azimuth, end_altitude, end_azimuth = get_visible(
-                m_obj,
-                MESSIER_OBJECTS[m_obj]["Coordinates"]["ra"],
-                MESSIER_OBJECTS[m_obj]["Coordinates"]["dec"],
-            )
-            if (
-                start_altitude != "-"
-                and start_azimuth != "-"
-                and end_altitude != "-"
-                and end_azimuth != "-"
-            ):
-                Logger.log(f"Successfully gathered data for {m_obj}!\n")
-                visible[str(m_obj)] = dict()
-                visible[str(m_obj)]["Type"] = MESSIER_OBJECTS[m_obj]["Type"].title()
-                try:
-                    visible[str(m_obj)]["Start Alt. (°)"] = round(
-                        float(start_altitude.to_string(decimal=True))
-                    )
-                except AttributeError:
-                    visible[str(m_obj)]["Start Alt. (°)"] = start_altitude
-                try:
-                    visible[str(m_obj)]["Start Az. (°)"] = round(
-                        float(start_azimuth.to_string(decimal=True))
-                    )
-                except AttributeError:
-                    visible[str(m_obj)]["Start Az. (°)"] = start_azimuth
-                try:
-                    visible[str(m_obj)]["End Alt. (°)"] = round(
-                        float(end_altitude.to_string(decimal=True))
-                    )
-                except AttributeError:
-                    visible[str(m_obj)]["End Alt. (°)"] = end_altitude
-                try:
-                    visible[str(m_obj)]["End Az. (°)"] = round(
-                        float(end_azimuth.to_string(decimal=True))
-                    )
-                except AttributeError:
-                    visible[str(m_obj)]["End Az. (°)"] = end_azimuth
-                visible[str(m_obj)]["Constellation"] = MESSIER_OBJECTS[m_obj][
-                    "Constellation"
-                ]
-                visible[str(m_obj)]["Brightness"] = MESSIER_OBJECTS[m_obj]["Brightness"]
-                visible[str(m_obj)]["Distance (Pm)"] = int(
-                    (float("%.2g" % MESSIER_OBJECTS[m_obj]["Distance"]))
-                )
-                visible_messier.update(visible)
-            else:
-                Logger.log(f"{m_obj} is not visible.", 30)
-        else:
-            Logger.log(
-                f"Ignoring {m_obj} since it is below the magnitude threshold of {Const.MIN_V}",
-                30,
-            )
-    visible_caldwell = dict()
-    visible = dict()
-    for c_obj in CALDWELL_OBJECTS.keys():
-        if (
-            not isinstance(CALDWELL_OBJECTS[str(c_obj)]["Brightness"], str)
-            and CALDWELL_OBJECTS[str(c_obj)]["Brightness"] <= Const.MIN_V
-        ):
-            Logger.log("Gathering zen, altitude, and " + f"azimuth for {c_obj}...")
-            start_altitude, start_azimuth, end_altitude, end_azimuth = get_visible(
-                c_obj,
-                CALDWELL_OBJECTS[c_obj]["Coordinates"]["ra"],
-                CALDWELL_OBJECTS[c_obj]["Coordinates"]["dec"],
-            )
-            if (
-                start_altitude != "-"
-                and start_azimuth != "-"
-                and end_altitude != "-"
-                and end_azimuth != "-"
-            ):
-                Logger.log(f"Successfully gathered data for {c_obj}!\n")
-                visible[str(c_obj)] = dict()
-                visible[str(c_obj)]["Type"] = CALDWELL_OBJECTS[c_obj]["Type"].title()
-                try:
-                    visible[str(c_obj)]["Start Alt. (°)"] = round(
-                        float(start_altitude.to_string(decimal=True))
-                    )
-                except AttributeError:
-                    visible[str(c_obj)]["Start Alt. (°)"] = start_altitude
-                try:
-                    visible[str(c_obj)]["Start Az. (°)"] = round(
-                        float(start_azimuth.to_string(decimal=True))
-                    )
-                except AttributeError:
-                    visible[str(c_obj)]["Start Az. (°)"] = start_azimuth
-                try:
-                    visible[str(c_obj)]["End Alt. (°)"] = round(
-                        float(end_altitude.to_string(decimal=True))
-                    )
-                except AttributeError:
-                    visible[str(c_obj)]["End Alt. (°)"] = end_altitude
-                try:
-                    visible[str(c_obj)]["End Az. (°)"] = round(
-                        float(end_azimuth.to_string(decimal=True))
-                    )
-                except AttributeError:
-                    visible[str(c_obj)]["End Az. (°)"] = end_azimuth
-                visible[str(c_obj)]["Constellation"] = CALDWELL_OBJECTS[c_obj][
-                    "Constellation"
-                ]
-                visible[str(c_obj)]["Brightness"] = CALDWELL_OBJECTS[c_obj][
-                    "Brightness"
-                ]
-                visible[str(c_obj)]["Distance (Pm)"] = int(
-                    float("%.2g" % CALDWELL_OBJECTS[c_obj]["Distance"])
-                )
-                visible_caldwell.update(visible)
-            else:
-                Logger.log(f"{c_obj} is not visible.", 30)
-        else:
-            Logger.log(
-                f"Ignoring {c_obj} since it is below the magnitude threshold of {Const.MIN_V}",
-                30,
+            start_altitude, start_azimuth, end_altitude, end_azimuth = map(
+                round_altaz, altaz[star]
             )
+            visible_objs[str(star)] = {
+                "Start Alt.": start_altitude,
+                "Start Az.": start_azimuth,
+                "End Alt.": end_altitude,
+                "End Az.": end_azimuth,
+            }
+            if timeline is not None:
+                visible_objs[str(star)].update(timeline[star])
+
+    visible_messier = get_visible_catalog(MESSIER_OBJECTS, CONTEXT)
+    visible_caldwell = get_visible_catalog(CALDWELL_OBJECTS, CONTEXT)
 
     set_img_txt(visible_messier)
     set_img_txt(visible_caldwell)
 
+    l_list = list()
+    for catalog_path in Const.CATALOGS:
+        try:
+            catalog = get_large_catalog(catalog_path)
+        except (OSError, ValueError) as e:
+            Logger.log(f"Unable to load the catalogue `{catalog_path}`!", 40)
+            Logger.log(str(e), 40)
+            continue
+        catalog_list = list()
+        for key, value in get_visible_large_catalog(catalog, CONTEXT).items():
+            catalog_list.append({key: value})
+        write_out(catalog_list, filename=f"Visible{catalog.name.title()}")
+        l_list.extend(catalog_list)
+
     s_list = list()
     v_obj = dict()
     to_prune = list()
@@ -315,27 +191,21 @@ def invoke():
                 v_obj[star]["Distance (Pm)"] = cache_file[star]["Distance"]
         except KeyError:
             v_obj[star]["Distance (Pm)"] = "-"
+        if Const.TIMELINE:
+            for column in TIMELINE_COLUMNS:
+                v_obj[star][column] = visible_objs[star][column]
 
     for f in to_prune:
         v_obj.pop(f, None)
 
-    moon_data, _ = ephemeris_query("Moon")
-    moon_data = moon_data.pop("Moon")
-
-    months = {
-        "01": "Jan",
-        "02": "Feb",
-        "03": "Mar",
-        "04": "Apr",
-        "05": "May",
-        "06": "Jun",
-        "07": "Jul",
-        "08": "Aug",
-        "09": "Sep",
-        "10": "Oct",
-        "11": "Nov",
-        "12": "Dec",
-    }
+    # The Moon is only queried again if the user objects did not include it
+    moon_data = next(
+        (record for body, record in EPHEMERIS.items() if body.lower() == "moon"),
+        None,
+    )
+    if moon_data is None:
+        # Without ephemeris the Moon is reported with dashes
+        moon_data = query_jpl_horizons(["Moon"])[1].get("Moon", dict())
 
     v_obj["Moon"] = dict()
     phase_calculation()
@@ -343,78 +213,40 @@ def invoke():
         v_obj["Moon"]["Type"] = f"Satellite (Phase: {Const.MOON_PHASE})"
     except KeyError:
         v_obj["Moon"]["Type"] = "-"
+    # The endpoints are interpolated from the ephemeris, None when unknown
     try:
-        v_obj["Moon"]["Start Alt. (°)"] = round(
-            float(
-                moon_data[
-                    f"{Const.START_YEAR}-{months[str(Const.START_MONTH)]}-{Const.START_DAY} {Const.START_TIME}"
-                ]["alt"]
-            )
-        )
-    except KeyError:
+        v_obj["Moon"]["Start Alt. (°)"] = round(float(moon_data["Start"]["alt"]))
+    except (KeyError, TypeError):
         v_obj["Moon"]["Start Alt. (°)"] = "-"
     try:
-        v_obj["Moon"]["Start Az. (°)"] = round(
-            float(
-                moon_data[
-                    f"{Const.START_YEAR}-{months[str(Const.START_MONTH)]}-{Const.START_DAY} {Const.START_TIME}"
-                ]["az"]
-            )
-        )
-    except KeyError:
+        v_obj["Moon"]["Start Az. (°)"] = round(float(moon_data["Start"]["az"]))
+    except (KeyError, TypeError):
         v_obj["Moon"]["Start Az. (°)"] = "-"
     try:
-        v_obj["Moon"]["End Alt. (°)"] = round(
-                float(
-                    moon_data[
-                        f"{Const.END_YEAR}-{months[str(Const.END_MONTH)]}-{Const.END_DAY} {Const.END_TIME}"
-                    ]["alt"]
-                )
-            )
-    except KeyError:
+        v_obj["Moon"]["End Alt. (°)"] = round(float(moon_data["End"]["alt"]))
+    except (KeyError, TypeError):
         v_obj["Moon"]["End Alt. (°)"] = "-"
     try:
-        v_obj["Moon"]["End Az. (°)"] = round(
-            float(
-                moon_data[
-                    f"{Const.END_YEAR}-{months[str(Const.END_MONTH)]}-{Const.END_DAY} {Const.END_TIME}"
-                ]["az"]
-            )
-        )
-    except KeyError:
+        v_obj["Moon"]["End Az. (°)"] = round(float(moon_data["End"]["az"]))
+    except (KeyError, TypeError):
         v_obj["Moon"]["End Az. (°)"] = "-"
     try:
         v_obj["Moon"]["Constellation"] = moon_data["Constellation"]
     except KeyError:
         v_obj["Moon"]["Constellation"] = "-"
     try:
-        v_obj["Moon"]["Brightness"] = round(
-            float(
-                moon_data[
-                    f"{Const.START_YEAR}-{months[str(Const.START_MONTH)]}-{Const.START_DAY} {Const.START_TIME}"
-                ]["Brightness"]
-            ),
-            1,
-        )
-    except KeyError:
+        v_obj["Moon"]["Brightness"] = round(float(moon_data["Start"]["Brightness"]), 1)
+    except (KeyError, TypeError):
         v_obj["Moon"]["Brightness"] = "-"
     try:
         v_obj["Moon"]["Distance"] = "{:.7f}".format(
-            float(
-                str(
-                    round(
-                        float(
-                            moon_data[
-                                f"{Const.START_YEAR}-{months[str(Const.START_MONTH)]}-{Const.START_DAY} {Const.START_TIME}"
-                            ]["Distance"]
-                        ),
-                        8,
-                    )
-                ).upper()
-            )
+            round(float(moon_data["Start"]["Distance"]), 8)
         )
-    except KeyError:
+    except (KeyError, TypeError):
         v_obj["Moon"]["Distance"] = "-"
+    if Const.TIMELINE:
+        for column in TIMELINE_COLUMNS:
+            v_obj["Moon"][column] = "-"
     
     overlay_text("Moon", v_obj)
     
@@ -434,7 +266,7 @@ def invoke():
     write_out(m_list, filename="VisibleMessier")
     write_out(c_list, filename="VisibleCaldwell")
 
-    cel_objs = s_list + m_list + c_list
+    cel_objs = s_list + m_list + c_list + l_list
     if len(cel_objs) > 0:
         write_out(cel_objs, code=1)
         fixed_objs = list()
@@ -451,10 +283,8 @@ def invoke():
                     )
                 )
             elif str(list(c.keys())[0]) in MESSIER_OBJECTS:
-                ra, dec = ra_dec_to_deg(
-                    MESSIER_OBJECTS[str(list(c.keys())[0])]["Coordinates"]["ra"],
-                    MESSIER_OBJECTS[str(list(c.keys())[0])]["Coordinates"]["dec"],
-                )
+                row = MESSIER_OBJECTS.index[str(list(c.keys())[0])]
+                ra, dec = MESSIER_OBJECTS.ra[row], MESSIER_OBJECTS.dec[row]
                 celestial_obj_coord = SkyCoord(ra=ra * u.deg, dec=dec * u.deg)
                 fixed_objs.append(
                     FixedTarget(
@@ -463,10 +293,8 @@ def invoke():
                     )
                 )
             elif str(list(c.keys())[0]) in CALDWELL_OBJECTS:
-                ra, dec = ra_dec_to_deg(
-                    CALDWELL_OBJECTS[str(list(c.keys())[0])]["Coordinates"]["ra"],
-                    CALDWELL_OBJECTS[str(list(c.keys())[0])]["Coordinates"]["dec"],
-                )
+                row = CALDWELL_OBJECTS.index[str(list(c.keys())[0])]
+                ra, dec = CALDWELL_OBJECTS.ra[row], CALDWELL_OBJECTS.dec[row]
                 celestial_obj_coord = SkyCoord(ra=ra * u.deg, dec=dec * u.deg)
                 fixed_objs.append(
                     FixedTarget(
@@ -474,63 +302,55 @@ def invoke():
                         name=str(list(c.keys())[0]),
                     )
                 )
-            elif str(list(c.keys())[0]).lower() == "moon":
-                
-                moon_data = json.loads(
-                    open(Path(Const.SLIDESHOW_DIR, "PySkySlideshow", f"Moon-{Const.START_YEAR}-{Const.START_MONTH}-{Const.START_DAY}-{Const.START_TIME.replace(':', '')}-{Const.END_YEAR}-{Const.END_MONTH}-{Const.END_DAY}-{Const.END_TIME.replace(':', '')}-data.json"), "r").read()
+            # The Moon has no coordinates if its ephemeris query failed
+            elif (
+                str(list(c.keys())[0]).lower() == "moon"
+                and moon_data.get("Coordinates", dict()).get("ra", "-") != "-"
+            ):
+                celestial_obj_coord = SkyCoord(
+                    ra=moon_data["Coordinates"]["ra"] * u.deg,
+                    dec=moon_data["Coordinates"]["dec"] * u.deg,
                 )
-                celestial_obj_coord = SkyCoord(ra=moon_data['Coordinates']['ra'] * u.deg, dec=moon_data['Coordinates']['dec'] * u.deg)
                 fixed_objs.append(
                     FixedTarget(
                         coord=celestial_obj_coord,
                         name=str(list(c.keys())[0]),
                     )
                 )
-        write_out(fixed_objs, code=2)
+        write_out(fixed_objs, code=2, context=CONTEXT)
 
     else:
         Logger.log("No visible objects in the given range.")
 
-
-def set_simbad_values(celestial_obj: str, cache_file: dict) -> dict:
-    """
-    Call the simbad module and get the star's properties.
-
-    :param celestial_obj: Object to get values for.
-    :param cache_file: Opened cache file to apply changes to.
-    :return: Cache file with added simbad values.
-    """
-    if celestial_obj not in cache_file:
-        cache_file[celestial_obj] = dict()
-    cache_file[celestial_obj]["Type"] = get_classification(celestial_obj).title()
-
-    cache_file[celestial_obj]["Brightness"] = get_brightness(celestial_obj)
-
-    cache_file[celestial_obj]["Constellation"] = get_constellation(celestial_obj)
-
-    ra_dec = get_ra_dec(celestial_obj)
-    cache_file[celestial_obj]["Coordinates"] = {"ra": ra_dec[0], "dec": ra_dec[1]}
-    distance = get_distance(celestial_obj)
-    cache_file[celestial_obj]["Distance"] = distance
-    return cache_file
+    get_cache().log_stats()
 
 
 def query_jpl_horizons(ephemeris_objs: list) -> tuple:
     """
-    Run ephemeris_query in as many threads as specified.
+    Run ephemeris_query for every object concurrently, up to the
+    concurrency limit of JPL Horizons. With the local ephemeris engine
+    the Sun, the Moon and the planets are computed instead.
 
     :param ephemeris_objs: List of objects to retrieve data for.
+    :return: Tuple of the objects without a JPL code and the
+             dictionary of the ephemeris of the others.
     """
 
     unknown_objs = list()
     known_objs = list()
 
-    for ephemeris_obj in ephemeris_objs:
-        ephemeris, celestial_obj = ephemeris_query(ephemeris_obj)
-        if ephemeris is not None:
-            known_objs.append(ephemeris)
-        else:
-            unknown_objs.append(celestial_obj)
+    ephemeris_objs = skip_failures("horizons", ephemeris_objs)
+    if Const.EPHEMERIS_ENGINE == "local":
+        # The Sun, the Moon and the planets are computed in one pass
+        known_objs.append(local_ephemeris(ephemeris_objs))
+        ephemeris_objs = [obj for obj in ephemeris_objs if obj not in known_objs[0]]
+    with ThreadPoolExecutor(max_workers=concurrency("horizons")) as executor:
+        # The results keep the order of the objects
+        for ephemeris, celestial_obj in executor.map(ephemeris_query, ephemeris_objs):
+            if ephemeris is not None:
+                known_objs.append(ephemeris)
+            elif celestial_obj is not None:
+                unknown_objs.append(celestial_obj)
     ephemeris = dict()
     for obj in known_objs:
         ephemeris.update(obj)
@@ -538,65 +358,358 @@ def query_jpl_horizons(ephemeris_objs: list) -> tuple:
     return unknown_objs, ephemeris
 
 
-def invoke_skyview(stars: list) -> None:
+def run_records(cache, celestial_objs: list, window_key: str) -> dict:
+    """
+    :param cache: Cache of the objects.
+    :param celestial_objs: Names of the objects of the run.
+    :param window_key: Site and window of the run, see ObservingContext.
+    :return: Dictionary of the cached records of the objects, sorted by name.
+    """
+    # The stars were already counted when the run looked them up
+    records = cache.get_many(celestial_objs, window_key, count=False)
+    return {name: records[name] for name in sorted(records)}
+
+
+def skip_failures(source: str, celestial_objs: list) -> list:
+    """
+    Leave out the objects a service recently failed to resolve.
+
+    :param source: Service of the failures, "simbad" or "horizons".
+    :param celestial_objs: Names of the objects.
+    :return: List of the names that did not fail.
+    """
+    failures = get_cache().get_failures(source, celestial_objs)
+    for celestial_obj, reason in failures.items():
+        Logger.log(
+            f"Skipping {celestial_obj}, {source} could not resolve it: {reason}", 30
+        )
+    return [obj for obj in celestial_objs if obj not in failures]
+
+
+def invoke_skyview(stars: list) -> dict:
     """
-    Run skyview in as many threads as specified.
+    Download the images of the stars with skyview, up to
+    `Const.SKYVIEW_CONCURRENCY` at once.
 
     :param stars: List of string of the stars download with skyview.
+    :return: Dictionary of the stars with an image to its bytes.
     """
-    with ThreadPoolExecutor(max_workers=Const.THREADS) as executor:
-        executor.map(get_skyview_img, stars)
+    return fetch_images(stars)
 
 
-def set_img_txt(celestial_objs: list) -> None:
+def set_img_txt(celestial_objs: list, images=None) -> None:
     """
     Set the text on the image of the object.
 
     :param celestial_objs: List of strings of the objects to overlay text on.
+    :param images: Dictionary of the objects to the bytes of their SkyView
+                   image, for the objects without a static image.
     """
+    images = dict() if images is None else images
     with ThreadPoolExecutor(max_workers=Const.THREADS) as executor:
-        executor.map(overlay_text, celestial_objs)
+        executor.map(
+            lambda celestial_obj: overlay_text(
+                celestial_obj, image=images.get(celestial_obj)
+            ),
+            celestial_objs,
+        )
+
+
+def to_degrees(object_names: list, ras: list, decs: list) -> tuple:
+    """
+    Convert the coordinates of the given objects to arrays of degrees.
+    :param object_names: Names of the objects to convert.
+    :param ras: Right ascensions of the objects.
+    :param decs: Declinations of the objects.
+    :return: Tuple of the names that could be converted and the arrays of
+             their right ascensions and declinations in degrees.
+    """
+    names = list()
+    ra_degs = list()
+    dec_degs = list()
+    for object_name, ra, dec in zip(object_names, ras, decs):
+        try:
+            if ra == "-" and dec == "-":
+                continue
+            ra, dec = ra_dec_to_deg(ra, dec)
+            ra_degs.append(float(ra))
+            dec_degs.append(float(dec))
+            names.append(object_name)
+        except (TypeError, ValueError) as e:
+            Logger.log(
+                "Unable to gather name, start_altaz.alt, and "
+                + f"start_altaz.az for {object_name}!\n",
+                40,
+            )
+            Logger.log(str(e), 40)
+
+    return names, np.array(ra_degs, dtype=float), np.array(dec_degs, dtype=float)
 
 
-def get_visible(object_name: str, ra, dec) -> tuple:
+def get_visible(object_names: list, ras: list, decs: list, context: object) -> dict:
     """
-    Check to see if the given object is
+    Check to see which of the given objects are
     visible at a location in a certain time.
-    :param object_name: Name of object to check.
-    :param ra: Right ascension of the object.
-    :param dec: Declination of the object.
-    :return: Tuple of visible objects.
+    :param object_names: Names of the objects to check.
+    :param ras: Right ascensions of the objects.
+    :param decs: Declinations of the objects.
+    :param context: ObservingContext of the run.
+    :return: Dictionary of the object names to a tuple of their starting
+             altitude, azimuth and ending altitude, azimuth in degrees.
     """
+    visible = {object_name: ("-", "-", "-", "-") for object_name in object_names}
+    visible.update(get_visible_degrees(*to_degrees(object_names, ras, decs), context))
+    return visible
 
-    try:
-        if ra == "-" and dec == "-":
-            return "-", "-", "-", "-"
-        if isinstance(ra, list) and isinstance(dec, list):
-            ra, dec = ra_dec_to_deg(ra, dec)
-        celestial_obj_coord = SkyCoord(ra=ra * u.deg, dec=dec * u.deg)
-        celestial_obj = FixedTarget(coord=celestial_obj_coord, name=object_name)
-        start_altitude, start_azimuth, end_altitude, end_azimuth = is_object_visible(
-            celestial_obj=celestial_obj, secz_max=Const.SECZ_MAX
+
+def get_visible_degrees(
+    object_names: list, ra: np.ndarray, dec: np.ndarray, context: object
+) -> dict:
+    """
+    Check to see which of the given objects are
+    visible at a location in a certain time.
+    :param object_names: Names of the objects to check.
+    :param ra: Array of the right ascensions of the objects in degrees.
+    :param dec: Array of the declinations of the objects in degrees.
+    :param context: ObservingContext of the run.
+    :return: Dictionary of the object names to a tuple of their starting
+             altitude, azimuth and ending altitude, azimuth in degrees.
+    """
+    visible = {object_name: ("-", "-", "-", "-") for object_name in object_names}
+    if len(object_names) == 0:
+        return visible
+
+    # Only objects whose declination does not decide their visibility
+    # go through the full transform
+    classes = classify_declinations(dec, Const.LATITUDE, Const.SECZ_MAX)
+    Logger.log(
+        f"Skipping {int(np.count_nonzero(classes == NEVER_VISIBLE))} objects that "
+        + "never rise above the sec(z) limit and "
+        + f"{int(np.count_nonzero(classes == ALWAYS_VISIBLE))} that never set below it."
+    )
+    check = np.flatnonzero(classes == NEEDS_CHECK)
+    if len(check) > 0:
+        altaz = batch_visibility(
+            ra[check], dec[check], secz_max=Const.SECZ_MAX, context=context
         )
-        return start_altitude, start_azimuth, end_altitude, end_azimuth
-    except astropy.coordinates.name_resolve.NameResolveError as e:
-        Logger.log(
-            "Unable to gather name, start_altaz.alt, and "
-            + f"start_altaz.az for {object_name}!\n",
-            40,
+        for index, row in enumerate(check):
+            visible[object_names[row]] = tuple(
+                float(altaz[key][index, column])
+                if altaz["visible"][index, column]
+                else "-"
+                for column in (0, 1)
+                for key in ("alt", "az")
+            )
+
+    always = np.flatnonzero(classes == ALWAYS_VISIBLE)
+    if len(always) > 0:
+        alt, az = analytic_altaz(
+            ra[always, np.newaxis],
+            dec[always, np.newaxis],
+            context.times.jd,
+            Const.LATITUDE,
+            Const.LONGITUDE,
         )
-        Logger.log(str(e), 40)
-        return "-", "-", "-", "-"
-    except TypeError as e:
-        Logger.log(
-            "Unable to gather name, start_altaz.alt, and "
-            + f"start_altaz.az for {object_name}!\n",
-            40,
+        for index, row in enumerate(always):
+            visible[object_names[row]] = (
+                float(alt[index, 0]),
+                float(az[index, 0]),
+                float(alt[index, 1]),
+                float(az[index, 1]),
+            )
+    return visible
+
+
+def get_timeline(object_names: list, ras: list, decs: list, context: object) -> dict:
+    """
+    Find the objects that are visible at any point of the
+    time range and when they rise, transit and set.
+    :param object_names: Names of the objects to check.
+    :param ras: Right ascensions of the objects.
+    :param decs: Declinations of the objects.
+    :param context: ObservingContext of the run.
+    :return: Dictionary of the visible object names to their table values
+             for the TIMELINE_COLUMNS.
+    """
+    return get_timeline_degrees(*to_degrees(object_names, ras, decs), context)
+
+
+def get_timeline_degrees(
+    object_names: list, ra: np.ndarray, dec: np.ndarray, context: object
+) -> dict:
+    """
+    Find the objects that are visible at any point of the
+    time range and when they rise, transit and set.
+    :param object_names: Names of the objects to check.
+    :param ra: Array of the right ascensions of the objects in degrees.
+    :param dec: Array of the declinations of the objects in degrees.
+    :param context: ObservingContext of the run.
+    :return: Dictionary of the visible object names to their table values
+             for the TIMELINE_COLUMNS.
+    """
+    if len(object_names) == 0:
+        return dict()
+
+    # Objects that never rise above the limit have no timeline
+    rows = np.flatnonzero(
+        classify_declinations(dec, Const.LATITUDE, Const.SECZ_MAX) != NEVER_VISIBLE
+    )
+    timeline = visibility_timeline(
+        ra[rows], dec[rows], secz_max=Const.SECZ_MAX, context=context
+    )
+    visible = dict()
+    for index, row in enumerate(rows):
+        object_name = object_names[row]
+        if not timeline["visible"][index]:
+            continue
+        visible[object_name] = dict(
+            zip(
+                TIMELINE_COLUMNS,
+                (
+                    jd_to_str(timeline["rise"][index]),
+                    jd_to_str(timeline["transit"][index]),
+                    jd_to_str(timeline["set"][index]),
+                    round(float(timeline["max_alt"][index])),
+                ),
+            )
+        )
+    return visible
+
+
+def jd_to_str(jd: float) -> str:
+    """
+    Format a Julian date as a UTC date and time down to the minute.
+    :param jd: Julian date, NaN if there is no time.
+    :return: Formatted time or "-".
+    """
+    if np.isnan(jd):
+        return "-"
+    return Time(jd, format="jd").iso[:16]
+
+
+def get_visible_catalog(catalog: object, context: object) -> dict:
+    """
+    Check which objects of a catalogue are bright enough
+    and visible at a location in a certain time.
+    :param catalog: CatalogRegistry of the catalogue.
+    :param context: ObservingContext of the run.
+    :return: Dictionary of the visible objects and their table values.
+    """
+    # Unknown magnitudes are NaN and never pass the threshold
+    bright = np.flatnonzero(catalog.magnitude <= Const.MIN_V)
+    Logger.log(
+        f"Ignoring {len(catalog) - len(bright)} objects since they are "
+        + f"below the magnitude threshold of {Const.MIN_V}",
+        30,
+    )
+    candidates = catalog.names[bright].tolist()
+
+    Logger.log(f"Gathering zen, altitude, and azimuth for {len(candidates)} objects...")
+    ra, dec = catalog.ra[bright], catalog.dec[bright]
+    altaz = get_visible_degrees(candidates, ra, dec, context)
+    timeline = None
+    if Const.TIMELINE:
+        timeline = get_timeline_degrees(candidates, ra, dec, context)
+
+    visible = dict()
+    for c_obj in candidates:
+        if not is_visible(c_obj, altaz, timeline):
+            Logger.log(f"{c_obj} is not visible.", 30)
+            continue
+        Logger.log(f"Successfully gathered data for {c_obj}!\n")
+        start_altitude, start_azimuth, end_altitude, end_azimuth = map(
+            round_altaz, altaz[c_obj]
+        )
+        entry = catalog.entries[c_obj]
+        visible[str(c_obj)] = {
+            "Type": entry["Type"].title(),
+            "Start Alt. (°)": start_altitude,
+            "Start Az. (°)": start_azimuth,
+            "End Alt. (°)": end_altitude,
+            "End Az. (°)": end_azimuth,
+            "Constellation": entry["Constellation"],
+            "Brightness": entry["Brightness"],
+            "Distance (Pm)": int(float("%.2g" % entry["Distance"])),
+        }
+        if timeline is not None:
+            visible[str(c_obj)].update(timeline[c_obj])
+    return visible
+
+
+def get_visible_large_catalog(catalog: object, context: object) -> dict:
+    """
+    Check which objects of a large catalogue are bright enough
+    and visible at a location in a certain time.
+    :param catalog: LargeCatalog of the catalogue.
+    :param context: ObservingContext of the run.
+    :return: Dictionary of the visible objects and their table values.
+    """
+    # The catalogue is sorted by magnitude so only the bright prefix is read
+    bright = catalog.bright_count(Const.MIN_V)
+    Logger.log(
+        f"Ignoring {len(catalog) - bright} objects of `{catalog.name}` since they "
+        + f"are below the magnitude threshold of {Const.MIN_V}",
+        30,
+    )
+    candidates = catalog.get_names(bright)
+
+    Logger.log(f"Gathering zen, altitude, and azimuth for {bright} objects...")
+    ra = np.asarray(catalog.ra[:bright], dtype=float)
+    dec = np.asarray(catalog.dec[:bright], dtype=float)
+    altaz = get_visible_degrees(candidates, ra, dec, context)
+    timeline = None
+    if Const.TIMELINE:
+        timeline = get_timeline_degrees(candidates, ra, dec, context)
+
+    visible = dict()
+    for row, c_obj in enumerate(candidates):
+        if not is_visible(c_obj, altaz, timeline):
+            continue
+        start_altitude, start_azimuth, end_altitude, end_azimuth = map(
+            round_altaz, altaz[c_obj]
         )
-        Logger.log(str(e), 40)
-        return "-", "-", "-", "-"
+        visible[str(c_obj)] = {
+            "Type": "-",
+            "Start Alt. (°)": start_altitude,
+            "Start Az. (°)": start_azimuth,
+            "End Alt. (°)": end_altitude,
+            "End Az. (°)": end_azimuth,
+            "Constellation": "-",
+            "Brightness": round(float(catalog.magnitude[row]), 2),
+            "Distance (Pm)": "-",
+        }
+        if timeline is not None:
+            visible[str(c_obj)].update(timeline[c_obj])
+    Logger.log(f"{len(visible)} objects of `{catalog.name}` are visible.")
+    return visible
+
+
+def is_visible(object_name: str, altaz: dict, timeline=None) -> bool:
+    """
+    Check if an object counts as visible for the report.
+    :param object_name: Name of the object to check.
+    :param altaz: Dictionary returned by get_visible.
+    :param timeline: Dictionary returned by get_timeline in timeline mode.
+    :return: True if the object is visible at both the start and end times
+             or, in timeline mode, at any time of the range.
+    """
+    if timeline is not None:
+        return object_name in timeline
+    return "-" not in altaz[object_name]
+
+
+def round_altaz(angle):
+    """
+    Round an altitude or azimuth for the report.
+    :param angle: Angle in degrees or "-".
+    :return: Rounded angle or "-".
+    """
+    if angle == "-":
+        return angle
+    return round(angle)
+
 
-def write_out(celestial_objs: list, code=0, filename=None):
+def write_out(celestial_objs: list, code=0, filename=None, context=None):
     if code == 0:
         Logger.log("Writing objects to HTML list")
         to_html_list(celestial_objs, filename=filename)
@@ -610,13 +723,14 @@ def write_out(celestial_objs: list, code=0, filename=None):
         if not os.path.isdir(Path(Const.SLIDESHOW_DIR, "PySkySlideshow", "plots")):
             os.makedirs(Path(Const.SLIDESHOW_DIR, "PySkySlideshow", "plots"))
         for celestial_obj in celestial_objs:
-            generate_plot(celestial_obj)
+            generate_plot(celestial_obj, context)
         Logger.log("Plots generated.")
 
 
 def ra_dec_to_deg(ra: list, dec: list) -> tuple:
     if isinstance(ra, list) and isinstance(dec, list):
-        return ((ra[0] + (ra[1] / 60) + (ra[2] / 3600)) / 24) * 360, dec[0] + (
-            dec[1] / 60 + (dec[2] / 3600)
+        return (
+            sexagesimal_to_degrees(ra, hours=True),
+            sexagesimal_to_degrees(dec, hours=False),
         )
     return ra, dec
@@ -0,0 +1,248 @@
+"""This module holds the HTTP sessions used to reach the remote services.
+
+Every service gets one requests.Session whose connections are kept alive and
+pooled, with a default timeout, retries with exponential backoff on network
+errors and 429/5xx responses, and a token bucket limiting its request rate.
+The sessions are shared by the whole process and can be handed to the
+astroquery clients, so all the network traffic goes through them, which also
+lets the replay module record and replay it.
+"""
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+import requests.adapters
+
+from . import replay
+from .const import Const
+from .logger import Logger
+
+# Hosts, sustained requests per second, burst size and largest number of
+# requests in flight of every service, hosts of no service get their own
+# bucket with the default limits
+SERVICES = {
+    "simbad": {
+        "hosts": ("simbad.u-strasbg.fr", "simbad.cds.unistra.fr", "simbad.harvard.edu"),
+        "rate": 5.0,
+        "burst": 5,
+        "concurrency": 4,
+    },
+    "skyview": {
+        "hosts": ("skyview.gsfc.nasa.gov",),
+        "rate": 2.0,
+        "burst": 4,
+        "concurrency": 4,
+    },
+    "horizons": {
+        "hosts": ("ssd.jpl.nasa.gov", "ssd-api.jpl.nasa.gov"),
+        "rate": 2.0,
+        "burst": 8,
+        "concurrency": 8,
+    },
+}
+DEFAULT_LIMITS = {"rate": 5.0, "burst": 5, "concurrency": 4}
+
+# Responses worth retrying
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Seconds before the first retry, doubled for every following one
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket allowing `rate` acquisitions per second on
+    average and bursts of up to `burst` acquisitions.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        """
+        :param rate: Tokens added per second.
+        :param burst: Largest number of tokens the bucket holds.
+        """
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Take a token, waiting for one if the bucket is empty.
+
+        :return: Seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return waited
+                delay = (1.0 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class ServiceAdapter(requests.adapters.HTTPAdapter):
+    """
+    Transport adapter applying the rate limit, default timeout and
+    retries of a service to every request sent through a session.
+    """
+
+    def __init__(self, service: str, bucket: TokenBucket, **kwargs):
+        """
+        :param service: Name of the service, for the log.
+        :param bucket: TokenBucket of the service.
+        """
+        self.service = service
+        self.bucket = bucket
+        super(ServiceAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = Const.HTTP_TIMEOUT
+        for attempt in range(Const.HTTP_RETRIES + 1):
+            self.bucket.acquire()
+            last_attempt = attempt == Const.HTTP_RETRIES
+            try:
+                response = self._send_once(request, **kwargs)
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ) as e:
+                if last_attempt:
+                    raise
+                delay = _backoff(attempt)
+                Logger.log(
+                    f"Request to {self.service} failed ({type(e).__name__}), "
+                    + f"retrying in {delay:.1f} seconds...",
+                    30,
+                )
+            else:
+                if response.status_code not in RETRY_STATUSES or last_attempt:
+                    return response
+                delay = _retry_after(response, attempt)
+                Logger.log(
+                    f"Request to {self.service} returned {response.status_code}, "
+                    + f"retrying in {delay:.1f} seconds...",
+                    30,
+                )
+                response.close()
+            time.sleep(delay)
+
+    def _send_once(self, request, **kwargs):
+        """
+        Send a request live, to the stand-in server or to the replay corpus
+        depending on `Const.NETWORK_MODE` and `Const.STAND_IN_URL`.
+        """
+        if Const.NETWORK_MODE == "replay":
+            return replay.respond(request)
+        if Const.STAND_IN_URL != "":
+            request = replay.to_stand_in(request)
+        response = super(ServiceAdapter, self).send(request, **kwargs)
+        if Const.NETWORK_MODE == "record":
+            replay.record(request, response, self.service)
+        return response
+
+
+_SESSIONS = dict()
+_BUCKETS = dict()
+_SESSIONS_LOCK = threading.Lock()
+
+
+def service_for(url: str) -> str:
+    """
+    :param url: URL of a request.
+    :return: Name of the service of the URL, or its host if it has none.
+    """
+    host = urlsplit(url).hostname or ""
+    for service, limits in SERVICES.items():
+        if host in limits["hosts"]:
+            return service
+    return host
+
+
+def get_session(service: str) -> requests.Session:
+    """
+    Return the session of a service, creating it on the first call.
+
+    :param service: Name of the service, or a host.
+    :return: The requests.Session of the service shared by the whole process.
+    """
+    with _SESSIONS_LOCK:
+        # A forked process must not share the connections of its parent
+        key = (service, os.getpid())
+        if key not in _SESSIONS:
+            limits = SERVICES.get(service, DEFAULT_LIMITS)
+            if service not in _BUCKETS:
+                _BUCKETS[service] = TokenBucket(limits["rate"], limits["burst"])
+            pool_size = max(Const.THREADS, limits["burst"], limits["concurrency"])
+            adapter = ServiceAdapter(
+                service,
+                _BUCKETS[service],
+                pool_connections=pool_size,
+                pool_maxsize=pool_size,
+            )
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _SESSIONS[key] = session
+        return _SESSIONS[key]
+
+
+def concurrency(service: str) -> int:
+    """
+    :param service: Name of the service, or a host.
+    :return: Largest number of requests to send to the service at once.
+    """
+    return SERVICES.get(service, DEFAULT_LIMITS)["concurrency"]
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Send a request through the session of its service.
+
+    :param method: HTTP method.
+    :param url: URL of the request.
+    :param kwargs: Arguments of requests.Session.request.
+    :return: The response.
+    """
+    return get_session(service_for(url)).request(method, url, **kwargs)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """
+    :param url: URL to get.
+    :param kwargs: Arguments of requests.Session.request.
+    :return: The response.
+    """
+    return request("GET", url, **kwargs)
+
+
+def _backoff(attempt: int) -> float:
+    """
+    :param attempt: Number of the failed attempt, starting at 0.
+    :return: Seconds to wait, doubled for every attempt with some jitter.
+    """
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt) * random.uniform(0.5, 1.0)
+
+
+def _retry_after(response: requests.Response, attempt: int) -> float:
+    """
+    :param response: Response to retry.
+    :param attempt: Number of the failed attempt, starting at 0.
+    :return: Seconds asked by the Retry-After header, or the backoff.
+    """
+    try:
+        return min(BACKOFF_MAX, float(response.headers["Retry-After"]))
+    except (KeyError, ValueError):
+        return _backoff(attempt)
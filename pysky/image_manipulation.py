@@ -1,28 +1,39 @@
 """This module will be used to overlay information of the
 celestial body over image of the celestial body using PIL"""
-import json
+import io
 import os
+import threading
 from pathlib import Path
 
 import PIL.Image
 import PIL.ImageDraw
 import PIL.ImageFont
 
+from .cache import get_cache
 from .catalog_parse import check_caldwell, check_messier, parse_caldwell, parse_messier
 from .const import Const
 from .logger import Logger
 
 PIL.Image.MAX_IMAGE_PIXELS = 933120000
 
+# Fonts by path and pixel size, layouts of the text by image height and fonts
+# found in the resource directories, shared by every image of the process.
+# The lock guards filling them, the text is drawn without it
+_FONTS = dict()
+_LAYOUTS = dict()
+_FONT_PATHS = dict()
+_FONTS_LOCK = threading.Lock()
 
-def overlay_text(celestial_obj: str, extra_data=None) -> None:
+
+def overlay_text(celestial_obj: str, extra_data=None, image=None) -> None:
     """
     This adds text to the image
-    :img: Image file to overlay the text
-    :overlay_text: List of text to overlay on the image
+    :celestial_obj: Name of the object
+    :extra_data: Report of the run, holding the data of the Moon
+    :image: Bytes of the SkyView image of a star, as returned by fetch_images
     """
     conv_str = "1 Pm = 1 000 000 000 000 000 meters"
-    cache_file = json.loads(open(Path(Const.ROOT_DIR, "data", "cache"), "r").read())
+    record = get_cache().get(celestial_obj)
     overlay_txt = list()
 
     if check_messier(celestial_obj):
@@ -99,9 +110,6 @@ def overlay_text(celestial_obj: str, extra_data=None) -> None:
             
     elif celestial_obj.lower() == "moon":
         Logger.log(f"Overlaying text for {celestial_obj}")
-        if not os.path.isdir(Path(Const.SLIDESHOW_DIR, "PySkySlideshow", "garbage")):
-            Logger.log("Garbage directory not found! Creating it.", 30)
-            os.makedirs(Path(Const.SLIDESHOW_DIR, "PySkySlideshow", "garbage"))
         Logger.log("Loading image data.")
         
         static_data_path = Path(Const.ROOT_DIR, "data", "static_data")
@@ -118,17 +126,6 @@ def overlay_text(celestial_obj: str, extra_data=None) -> None:
             conv_str,
         ]
         img = add_text(img, overlay_txt)
-        Logger.log(f"Adding edited image of {celestial_obj} to cache file...")
-        img.save(
-            fp=Path(
-                Const.SLIDESHOW_DIR,
-                "PySkySlideshow",
-                "garbage",
-                f"{celestial_obj}.temp.jpg",
-            )
-        )
-
-        
         img.save(
             fp=Path(
                 Const.SLIDESHOW_DIR,
@@ -138,53 +135,33 @@ def overlay_text(celestial_obj: str, extra_data=None) -> None:
             format="pdf",
         )
 
-    elif celestial_obj.lower() in cache_file:
+    elif record is not None:
+        if image is None:
+            Logger.log(f"No image to overlay text on for {celestial_obj}!", 30)
+            return
         Logger.log(f"Overlaying text for {celestial_obj}")
-        if not os.path.isdir(Path(Const.SLIDESHOW_DIR, "PySkySlideshow", "garbage")):
-            Logger.log("Garbage directory not found! Creating it.", 30)
-            os.makedirs(Path(Const.SLIDESHOW_DIR, "PySkySlideshow", "garbage"))
         Logger.log("Loading image data.")
-        img = PIL.Image.open(
-            Path(
-                Const.SLIDESHOW_DIR,
-                "PySkySlideshow",
-                "garbage",
-                f"{celestial_obj}.temp.jpg",
-            )
-        )
+        # The downloaded image is decoded from memory, only the PDF is written
+        img = PIL.Image.open(io.BytesIO(image))
         Logger.log("Generating image text.")
         overlay_txt = [
             f"Name: {celestial_obj.capitalize()}",
-            f"Type: {cache_file[celestial_obj]['Type']}",
-            f"Constellation: {cache_file[celestial_obj]['Constellation']}",
-            f"Brightness: {cache_file[celestial_obj]['Brightness']}",
-            f"Distance: {cache_file[celestial_obj]['Distance']} Pm",
+            f"Type: {record['Type']}",
+            f"Constellation: {record['Constellation']}",
+            f"Brightness: {record['Brightness']}",
+            f"Distance: {record['Distance']} Pm",
             conv_str,
         ]
         img = add_text(img, overlay_txt)
-        Logger.log(f"Adding edited image of {celestial_obj} to cache file...")
         img.save(
             fp=Path(
                 Const.SLIDESHOW_DIR,
                 "PySkySlideshow",
-                "garbage",
-                f"{celestial_obj}.temp.jpg",
-            )
+                f"{celestial_obj.title().replace(' ', '_')}.pdf",
+            ),
+            format="pdf",
         )
 
-        with open(Path(Const.ROOT_DIR, "data", "cache"), "w") as json_out:
-            Logger.log("Saving edited cache file...")
-            json.dump(cache_file, json_out)
-            Logger.log("Edited cache file saved!")
-            img.save(
-                fp=Path(
-                    Const.SLIDESHOW_DIR,
-                    "PySkySlideshow",
-                    f"{celestial_obj.title().replace(' ', '_')}.pdf",
-                ),
-                format="pdf",
-            )
-
 
 def add_text(img: object, overlay_txt: list) -> object:
     """
@@ -200,41 +177,75 @@ def add_text(img: object, overlay_txt: list) -> object:
         Logger.log(f"Error opening {img}", 50)
 
     Logger.log("Overlaying text to image...")
-    fonts = [
-        Path(Const.ROOT_DIR, "data", "res") / f
-        for f in os.listdir(Path(Const.ROOT_DIR, "data", "res"))
-        if ".ttf" in f
-    ]
+    layout = get_layout(img_h)
     overlaid = PIL.ImageDraw.Draw(img, mode="RGBA")
-    if len(fonts) >= 1:
-        fnt_path = Path(Const.ROOT_DIR, "data", "res") / fonts[0]
-        fnt = PIL.ImageFont.truetype(str(fnt_path), int(img_h / 33))
-        overlaid.multiline_text(
-            xy=(20, int(img_h * 0.75)),  # xy for the text to be overlaid
-            text="\n".join(overlay_txt),  # concats all strings in the list
-            fill=(255, 255, 255, 100),  # white text with alpha=100
-            font=fnt,
-            stroke_width=1,  # thickness of the stroke
-            stroke_fill=(0, 0, 0, 100),  # black stroke with alpha=100
-            spacing=2.0,  # in between each new line
-            align="left",
-        )
-    else:
-        overlaid.multiline_text(
-            xy=(10, int(img_h * 0.75)),  # xy for the text to be overlaid
-            text="\n".join(overlay_txt),  # concats all strings in the list
-            fill=(255, 255, 255, 100),  # white text with alpha=100
-            spacing=2.0,  # in between each new line
-            align="left",
-        )
+    overlaid.multiline_text(
+        text="\n".join(overlay_txt),  # concats all strings in the list
+        fill=(255, 255, 255, 100),  # white text with alpha=100
+        spacing=2.0,  # in between each new line
+        align="left",
+        **layout,
+    )
 
     return img
 
 
+def get_layout(img_h: int) -> dict:
+    """
+    Lay the text out for the images of a height, once per height.
+    :param img_h: Height of the image in pixels.
+    :return: Dictionary of the position, font and stroke of the text, as
+             arguments of ImageDraw.multiline_text.
+    """
+    with _FONTS_LOCK:
+        if img_h in _LAYOUTS:
+            return _LAYOUTS[img_h]
+        font_path = _font_path()
+        if font_path is not None:
+            layout = {
+                "xy": (20, int(img_h * 0.75)),  # xy for the text to be overlaid
+                "font": _font(font_path, int(img_h / 33)),
+                "stroke_width": 1,  # thickness of the stroke
+                "stroke_fill": (0, 0, 0, 100),  # black stroke with alpha=100
+            }
+        else:
+            layout = {"xy": (10, int(img_h * 0.75))}
+        _LAYOUTS[img_h] = layout
+        return layout
+
+
+def _font_path():
+    """
+    :return: Path of the first TrueType font of `data/res`, None if there is
+             none, the directory is only listed once.
+    """
+    res_dir = Path(Const.ROOT_DIR, "data", "res")
+    if res_dir not in _FONT_PATHS:
+        fonts = sorted(f for f in os.listdir(res_dir) if ".ttf" in f)
+        _FONT_PATHS[res_dir] = Path(res_dir, fonts[0]) if len(fonts) >= 1 else None
+    return _FONT_PATHS[res_dir]
+
+
+def _font(font_path: Path, size: int) -> object:
+    """
+    :param font_path: Path of a TrueType font.
+    :param size: Size of the font in pixels.
+    :return: PIL.ImageFont of the font, only parsed once per path and size.
+    """
+    if (font_path, size) not in _FONTS:
+        _FONTS[(font_path, size)] = PIL.ImageFont.truetype(str(font_path), size)
+    return _FONTS[(font_path, size)]
+
+
 def img_garbage_collection():
-    for img in [
-        Path(Const.SLIDESHOW_DIR, "PySkySlideshow", "garbage") / f
-        for f in os.listdir(Path(Const.ROOT_DIR, "data"))
-        if ".temp.jpg" in f
-    ]:
+    """
+    Remove the temporary images left in the garbage directory by older versions,
+    and the directory once it is empty.
+    """
+    garbage_dir = Path(Const.SLIDESHOW_DIR, "PySkySlideshow", "garbage")
+    if not os.path.isdir(garbage_dir):
+        return
+    for img in [garbage_dir / f for f in os.listdir(garbage_dir) if ".temp.jpg" in f]:
         os.remove(img)
+    if len(os.listdir(garbage_dir)) == 0:
+        os.rmdir(garbage_dir)
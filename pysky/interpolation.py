@@ -0,0 +1,155 @@
+"""This module interpolates ephemerides sampled on a coarse time grid, so the
+position of a body can be read at any time of the window, and picks the
+coarsest grid that keeps the interpolation within a tolerance."""
+import numpy as np
+
+# Angular speed of the diurnal motion in radians per minute
+SIDEREAL_RATE = 2.0 * np.pi / 1436.07
+
+# Steps in minutes the ephemerides can be sampled with, so that windows
+# sampled with the same step share their rows in the cache
+STEPS = (1, 2, 5, 10, 15, 30, 60, 120, 240)
+
+# Largest error of the four point cubic interpolation over the middle of
+# its interval, as a factor of h^4 times the fourth derivative
+CUBIC_ERROR = 9.0 / 384.0
+
+# Columns in degrees that wrap around at 360
+WRAPPED_COLUMNS = ("RA", "AZ")
+
+# Columns whose interpolation error decides the step
+CHECKED_COLUMNS = ("RA", "DEC", "AZ", "EL")
+
+# Wrapped columns and the latitude whose cosine turns their error into an
+# angle on the sky, so the azimuth swinging around near the zenith and the
+# right ascension near the pole do not ask for finer steps
+SCALED_COLUMNS = {"RA": "DEC", "AZ": "EL"}
+
+
+def choose_step(tolerance: float, minutes: float) -> int:
+    """
+    Pick the coarsest step keeping the interpolation of the diurnal motion,
+    which dominates the alt/az of every body, within a tolerance.
+
+    :param tolerance: Largest interpolation error in degrees.
+    :param minutes: Length of the window in minutes.
+    :return: Step in minutes, one of STEPS.
+    """
+    # A 90 degree sinusoid has a fourth derivative of 90 * rate^4
+    step = (tolerance / (CUBIC_ERROR * 90.0 * SIDEREAL_RATE**4)) ** 0.25
+    # The window spans at least three steps for the cubic
+    step = min(step, max(minutes, 1.0) / 3.0)
+    return max([choice for choice in STEPS if choice <= step] or [STEPS[0]])
+
+
+def finer_step(step: int):
+    """
+    :param step: Step in minutes, one of STEPS.
+    :return: The next finer step, or None if it is the finest.
+    """
+    finer = [choice for choice in STEPS if choice < step]
+    return finer[-1] if len(finer) > 0 else None
+
+
+def interpolation_error(table: dict) -> float:
+    """
+    Estimate the largest interpolation error of a sampled ephemeris from
+    the fourth differences of its columns.
+
+    :param table: Dictionary of the `epoch` column in minutes and the
+                  CHECKED_COLUMNS in degrees.
+    :return: Estimated error on the sky in degrees, 0 if there are too few
+             samples.
+    """
+    if len(table["epoch"]) < 5:
+        return 0.0
+    largest = 0.0
+    for column in CHECKED_COLUMNS:
+        err = np.abs(np.diff(_unwrap(column, table[column]), n=4))
+        if column in SCALED_COLUMNS:
+            # Latitude of the middle sample of every fourth difference
+            latitude = np.asarray(table[SCALED_COLUMNS[column]], dtype=float)[2:-2]
+            err = err * np.cos(np.radians(latitude))
+        # nanmax has no initial value before numpy 1.22
+        if np.isfinite(err).any():
+            largest = max(largest, float(np.nanmax(err)))
+    return CUBIC_ERROR * largest
+
+
+class EphemerisInterpolator(object):
+    """
+    Four point cubic interpolation of the columns of a sampled ephemeris.
+
+    Calling sequence:
+        interpolator = EphemerisInterpolator(table)
+        interpolator(Time("2020-01-01 18:07").unix / 60)["EL"]
+    """
+
+    def __init__(self, table: dict, columns=None):
+        """
+        :param table: Dictionary of the `epoch` column in minutes, sorted,
+                      and the numeric columns.
+        :param columns: Names of the columns to interpolate, all the numeric
+                        ones but the epoch by default.
+        """
+        self.epochs = np.asarray(table["epoch"], dtype=float)
+        if columns is None:
+            columns = [
+                column
+                for column, values in table.items()
+                if column != "epoch" and np.asarray(values).dtype.kind in "fiu"
+            ]
+        self.columns = {
+            column: _unwrap(column, np.asarray(table[column], dtype=float))
+            for column in columns
+        }
+
+    def __call__(self, epochs) -> dict:
+        """
+        :param epochs: Times in unix minutes, a number or an array.
+        :return: Dictionary of the columns to their values at the times, NaN
+                 outside the samples.
+        """
+        epochs = np.asarray(epochs, dtype=float)
+        if len(self.epochs) == 0:
+            return {column: np.full(epochs.shape, np.nan) for column in self.columns}
+        if len(self.epochs) < 4:
+            # Too few samples for the cubic
+            return {
+                column: np.interp(epochs, self.epochs, samples, np.nan, np.nan)
+                for column, samples in self.columns.items()
+            }
+        # Index of the first of the four samples around every time
+        first = np.clip(
+            np.searchsorted(self.epochs, epochs) - 2, 0, len(self.epochs) - 4
+        )
+        indices = first[..., np.newaxis] + np.arange(4)
+        nodes = self.epochs[indices]
+        # Lagrange weights of the four samples
+        weights = np.ones(indices.shape)
+        for node in range(4):
+            for other in range(4):
+                if node != other:
+                    weights[..., node] *= (epochs - nodes[..., other]) / (
+                        nodes[..., node] - nodes[..., other]
+                    )
+        outside = (epochs < self.epochs[0]) | (epochs > self.epochs[-1])
+        values = dict()
+        for column, samples in self.columns.items():
+            value = np.sum(weights * samples[indices], axis=-1)
+            if column in WRAPPED_COLUMNS:
+                value = np.mod(value, 360.0)
+            values[column] = np.where(outside, np.nan, value)
+        return values
+
+
+def _unwrap(column: str, values: np.ndarray) -> np.ndarray:
+    """
+    :param column: Name of the column.
+    :param values: Values of the column in degrees.
+    :return: The values without the jumps at 360 degrees of the wrapped columns.
+    """
+    values = np.asarray(values, dtype=float)
+    if column not in WRAPPED_COLUMNS or len(values) == 0:
+        return values
+    return np.degrees(np.unwrap(np.radians(values)))
@@ -1,25 +1,42 @@
 """Module to query JPL Horizons database."""
 import json
-from statistics import median
+import time
 from pathlib import Path
 
+import numpy as np
+import requests
+from astropy.time import Time
 from astroquery.jplhorizons import Horizons
 
+from .cache import get_cache
+from .catalog_parse import get_map
+from .http_client import get_session
 from .const import Const
+from .interpolation import (
+    EphemerisInterpolator,
+    choose_step,
+    finer_step,
+    interpolation_error,
+)
 from .logger import Logger
 
+# Numeric columns of the ephemerides, masked values are NaN
+NUMERIC_COLUMNS = ("RA", "DEC", "AZ", "EL", "V", "delta", "illumination")
+
+# Petameters in an astronomical unit
+AU_TO_PM = 0.000149597870691
+
 
 def ephemeris_query(celestial_obj: str) -> tuple:
     """
     Query the table of the celestial object in a time range.
 
     :param celestial_obj:
-    :return:
+    :return: Tuple of the ephemeris and None, (None, celestial_obj) if the
+             object has no JPL code or (None, None) if the query failed.
     :usage: object_query('venus', '2020-01-01', '18:00', '2020-01-02', '1:00')
     """
-    jplcodes = json.loads(
-        open(Path(Const.ROOT_DIR, "data", "jplcodes.json"), "r").read()
-    )
+    jplcodes = get_map(Const.ROOT_DIR, "jplcodes.json")
     try:
         obj_code = jplcodes[celestial_obj.lower()]
     except KeyError:
@@ -38,75 +55,149 @@ def ephemeris_query(celestial_obj: str) -> tuple:
         Logger.log(f"Removing {celestial_obj} from queue.", 40)
         return None, celestial_obj
     try:
-        location = {
-            "lon": Const.LONGITUDE,
-            "lat": Const.LATITUDE,
-            "elevation": (Const.ELEVATION / 1000.0),
-        }
-        startdate = f"{Const.START_YEAR}-{Const.START_MONTH}-{Const.START_DAY}"
-        starttime = Const.START_TIME
-        enddate = f"{Const.END_YEAR}-{Const.END_MONTH}-{Const.END_DAY}"
-        endtime = Const.END_TIME
-        obj = Horizons(
-            id=obj_code,
-            location=location,
-            epochs={
-                "start": f"{startdate} {starttime}",
-                "stop": f"{enddate} {endtime}",
-                "step": "15m",
-            },
-            id_type="id",
-        )
-    except KeyError:
-        Logger.log("Error with key raised by JPL Horizons.", 40)
-        Logger.log(f"Removing {celestial_obj} from queue.")
-        return None, celestial_obj
-    except ValueError as e:
-        Logger.log("Encountered an value error.", 40)
-        Logger.log(f"{str(e)}", 50)
-        Logger.log(f"Removing {celestial_obj} from queue.", 40)
-        return None, celestial_obj
-    except Exception as e:
-        Logger.log("Unknown error raised by JPL Horizons.", 40)
+        return to_ephemeris(celestial_obj, _sample(obj_code, celestial_obj)), None
+    except requests.exceptions.RequestException as e:
+        Logger.log(f"JPL Horizons query for {celestial_obj} failed!", 40)
         Logger.log(f"{str(e)}", 40)
+        return None, None
+    # Only the failures of Horizons to resolve the body are kept by _sample,
+    # the body is queried again by the next run
+    except Exception as e:
+        Logger.log(f"Unable to compute the ephemeris of {celestial_obj}!", 40)
+        Logger.log(f"{type(e).__name__}: {str(e)}", 40)
         Logger.log(f"Removing {celestial_obj} from queue.", 40)
-        return None, celestial_obj
+        return None, None
+
 
-    eph = obj.ephemerides()[
-        "datetime_str",
-        "RA",
-        "DEC",
-        "AZ",
-        "EL",
-        "V",
-        "delta",
-        "illumination",
-        "constellation",
-    ]
-    const_abbrvs = json.loads(
-        open(Path(Const.ROOT_DIR, "data", "ConstellAbbrevs.json"), "r").read()
+def window_minutes() -> tuple:
+    """
+    :return: Tuple of the start and end of the time range in unix minutes.
+    """
+    start = Time(
+        f"{Const.START_YEAR}-{Const.START_MONTH}-{Const.START_DAY} {Const.START_TIME}"
     )
-    time_ra_dec = dict()
-    time_ra_dec[celestial_obj] = dict()
-    mag_list = list()
-    distance_list = list()
-    for index in range(len(eph["datetime_str"])):
-        if index == 0:
-            ra = eph["RA"][index]
-            dec = eph["DEC"][index]
-            time_ra_dec[celestial_obj]["Coordinates"] = {"ra": ra, "dec": dec}
-        row_time = eph["datetime_str"][index]
-        row_az = eph["AZ"][index]
-        row_alt = eph["EL"][index]
-        row_mag = eph["V"][index]
-        mag_list.append(row_mag)
-        row_delta = float(eph["delta"][index])
-        row_delta = row_delta * 0.000149597870691
-        distance_list.append(row_delta)
-        row_constellation = const_abbrvs[str(eph["constellation"][index]).lower()]
-        row_illumination = eph["illumination"][index]
-        time_ra_dec[celestial_obj]["Constellation"] = row_constellation
-        time_ra_dec[celestial_obj][row_time] = {
+    end = Time(f"{Const.END_YEAR}-{Const.END_MONTH}-{Const.END_DAY} {Const.END_TIME}")
+    return start.unix / 60.0, max(start.unix, end.unix) / 60.0
+
+
+def window_epochs(step: int) -> list:
+    """
+    :param step: Minutes between the rows.
+    :return: Unix minutes of the grid of the step covering the time range
+             with one more row on both sides, the times of the rows of the
+             ephemerides.
+    """
+    start, end = window_minutes()
+    first = int(np.floor(start / step)) * step - step
+    last = int(np.ceil(end / step)) * step + step
+    return list(range(first, last + 1, step))
+
+
+def _sample(obj_code: str, celestial_obj: str) -> dict:
+    """
+    Sample the ephemeris of a body with the coarsest step interpolating it
+    within Const.EPHEMERIS_TOLERANCE, from the cache or JPL Horizons.
+
+    :param obj_code: JPL code of the body.
+    :param celestial_obj: Name of the body, for the log.
+    :return: Table of the rows, as taken by to_ephemeris.
+    """
+    site = f"{Const.LATITUDE},{Const.LONGITUDE},{Const.ELEVATION}"
+    start, end = window_minutes()
+    step = choose_step(Const.EPHEMERIS_TOLERANCE, end - start)
+    cache = get_cache()
+    while True:
+        epochs = window_epochs(step)
+        # Only the rows missing from the cache are queried
+        rows = cache.get_ephemeris(obj_code, site, step, epochs[0], epochs[-1])
+        missing = [epoch for epoch in epochs if epoch not in rows]
+        tables = [_from_rows(rows)]
+        for range_first, range_last in _to_ranges(missing, step):
+            try:
+                fetched = _fetch_table(obj_code, range_first, range_last, step)
+            # Raised for unknown or ambiguous targets and missing columns
+            except (KeyError, ValueError) as e:
+                Logger.log(f"JPL Horizons could not resolve {celestial_obj}!", 40)
+                # Skipped by the next runs until the failure expires
+                cache.put_failures(
+                    "horizons", {celestial_obj: str(e) or type(e).__name__}
+                )
+                raise
+            cache.put_ephemeris(obj_code, site, step, _to_rows(fetched))
+            tables.append(fetched)
+        Logger.log(
+            f"Found {len(epochs) - len(missing)} of {len(epochs)} ephemeris rows "
+            + f"of {celestial_obj} every {step} minutes in the cache."
+        )
+        table = _merge(tables, epochs)
+        error = interpolation_error(table)
+        if error <= Const.EPHEMERIS_TOLERANCE or finer_step(step) is None:
+            return table
+        Logger.log(
+            f"Interpolating {celestial_obj} every {step} minutes errs by up to "
+            + f"{error:.3f} degrees, sampling it more finely...",
+            10,
+        )
+        step = finer_step(step)
+
+
+def to_ephemeris(celestial_obj: str, table: dict) -> dict:
+    """
+    Build the ephemeris of an object from its table and write its data file.
+
+    :param celestial_obj: Name of the object.
+    :param table: Dictionary of the `epoch` (unix minutes), NUMERIC_COLUMNS
+                  and `constellation` (abbreviations) columns as arrays.
+    :return: Dictionary of the name of the object to its ephemeris.
+    """
+    startdate = f"{Const.START_YEAR}-{Const.START_MONTH}-{Const.START_DAY}"
+    starttime = Const.START_TIME
+    enddate = f"{Const.END_YEAR}-{Const.END_MONTH}-{Const.END_DAY}"
+    endtime = Const.END_TIME
+
+    epochs = np.asarray(table["epoch"], dtype=float)
+    magnitude = np.asarray(table["V"], dtype=float)
+    distance = np.asarray(table["delta"], dtype=float) * AU_TO_PM
+    ephemeris = dict()
+    # Values at the exact start and end of the time range
+    interpolator = EphemerisInterpolator(table, NUMERIC_COLUMNS)
+    endpoints = dict()
+    for key, epoch in zip(("Start", "End"), window_minutes()):
+        values = interpolator(epoch)
+        endpoints[key] = {
+            name: _to_list([values[column]])[0]
+            for name, column in (
+                ("ra", "RA"),
+                ("dec", "DEC"),
+                ("az", "AZ"),
+                ("alt", "EL"),
+                ("Brightness", "V"),
+                ("Illumination", "illumination"),
+            )
+        }
+        endpoints[key]["Distance"] = _to_list([values["delta"] * AU_TO_PM])[0]
+    if len(epochs) > 0:
+        ephemeris["Coordinates"] = {
+            "ra": endpoints["Start"]["ra"],
+            "dec": endpoints["Start"]["dec"],
+        }
+        # Only the constellation of the last row is reported
+        const_abbrvs = get_map(Const.ROOT_DIR, "ConstellAbbrevs.json")
+        ephemeris["Constellation"] = const_abbrvs[
+            str(table["constellation"][-1]).lower()
+        ]
+
+    # The dictionaries are only built for the output
+    row_times = Time(epochs * 60.0, format="unix").strftime("%Y-%b-%d %H:%M")
+    for row_time, row_az, row_alt, row_mag, row_delta, row_illumination in zip(
+        np.atleast_1d(row_times).tolist(),
+        _to_list(table["AZ"]),
+        _to_list(table["EL"]),
+        _to_list(magnitude),
+        _to_list(distance),
+        _to_list(table["illumination"]),
+    ):
+        ephemeris[row_time] = {
             "az": row_az,
             "alt": row_alt,
             "Brightness": row_mag,
@@ -114,8 +205,17 @@ def ephemeris_query(celestial_obj: str) -> tuple:
             "Illumination": row_illumination,
         }
 
-    time_ra_dec[celestial_obj]["Brightness"] = round(median(mag_list), 1)
-    time_ra_dec[celestial_obj]["Distance"] = round(median(distance_list), 8)
+    ephemeris.update(endpoints)
+
+    # Masked magnitudes are left out
+    ephemeris["Brightness"] = (
+        round(float(np.nanmedian(magnitude)), 1)
+        if np.any(np.isfinite(magnitude))
+        else "-"
+    )
+    ephemeris["Distance"] = (
+        round(float(np.median(distance)), 8) if len(distance) > 0 else "-"
+    )
 
     with open(
         Path(
@@ -125,5 +225,119 @@ def ephemeris_query(celestial_obj: str) -> tuple:
         ),
         "w",
     ) as json_out:
-        json.dump(time_ra_dec[celestial_obj], json_out, indent=4)
-    return time_ra_dec, None
+        json.dump(ephemeris, json_out, indent=4)
+    return {celestial_obj: ephemeris}
+
+
+def _to_ranges(epochs: list, step: int) -> list:
+    """
+    Group sorted epochs into runs of consecutive steps.
+
+    :param epochs: Sorted unix minutes on the grid of the step.
+    :param step: Minutes between the rows.
+    :return: List of the first and last unix minute of every run.
+    """
+    ranges = list()
+    for epoch in epochs:
+        if len(ranges) > 0 and epoch - ranges[-1][1] == step:
+            ranges[-1][1] = epoch
+        else:
+            ranges.append([epoch, epoch])
+    return [tuple(epoch_range) for epoch_range in ranges]
+
+
+def _fetch_table(obj_code: str, first: int, last: int, step: int) -> dict:
+    """
+    Query JPL Horizons for the rows of a body between two epochs.
+
+    :param obj_code: JPL code of the body.
+    :param first: Unix minute of the first row.
+    :param last: Unix minute of the last row.
+    :param step: Minutes between the rows.
+    :return: Table of the rows, as taken by to_ephemeris.
+    """
+    location = {
+        "lon": Const.LONGITUDE,
+        "lat": Const.LATITUDE,
+        "elevation": (Const.ELEVATION / 1000.0),
+    }
+    # Horizons needs the stop after the start
+    last = max(last, first + step)
+    obj = Horizons(
+        id=obj_code,
+        location=location,
+        epochs={
+            "start": time.strftime("%Y-%m-%d %H:%M", time.gmtime(first * 60)),
+            "stop": time.strftime("%Y-%m-%d %H:%M", time.gmtime(last * 60)),
+            "step": f"{step}m",
+        },
+        id_type="id",
+    )
+    # Pooled, rate limited and retried connections
+    obj._session = get_session("horizons")
+    eph = obj.ephemerides()
+    table = {
+        "epoch": np.rint(
+            (np.asarray(eph["datetime_jd"], dtype=float) - 2440587.5) * 1440
+        ).astype(int),
+        "constellation": np.asarray(eph["constellation"], dtype=str),
+    }
+    for column in NUMERIC_COLUMNS:
+        table[column] = np.ma.filled(np.ma.asarray(eph[column], dtype=float), np.nan)
+    return table
+
+
+def _from_rows(rows: dict) -> dict:
+    """
+    :param rows: Dictionary of the unix minutes to the rows stored in the cache.
+    :return: Table of the rows, as taken by to_ephemeris.
+    """
+    epochs = sorted(rows)
+    table = {
+        "epoch": np.array(epochs, dtype=int),
+        "constellation": np.array(
+            [rows[epoch]["constellation"] for epoch in epochs], dtype=str
+        ),
+    }
+    for column in NUMERIC_COLUMNS:
+        # Masked values are stored as None
+        table[column] = np.array([rows[epoch][column] for epoch in epochs], dtype=float)
+    return table
+
+
+def _to_rows(table: dict) -> dict:
+    """
+    :param table: Table of the rows, as taken by to_ephemeris.
+    :return: Dictionary of the unix minutes to the rows stored in the cache.
+    """
+    columns = {column: _to_list(table[column]) for column in NUMERIC_COLUMNS}
+    columns["constellation"] = np.asarray(table["constellation"]).tolist()
+    return {
+        epoch: {column: values[row] for column, values in columns.items()}
+        for row, epoch in enumerate(np.asarray(table["epoch"]).tolist())
+    }
+
+
+def _merge(tables: list, epochs: list) -> dict:
+    """
+    :param tables: Tables to merge.
+    :param epochs: Unix minutes of the rows to keep.
+    :return: Table of the rows of the epochs, sorted by epoch.
+    """
+    merged = {
+        column: np.concatenate([table[column] for table in tables])
+        for column in tables[0]
+    }
+    # Rows fetched beyond the range or twice are dropped
+    _, rows = np.unique(merged["epoch"], return_index=True)
+    rows = rows[np.isin(merged["epoch"][rows], epochs)]
+    return {column: values[rows] for column, values in merged.items()}
+
+
+def _to_list(values) -> list:
+    """
+    :param values: Array of floats.
+    :return: List of the values with None for NaN, which JSON does not allow.
+    """
+    values = np.asarray(values, dtype=float)
+    return np.where(np.isnan(values), None, values).tolist()
@@ -0,0 +1,183 @@
+"""This module computes the ephemerides of the Sun, the Moon and the planets
+locally with astropy, in the same form as ephemeris_query builds them from JPL
+Horizons, so they need no network access."""
+import astropy.units as u
+import numpy as np
+from astropy.coordinates import (
+    AltAz,
+    CartesianRepresentation,
+    EarthLocation,
+    SkyCoord,
+    get_constellation,
+)
+from astropy.time import Time
+
+from .astro_info import get_bodies
+from .catalog_parse import get_map
+from .const import Const
+from .interpolation import choose_step, finer_step, interpolation_error
+from .jpl_horizons_query import to_ephemeris, window_epochs, window_minutes
+from .logger import Logger
+
+# JPL codes of the bodies astropy computes to their astropy names
+BODIES = {
+    "10": "sun",
+    "199": "mercury",
+    "299": "venus",
+    "301": "moon",
+    "499": "mars",
+    "599": "jupiter",
+    "699": "saturn",
+    "799": "uranus",
+    "899": "neptune",
+}
+
+# V magnitude at 1 AU from the Sun and the observer and the coefficients of
+# the powers 1 to 4 of the phase angle in degrees (Astronomical Almanac,
+# Allen for the Moon)
+MAGNITUDES = {
+    "mercury": (-0.42, (0.0380, -0.000273, 0.000002, 0.0)),
+    "venus": (-4.40, (0.0009, 0.000239, -0.00000065, 0.0)),
+    "moon": (0.21, (0.026, 0.0, 0.0, 4e-9)),
+    "mars": (-1.52, (0.016, 0.0, 0.0, 0.0)),
+    "jupiter": (-9.40, (0.005, 0.0, 0.0, 0.0)),
+    "saturn": (-8.88, (0.044, 0.0, 0.0, 0.0)),
+    "uranus": (-7.19, (0.002, 0.0, 0.0, 0.0)),
+    "neptune": (-6.87, (0.0, 0.0, 0.0, 0.0)),
+}
+
+# V magnitude of the Sun at 1 AU
+SUN_MAGNITUDE = -26.74
+
+
+def local_bodies(celestial_objs: list) -> dict:
+    """
+    :param celestial_objs: Names of the objects.
+    :return: Dictionary of the names astropy can compute to their astropy names.
+    """
+    jplcodes = get_map(Const.ROOT_DIR, "jplcodes.json")
+    bodies = dict()
+    for celestial_obj in celestial_objs:
+        try:
+            obj_code = jplcodes[celestial_obj.lower()]
+        except KeyError:
+            continue
+        if obj_code in BODIES:
+            bodies[celestial_obj] = BODIES[obj_code]
+    return bodies
+
+
+def local_ephemeris(celestial_objs: list) -> dict:
+    """
+    Compute the ephemerides of the objects astropy knows, for every body and
+    time step of the range at once, with `Const.LOCAL_EPHEMERIS`.
+
+    :param celestial_objs: Names of the objects, the ones astropy does not
+                           know are left out.
+    :return: Dictionary of the names of the objects to their ephemeris, as
+             returned by ephemeris_query.
+    """
+    bodies = local_bodies(celestial_objs)
+    if len(bodies) == 0:
+        return dict()
+    Logger.log(f"Computing the ephemerides of {len(bodies)} bodies locally...")
+    start, end = window_minutes()
+    step = choose_step(Const.EPHEMERIS_TOLERANCE, end - start)
+    while True:
+        tables = _compute(bodies, window_epochs(step))
+        if len(tables) == 0:
+            return dict()
+        error = max(interpolation_error(table) for table in tables.values())
+        if error <= Const.EPHEMERIS_TOLERANCE or finer_step(step) is None:
+            break
+        step = finer_step(step)
+
+    ephemeris = dict()
+    for celestial_obj, table in tables.items():
+        ephemeris.update(to_ephemeris(celestial_obj, table))
+    Logger.log(
+        f"Computed the ephemerides of {len(bodies)} bodies locally every {step} minutes!"
+    )
+    return ephemeris
+
+
+def _compute(bodies: dict, epochs: list) -> dict:
+    """
+    :param bodies: Dictionary of the names of the objects to their astropy names.
+    :param epochs: Unix minutes of the rows.
+    :return: Dictionary of the names of the objects to their tables, as taken
+             by to_ephemeris, empty if the ephemeris could not compute them all.
+    """
+    times = Time(np.array(epochs, dtype=float) * 60.0, format="unix")
+    location = EarthLocation.from_geodetic(
+        lon=(Const.LONGITUDE * u.deg),
+        lat=(Const.LATITUDE * u.deg),
+        height=(Const.ELEVATION * u.m),
+    )
+    # The kernel of Const.LOCAL_EPHEMERIS is only loaded once per process
+    computed = get_bodies(["sun"] + list(bodies.values()), times, location)
+    if len(computed) < len(set(bodies.values()) | {"sun"}):
+        # JPL Horizons is queried for all of them instead
+        return dict()
+    sun = computed["sun"]
+    positions = [computed[body] for body in bodies.values()]
+
+    # One topocentric frame with a row per body and a column per time step
+    observer_body = np.stack(
+        [position.cartesian.xyz.to_value(u.au) for position in positions], axis=1
+    )
+    coordinates = sun.frame.realize_frame(CartesianRepresentation(observer_body * u.au))
+    altaz = coordinates.transform_to(AltAz(obstime=times, location=location))
+    ra = coordinates.spherical.lon.deg
+    dec = coordinates.spherical.lat.deg
+    # The constellation lookup only takes flat coordinates
+    constellations = get_constellation(
+        SkyCoord(ra=ra.ravel() * u.deg, dec=dec.ravel() * u.deg), short_name=True
+    ).reshape(ra.shape)
+
+    # Phase angle between the directions of the Sun and the observer
+    observer_sun = sun.cartesian.xyz.to_value(u.au)[:, np.newaxis, :]
+    body_sun = observer_sun - observer_body
+    delta = np.linalg.norm(observer_body, axis=0)
+    sun_distance = np.linalg.norm(body_sun, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cos_phase = np.sum(-observer_body * body_sun, axis=0) / (delta * sun_distance)
+    phase = np.degrees(np.arccos(np.clip(np.nan_to_num(cos_phase, nan=1.0), -1, 1)))
+    illumination = (1.0 + np.cos(np.radians(phase))) / 2.0 * 100.0
+
+    tables = dict()
+    for row, (celestial_obj, body) in enumerate(bodies.items()):
+        magnitude = _magnitude(body, sun_distance[row], delta[row], phase[row])
+        tables[celestial_obj] = {
+            "epoch": np.array(epochs),
+            "RA": ra[row],
+            "DEC": dec[row],
+            "AZ": altaz.az.deg[row],
+            "EL": altaz.alt.deg[row],
+            "V": magnitude,
+            "delta": delta[row],
+            "illumination": illumination[row],
+            "constellation": constellations[row],
+        }
+    return tables
+
+
+def _magnitude(body: str, sun_distance, delta, phase) -> np.ndarray:
+    """
+    :param body: Astropy name of the body.
+    :param sun_distance: Distances to the Sun in AU.
+    :param delta: Distances to the observer in AU.
+    :param phase: Phase angles in degrees.
+    :return: Array of the V magnitudes.
+    """
+    if body == "sun":
+        return SUN_MAGNITUDE + 5.0 * np.log10(delta)
+    absolute, coefficients = MAGNITUDES[body]
+    return (
+        absolute
+        + 5.0 * np.log10(sun_distance * delta)
+        + sum(
+            coefficient * phase ** (power + 1)
+            for power, coefficient in enumerate(coefficients)
+        )
+    )
@@ -0,0 +1,59 @@
+"""This module holds the site and time window shared by a whole run."""
+import astropy.units as u
+from astroplan import Observer
+from astropy.coordinates import AltAz, EarthLocation
+from astropy.time import Time
+from numpy import linspace
+
+from .const import Const
+
+
+class ObservingContext(object):
+    """
+    Location, parsed times and AltAz frames of the observing window.
+
+    Built once per run from the values in Const so every visibility check,
+    ephemeris lookup and plot reuses the same objects instead of rebuilding
+    them per call.
+    """
+
+    def __init__(self, step_minutes=15):
+        """
+        :param step_minutes: Minutes between the samples of the time grid.
+        """
+        self.location = EarthLocation.from_geodetic(
+            lon=(Const.LONGITUDE * u.deg),
+            lat=(Const.LATITUDE * u.deg),
+            height=(Const.ELEVATION * u.m),
+        )
+        self.observer = Observer(
+            location=self.location, name="location", timezone="UTC"
+        )
+        self.start_time = Time(
+            f"{Const.START_YEAR}-"
+            + f"{Const.START_MONTH}-"
+            + f"{Const.START_DAY} "
+            + f"{Const.START_TIME}",
+            format="iso",
+        )
+        self.end_time = Time(
+            f"{Const.END_YEAR}-"
+            + f"{Const.END_MONTH}-"
+            + f"{Const.END_DAY} "
+            + f"{Const.END_TIME}",
+            format="iso",
+        )
+        # Start and end times as one array so both are transformed at once
+        self.times = Time([self.start_time, self.end_time])
+        self.frame = AltAz(obstime=self.times, location=self.location)
+
+        delta_t = self.end_time - self.start_time
+        linspace_count = max(int(delta_t.to_value("min") / step_minutes), 2)
+        self.time_grid = self.start_time + delta_t * linspace(0, 1, linspace_count)
+        self.grid_frame = AltAz(obstime=self.time_grid, location=self.location)
+
+        # Identifies the site and window that ephemeris data was computed for
+        self.window_key = (
+            f"{self.start_time.isot}/{self.end_time.isot}@"
+            + f"{Const.LATITUDE},{Const.LONGITUDE},{Const.ELEVATION}"
+        )
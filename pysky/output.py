@@ -2,12 +2,8 @@
 
 from pathlib import Path
 
-import astropy.units as u
 import matplotlib.pyplot as plt
-from astroplan import Observer
 from astroplan.plots import plot_sky
-from astropy.time import Time
-from numpy import linspace
 
 from .const import Const
 from .html_list import HTML_list
@@ -31,32 +27,17 @@ def to_html_table(items: list, filename=""):
     html_table.dump(filename)
 
 
-def generate_plot(celestial_obj):
+def generate_plot(celestial_obj, context: object):
     """
     Generate the plot of the given target.
 
     :param celestial_obj: FixedTarget object to find.
+    :param context: ObservingContext of the run.
     """
-    
+
     Logger.log(f"Generating plot for {celestial_obj.name}")
     plt.figure(figsize=(8, 6))
-    location = Observer(
-        longitude=Const.LONGITUDE * u.deg,
-        latitude=Const.LATITUDE * u.deg,
-        elevation=Const.ELEVATION * u.m,
-        name="location",
-        timezone="UTC",
-    )
-    start_time = Time(
-        f"{Const.START_YEAR}-{Const.START_MONTH}-{Const.START_DAY} {Const.START_TIME}"
-    )
-    end_time = Time(
-        f"{Const.END_YEAR}-{Const.END_MONTH}-{Const.END_DAY} {Const.END_TIME}"
-    )
-    delta_t = end_time - start_time
-    linspace_count = int(delta_t.to_value("min") / 15)
-    time_range = start_time + delta_t * linspace(0, 1, linspace_count)
-    plot_sky(celestial_obj, location, time_range)
+    plot_sky(celestial_obj, context.observer, context.time_grid)
     plt.legend(loc="lower left", bbox_to_anchor=(0.85, 0.0))
     plt.savefig(
         Path(
@@ -1,13 +1,12 @@
 """This module is called at application launch and checks for user
 preferences and applies the cache rules to the cache file and saves it"""
-import json
 import os.path
 from pathlib import Path
 
-from tqdm import tqdm
-
+from .cache import get_cache
 from .const import Const
 from .logger import Logger
+from .skyview import evict_images
 
 
 def check_integrity():
@@ -19,24 +18,15 @@ def check_integrity():
     Logger.log("Checking for data directory...")
     if not os.path.isdir(Path(Const.ROOT_DIR, "data")):
         Logger.log("Data directory not found.", 30)
-        Logger.log("Creating data directory and cache file...", 30)
+        Logger.log("Creating data directory...", 30)
         os.makedirs(Path(Const.ROOT_DIR, "data"))
-        with open(Path(Const.ROOT_DIR, "data", "cache"), "w") as cache_file:
-            cache_file.write("{}")
-        Logger.log("Data directory and cache file created!")
-
+        Logger.log("Data directory created!")
     else:
         Logger.log("Data directory found!")
-        Logger.log("Checking for cache file...")
-        if os.path.isfile(Path(Const.ROOT_DIR, "data", "cache")):
-            Logger.log("Cache file found!")
-            clean_cache()
-        else:
-            Logger.log("Cache file not found.", 30)
-            Logger.log("Creating cache file...")
-            with open(Path(Const.ROOT_DIR, "data", "cache"), "w") as cache_file:
-                cache_file.write("{}")
-            Logger.log("Created cache file!")
+
+    # Opening the cache creates it or migrates it when needed
+    Logger.log("Opening cache...")
+    Logger.log(f"Cache opened with {len(get_cache())} objects!")
 
     Logger.log(
         f"Searching in `{Const.ROOT_DIR}/data/` " + "for `CaldwellCatalogue.json`..."
@@ -73,36 +63,20 @@ def check_integrity():
         Logger.log("MessierCatalogue.json was found!\n")
 
 
-def clean_cache():
+def clean_cache(window_key: str):
     """
-    Reads prefs files and calls the prune function to remove planets
+    Apply the expiry rules to the cache: remove the expired objects, the
+    ephemeris data of other sites and windows, the least recently used
+    objects beyond `Const.CACHE_MAX_OBJECTS`, the expired failures and the
+    expired SkyView images.
+
+    :param window_key: Site and window of the run, see ObservingContext.
     """
 
     Logger.log("Cleaning cache...")
-    try:
-        cache_file = json.loads(open(Path(Const.ROOT_DIR, "data", "cache"), "r").read())
-    except json.decoder.JSONDecodeError as json_dec_err:
-        Logger.log("\nError reading cache file.", 40)
-        Logger.log(f"Generating emptying cache...\n{str(json_dec_err)}\n", 40)
-        with open(Path(Const.ROOT_DIR, "data", "cache"), "w") as cache_file:
-            cache_file.write("{}")
-            Logger.log("Created cache file!")
-        return
-
-    cache_file_aux = dict()
-
-    # Iterate over the cache file looking for non-planets
-    for celestial_object, attributes in tqdm(cache_file.items()):
-        for key, value in tqdm(attributes.items()):
-            # Non-planet found adding to auxiliary dictionary
-            if key == "type" and value != "planet":
-                cache_file_aux[celestial_object] = attributes
-    Logger.log("Cache cleaned!\n")
-
-    Logger.log("Saving changes to cache file...")
-    with open(Path(Const.ROOT_DIR, "data", "cache"), "w") as json_out:
-        json.dump(cache_file_aux, json_out, indent=4, sort_keys=True)
-        Logger.log("Changes saved to cache file!\n")
+    evicted = get_cache().evict(window_key)
+    images = evict_images()
+    Logger.log(f"Cache cleaned, evicted {evicted} objects and {images} images!\n")
 
 
 def read_user_prefs():
@@ -131,16 +105,48 @@ def read_user_prefs():
             if len(line.strip()) > 0 and line.strip()[0] != "#":
                 if "slideshow_dir" in line.strip().lower():
                     user_save_loc = line.strip().split("=")[1].strip()
+                elif line.strip().replace(" ", "").lower().startswith("catalog="):
+                    catalog = line.strip().split("=", 1)[1].strip()
+                    if catalog not in Const.CATALOGS:
+                        Const.CATALOGS = Const.CATALOGS + [catalog]
                 elif "latitude" in line.strip().lower():
                     Const.LATITUDE = float(line.strip().split("=")[1].strip())
                 elif "longitude" in line.strip().lower():
                     Const.LONGITUDE = float(line.strip().split("=")[1].strip())
                 elif "elevation" in line.strip().lower():
                     Const.ELEVATION = float(line.strip().split("=")[1].strip())
+                elif "cache_ttl_days=" in line.strip().replace(" ", "").lower():
+                    Const.CACHE_TTL_DAYS = float(line.strip().split("=")[1].strip())
+                elif "cache_max_objects=" in line.strip().replace(" ", "").lower():
+                    Const.CACHE_MAX_OBJECTS = int(line.strip().split("=")[1].strip())
+                elif "failure_ttl_days=" in line.strip().replace(" ", "").lower():
+                    Const.FAILURE_TTL_DAYS = float(line.strip().split("=")[1].strip())
+                elif "skyview_concurrency=" in line.strip().replace(" ", "").lower():
+                    Const.SKYVIEW_CONCURRENCY = int(line.strip().split("=")[1].strip())
+                elif "http_timeout=" in line.strip().replace(" ", "").lower():
+                    Const.HTTP_TIMEOUT = float(line.strip().split("=")[1].strip())
+                elif "http_retries=" in line.strip().replace(" ", "").lower():
+                    Const.HTTP_RETRIES = int(line.strip().split("=")[1].strip())
                 elif "v=" in line.strip().replace(" ", "").lower():
                     Const.MIN_V = float(line.strip().split("=")[1].strip())
                 elif "secz_max=" in line.strip().replace(" ", "").lower():
                     Const.SECZ_MAX = float(line.strip().split("=")[1].strip())
+                elif "ephemeris_engine=" in line.strip().replace(" ", "").lower():
+                    # The command line option takes precedence
+                    if Const.EPHEMERIS_ENGINE == "":
+                        Const.EPHEMERIS_ENGINE = (
+                            line.strip().split("=")[1].strip().lower()
+                        )
+                elif "ephemeris_tolerance=" in line.strip().replace(" ", "").lower():
+                    Const.EPHEMERIS_TOLERANCE = float(
+                        line.strip().split("=")[1].strip()
+                    )
+                elif "local_ephemeris=" in line.strip().replace(" ", "").lower():
+                    Const.LOCAL_EPHEMERIS = line.strip().split("=", 1)[1].strip()
+                elif "engine=" in line.strip().replace(" ", "").lower():
+                    # The command line option takes precedence
+                    if Const.ENGINE == "":
+                        Const.ENGINE = line.strip().split("=")[1].strip().lower()
                 else:
                     if "," not in line.strip():
                         user_objs.append(line.strip())
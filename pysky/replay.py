@@ -0,0 +1,324 @@
+"""This module records the responses of the remote services into a corpus and
+serves them back, so whole runs can be repeated and timed without the network.
+
+The HTTP sessions of http_client hand every request to this module when
+`Const.NETWORK_MODE` is "record" or "replay". The same corpus can also be
+served by a local stand-in server, which the sessions are pointed at with
+`Const.STAND_IN_URL`, so runs go through real sockets and connection pools.
+In replay mode and in the stand-in server a latency and a rate of failed
+(503) responses can be injected, both drawn from a seeded generator.
+
+Invoke as `python -m pysky.replay [--port PORT] [--latency SECONDS]
+[--failure-rate RATE] [CORPUS]' to run a stand-in server.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .const import Const
+from .logger import Logger
+
+# Header carrying the original URL of a request sent to the stand-in server
+ORIGINAL_URL_HEADER = "X-Pysky-Original-Url"
+
+# Headers that no longer match a recorded body once it is decoded
+SKIPPED_HEADERS = (
+    "content-encoding",
+    "content-length",
+    "transfer-encoding",
+    "connection",
+)
+
+_RANDOM = random.Random(0)
+_RANDOM_LOCK = threading.Lock()
+
+
+def corpus_dir() -> Path:
+    """
+    :return: Directory of the corpus, `data/replay` unless Const.REPLAY_DIR is set.
+    """
+    if Const.REPLAY_DIR != "":
+        return Path(Const.REPLAY_DIR)
+    return Path(Const.ROOT_DIR, "data", "replay")
+
+
+def request_key(method: str, url: str, body, content_type=None) -> str:
+    """
+    :param method: HTTP method of the request.
+    :param url: URL of the request.
+    :param body: Body of the request, None, str or bytes.
+    :param content_type: Content-Type header of the request, form bodies are
+                         keyed on their fields so the random boundary of a
+                         multipart body does not change the key.
+    :return: SHA-256 identifying the request in the corpus.
+    """
+    digest = hashlib.sha256(f"{method.upper()} {url}\n".encode("utf-8"))
+    if body is not None:
+        body = body.encode("utf-8") if isinstance(body, str) else body
+        fields = _form_fields(body, content_type or "")
+        if fields is None:
+            digest.update(body)
+        else:
+            for name, content in fields:
+                digest.update(b"%d:%s%d:%s" % (len(name), name, len(content), content))
+    return digest.hexdigest()
+
+
+def record(request, response: requests.Response, service: str) -> None:
+    """
+    Store a live response in the corpus, reading its whole body.
+
+    :param request: PreparedRequest that was sent.
+    :param response: Response received.
+    :param service: Name of the service of the request.
+    """
+    key = request_key(
+        request.method,
+        _original_url(request),
+        request.body,
+        request.headers.get("Content-Type"),
+    )
+    directory = Path(corpus_dir(), service)
+    os.makedirs(directory, exist_ok=True)
+    _write_atomic(Path(directory, f"{key}.body"), response.content)
+    entry = {
+        "method": request.method,
+        "url": _original_url(request),
+        "status": response.status_code,
+        "reason": response.reason,
+        "headers": {
+            name: value
+            for name, value in response.headers.items()
+            if name.lower() not in SKIPPED_HEADERS
+        },
+    }
+    _write_atomic(
+        Path(directory, f"{key}.json"), json.dumps(entry, indent=4).encode("utf-8")
+    )
+
+
+def lookup(method: str, url: str, body, content_type=None) -> tuple:
+    """
+    Find a recorded response.
+
+    :param method: HTTP method of the request.
+    :param url: Original URL of the request.
+    :param body: Body of the request.
+    :param content_type: Content-Type header of the request.
+    :return: Tuple of the recorded entry and body, or (None, None).
+    """
+    key = request_key(method, url, body, content_type)
+    for directory in Path(corpus_dir()).glob("*"):
+        entry_path = Path(directory, f"{key}.json")
+        if entry_path.is_file():
+            with open(entry_path, "r") as entry_file:
+                entry = json.loads(entry_file.read())
+            with open(Path(directory, f"{key}.body"), "rb") as body_file:
+                return entry, body_file.read()
+    return None, None
+
+
+def respond(request) -> requests.Response:
+    """
+    Answer a request from the corpus, after the injected latency and failures.
+
+    :param request: PreparedRequest to answer.
+    :return: The recorded response, or a 503 response for an injected failure.
+    :raises requests.exceptions.ConnectionError: If the request was never recorded.
+    """
+    failed = inject_faults()
+    url = _original_url(request)
+    if failed:
+        return _build_response(request, 503, "Injected failure", dict(), b"")
+    entry, body = lookup(
+        request.method, url, request.body, request.headers.get("Content-Type")
+    )
+    if entry is None:
+        raise requests.exceptions.ConnectionError(
+            f"No recorded response for {request.method} {url}", request=request
+        )
+    return _build_response(
+        request, entry["status"], entry["reason"], entry["headers"], body
+    )
+
+
+def inject_faults() -> bool:
+    """
+    Wait for the injected latency and draw an injected failure.
+
+    :return: True if the request has to fail.
+    """
+    if Const.REPLAY_LATENCY > 0:
+        time.sleep(Const.REPLAY_LATENCY)
+    if Const.REPLAY_FAILURE_RATE <= 0:
+        return False
+    with _RANDOM_LOCK:
+        return _RANDOM.random() < Const.REPLAY_FAILURE_RATE
+
+
+def to_stand_in(request):
+    """
+    Point a request at the stand-in server.
+
+    :param request: PreparedRequest to the real service.
+    :return: Copy of the request sent to Const.STAND_IN_URL.
+    """
+    stand_in = request.copy()
+    path = request.path_url
+    stand_in.url = Const.STAND_IN_URL.rstrip("/") + path
+    stand_in.headers[ORIGINAL_URL_HEADER] = request.url
+    return stand_in
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Answer the requests sent to the stand-in server from the corpus.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._answer()
+
+    def do_POST(self):
+        self._answer()
+
+    def _answer(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length > 0 else None
+        url = self.headers.get(ORIGINAL_URL_HEADER, self.path)
+        if inject_faults():
+            self._send(503, dict(), b"")
+            return
+        entry, recorded = lookup(
+            self.command, url, body, self.headers.get("Content-Type")
+        )
+        if entry is None:
+            Logger.log(f"No recorded response for {self.command} {url}", 30)
+            self._send(404, dict(), b"")
+            return
+        self._send(entry["status"], entry["headers"], recorded)
+
+    def _send(self, status: int, headers: dict, body: bytes):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        Logger.log(f"Stand-in server: {format % args}", 10)
+
+
+class StandInServer(socketserver.ThreadingMixIn, HTTPServer):
+    """
+    HTTP server answering every request on its own thread, as the
+    ThreadingHTTPServer of Python 3.7 and later.
+    """
+
+    daemon_threads = True
+
+
+def serve(port=0) -> StandInServer:
+    """
+    Start a stand-in server answering from the corpus on a background thread.
+
+    :param port: Port to listen on, 0 for any free port.
+    :return: The running server, its URL is `http://127.0.0.1:{server.server_port}`.
+    """
+    server = StandInServer(("127.0.0.1", port), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    Logger.log(
+        f"Stand-in server for `{corpus_dir()}` listening on "
+        + f"http://127.0.0.1:{server.server_port}"
+    )
+    return server
+
+
+def _form_fields(body: bytes, content_type: str):
+    """
+    :param body: Body of a request.
+    :param content_type: Content-Type header of the request.
+    :return: Sorted list of the names and contents of the fields of a
+             multipart or urlencoded form as bytes, None for other bodies.
+    """
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type == "application/x-www-form-urlencoded":
+        return sorted(
+            (name.encode("utf-8"), value.encode("utf-8"))
+            for name, value in parse_qsl(
+                body.decode("utf-8", "replace"), keep_blank_values=True
+            )
+        )
+    if not media_type.startswith("multipart/"):
+        return None
+    boundary = re.search(r'boundary="?([^";]+)"?', content_type)
+    if boundary is None:
+        return None
+    fields = list()
+    for part in body.split(b"--" + boundary.group(1).encode("utf-8"))[1:]:
+        # The last delimiter ends with "--"
+        if part.startswith(b"--"):
+            break
+        headers, _, content = part.lstrip(b"\r\n").partition(b"\r\n\r\n")
+        name = re.search(rb'name="([^"]*)"', headers)
+        fields.append(
+            (b"" if name is None else name.group(1), content[: -len(b"\r\n")])
+        )
+    return sorted(fields)
+
+
+def _original_url(request) -> str:
+    return request.headers.get(ORIGINAL_URL_HEADER, request.url)
+
+
+def _build_response(request, status: int, reason: str, headers: dict, body: bytes):
+    response = requests.Response()
+    response.status_code = status
+    response.reason = reason
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.url = _original_url(request)
+    response.request = request
+    response._content = body
+    # The body is already in memory, iter_content reads from it
+    response._content_consumed = True
+    return response
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    temp_path = Path(f"{path}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(temp_path, "wb") as out_file:
+        out_file.write(data)
+    os.replace(temp_path, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a replay corpus over HTTP.")
+    parser.add_argument("corpus", nargs="?", default="", type=str)
+    parser.add_argument("--port", default=8000, type=int)
+    parser.add_argument("--latency", default=0.0, type=float)
+    parser.add_argument("--failure-rate", default=0.0, type=float)
+    args = parser.parse_args()
+    Const.REPLAY_DIR = args.corpus
+    Const.REPLAY_LATENCY = args.latency
+    Const.REPLAY_FAILURE_RATE = args.failure_rate
+    server = serve(args.port)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,229 +1,271 @@
 """This module retrieves basic data from simbad based on which itentifier is passed via the command line"""
-import json
-import re
-import sys
-from pathlib import Path
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import astroquery.simbad
 import astropy
-import requests
-from bs4 import BeautifulSoup
+import astropy.table
+import numpy as np
 
+from . import http_client
+from .cache import get_cache
+from .catalog_parse import get_map
 from .const import Const
 from .logger import Logger
 
+# Votable fields of the bulk query, main_id is always returned and its
+# Bayer or Flamsteed designation ends with the constellation
+BULK_FIELDS = ("otype(V)", "flux(V)", "ra(d)", "dec(d)", "plx", "typed_id")
 
-def get_classification(celestial_obj: str) -> str:
+# Columns of the bulk query for the older and newer astroquery field names
+BULK_COLUMNS = {
+    "main_id": ("MAIN_ID", "main_id"),
+    "otype": ("OTYPE_V", "otype(V)", "otype"),
+    "flux": ("FLUX_V", "V"),
+    "ra": ("RA_d", "ra"),
+    "dec": ("DEC_d", "dec"),
+    "parallax": ("PLX_VALUE", "plx_value"),
+    "typed_id": ("TYPED_ID", "user_specified_id"),
+}
+
+# Objects per bulk query, the chunks are resolved in parallel
+BULK_CHUNK = 100
+
+_CLIENTS = dict()
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_client(add_fields=(), remove_fields=()) -> astroquery.simbad.SimbadClass:
     """
-    Scrape the simbad website to get the object's classification.
+    Return the SIMBAD client configured with a set of votable fields, creating
+    it on the first call. Every field set has its own client so queries never
+    change the fields of the shared `Simbad` object and can run concurrently.
 
-    :param celestial_obj: name celestial object to retrieve the brightness of.
-    :return: the brightness of the passed celestial object.
+    :param add_fields: Votable fields to add to the default ones.
+    :param remove_fields: Votable fields to remove.
+    :return: The SimbadClass of the field set shared by the whole process.
     """
-    Logger.log(f"Retrieving classification for {celestial_obj}...")
-    regex = re.compile(r"\s*\r?\n")
-    endpoint = f"http://simbad.u-strasbg.fr/simbad/sim-basic?Ident={celestial_obj}&submit=SIMBAD+search"
-    web_data = requests.get(endpoint).text
-    soup = BeautifulSoup(web_data, "html.parser")
-    classification = soup.find("td", attrs={"id": "basic_data"}).find("font").text
-    if classification is not None:
-        Logger.log(f"Found classification for {celestial_obj}!")
-        classification = re.sub(regex, "", classification)
-        regex = re.compile(r"\(.*\)")
-        classification = re.sub(regex, "", classification)
-        return classification.split("--")[-1].strip()
-    Logger.log(f"Could not find classification for {celestial_obj}!", 30)
-    return "-"
-
-
-def get_brightness(celestial_obj: str) -> float:
+    key = (tuple(add_fields), tuple(remove_fields))
+    with _CLIENTS_LOCK:
+        if key not in _CLIENTS:
+            client = astroquery.simbad.SimbadClass()
+            # Pooled, rate limited and retried connections
+            client._session = http_client.get_session("simbad")
+            # Gives the client its own list of fields
+            client.reset_votable_fields()
+            if len(add_fields) > 0:
+                client.add_votable_fields(*add_fields)
+            if len(remove_fields) > 0:
+                client.remove_votable_fields(*remove_fields)
+            _CLIENTS[key] = client
+        return _CLIENTS[key]
+
+
+def resolve_objects(celestial_objs: list) -> astropy.table.Table:
     """
-    Make a request to the simbad website to retrieve a brightness.
-
-    :param celestial_obj: name celestial object to retrieve the brightness of.
-    :return: the brightness of the passed celestial object.
+    Resolve objects with one SIMBAD query for every property the cache needs,
+    instead of one query per property and object.
+
+    Objects without a V magnitude are queried once more as their `A`
+    component, since SIMBAD only has the magnitudes of the components of
+    some double and multiple stars.
+
+    :param celestial_objs: Names of the objects to resolve.
+    :return: Table of the resolved objects with the columns Name, Type,
+             Brightness (NaN if unknown), ra and dec (degrees), Distance
+             (Pm, NaN if unknown) and Constellation. Its `unresolved` meta
+             is the dictionary of the names SIMBAD does not know to the
+             reason, names of failed queries are left out of both and
+             recorded in the failures of the cache instead.
     """
+    celestial_objs = list(dict.fromkeys(celestial_objs))
+    resolved = astropy.table.Table(
+        names=("Name", "Type", "Brightness", "ra", "dec", "Distance", "Constellation"),
+        dtype=(str, str, float, float, float, float, str),
+    )
+    resolved.meta["unresolved"] = dict()
+    if len(celestial_objs) == 0:
+        return resolved
 
-    Logger.log(f"Retrieving brightness for {celestial_obj}...")
-
-    astroquery.simbad.Simbad.reset_votable_fields()
-    try:
-        # Add brightness column
-        astroquery.simbad.Simbad.add_votable_fields("flux(V)")
-
-        # Remove the other columns
-        astroquery.simbad.Simbad.remove_votable_fields("main_id")
-        astroquery.simbad.Simbad.remove_votable_fields("coordinates")
-
-        # Check result for "--"
-        if str(astroquery.simbad.Simbad.query_object(f"{celestial_obj}")[0][0]) == "--":
-            Logger.log(f"Could not find brightness for {celestial_obj}!", 30)
-            celestial_obj_aux = celestial_obj + "_A"
-            Logger.log(f"Attempting to find brightness for {celestial_obj_aux}!", 30)
-            BRIGHTNESS_FIELD = str(
-                astroquery.simbad.Simbad.query_object(celestial_obj_aux)[0][0]
-            )
-            brightness = float(BRIGHTNESS_FIELD)
-
-        else:
-            BRIGHTNESS_FIELD = str(
-                astroquery.simbad.Simbad.query_object(f"{celestial_obj}")[0][0]
-            )
-            brightness = float(BRIGHTNESS_FIELD)
-        # Return brightness
-        Logger.log(f"Retrieved brightness for {celestial_obj}!\n")
-        return brightness
+    Logger.log(f"Resolving {len(celestial_objs)} objects with simbad...")
+    rows, failed = _query_bulk(celestial_objs)
 
-    # Occurs when the object is not in SIMBADS's database
-    except TypeError as type_err:
+    faint = [obj for obj, row in rows.items() if np.isnan(row["flux"])]
+    if len(faint) > 0:
         Logger.log(
-            f"Error parsing the data for {celestial_obj}. "
-            + f"Simbad only contains info on stars.\n\n{str(type_err)}",
-            50,
+            f"Could not find brightness for {len(faint)} objects, "
+            + "attempting to find it for their A component!",
+            30,
         )
-
+        components = {f"{obj} A": obj for obj in faint}
+        for component, row in _query_bulk(list(components))[0].items():
+            rows[components[component]]["flux"] = row["flux"]
+
+    const_abbrvs = get_map(Const.ROOT_DIR, "ConstellAbbrevs.json")
+    for celestial_obj in celestial_objs:
+        if celestial_obj in failed:
+            continue
+        if celestial_obj not in rows:
+            Logger.log(f"Could not resolve {celestial_obj} with simbad!", 30)
+            resolved.meta["unresolved"][celestial_obj] = "Not found in SIMBAD"
+            continue
+        row = rows[celestial_obj]
+        designation = row["main_id"].split()
         try:
-            Logger.log(f"Could not find brightness for {celestial_obj_aux}!", 30)
-            Logger.log(
-                f"Attempting to find brightness for {celestial_obj} using it's IUE!",
-                30,
-            )
-            Logger.log("Resetting votable fields")
-            astroquery.simbad.Simbad.reset_votable_fields()
-            astroquery.simbad.Simbad.add_votable_fields("iue")
-            astroquery.simbad.Simbad.remove_votable_fields("main_id")
-            astroquery.simbad.Simbad.remove_votable_fields("coordinates")
-            NEW_OBJECT_FIELD = (
-                str(astroquery.simbad.Simbad.query_object(celestial_obj)[0][0])
-                .replace("b", "")
-                .replace("'", "")
+            constellation = const_abbrvs[designation[-1].lower()]
+        except (IndexError, KeyError):
+            constellation = "-"
+        distance = np.nan
+        if row["parallax"] > 0:
+            distance = (
+                astropy.coordinates.Distance(
+                    parallax=row["parallax"] * astropy.units.mas
+                )
+                .to(astropy.units.Pm)
+                .value
             )
-
-            astroquery.simbad.Simbad.reset_votable_fields()
-            # Add brightness column
-            astroquery.simbad.Simbad.add_votable_fields("flux(V)")
-
-            # Remove the other columns
-            astroquery.simbad.Simbad.remove_votable_fields("main_id")
-            astroquery.simbad.Simbad.remove_votable_fields("coordinates")
-
-            BRIGHTNESS_FIELD = str(
-                astroquery.simbad.Simbad.query_object(NEW_OBJECT_FIELD)[0][0]
+        resolved.add_row(
+            (
+                celestial_obj,
+                row["otype"] or "-",
+                row["flux"],
+                row["ra"],
+                row["dec"],
+                distance,
+                constellation,
             )
+        )
+    Logger.log(f"Resolved {len(resolved)} of {len(celestial_objs)} objects!\n")
+    return resolved
 
-            brightness = float(BRIGHTNESS_FIELD)
 
-            return brightness
+def to_cache_records(resolved: astropy.table.Table) -> dict:
+    """
+    Convert the table of resolve_objects to cache records.
 
-        except TypeError as type_err:
-            Logger.log(
-                f"Error parsing the data for {celestial_obj}. "
-                + f"Simbad only contains info on stars.\n\n{str(type_err)}",
-                50,
-            )
-            return None
+    :param resolved: Table returned by resolve_objects.
+    :return: Dictionary of the object names to their cache records.
+    """
+    records = dict()
+    for row in resolved:
+        records[str(row["Name"])] = {
+            "Type": str(row["Type"]).title(),
+            "Brightness": (
+                None if np.isnan(row["Brightness"]) else float(row["Brightness"])
+            ),
+            "Constellation": str(row["Constellation"]),
+            "Coordinates": {"ra": float(row["ra"]), "dec": float(row["dec"])},
+            "Distance": None if np.isnan(row["Distance"]) else int(row["Distance"]),
+        }
+    return records
+
+
+def _query_bulk(celestial_objs: list) -> tuple:
+    """
+    Run the bulk query in chunks of BULK_CHUNK objects on `Const.THREADS` threads.
+    A chunk whose query fails has no rows, the others still resolve.
 
-    # Occurs for multiple stars
-    except ValueError as value_err:
-        Logger.log(
-            f"Error converting brightness for {celestial_obj}. "
-            + "Simbad does not contain brightnesses for double or "
-            + f"multiple stars.\n\n{str(value_err)}",
-            50,
-        )
+    :param celestial_objs: Names of the objects to query.
+    :return: Tuple of the dictionary of the resolved names to the values of
+             their rows and the set of the names whose query failed.
+    """
+    chunks = [
+        celestial_objs[first : first + BULK_CHUNK]
+        for first in range(0, len(celestial_objs), BULK_CHUNK)
+    ]
+    rows = dict()
+    failed = set()
+    with ThreadPoolExecutor(max_workers=max(Const.THREADS, 1)) as executor:
+        for chunk, chunk_rows in zip(chunks, executor.map(_query_chunk, chunks)):
+            if chunk_rows is None:
+                failed.update(chunk)
+            else:
+                rows.update(chunk_rows)
+    return rows, failed
+
+
+def _query_chunk(celestial_objs: list):
+    """
+    Query one chunk, any error of the client, the service (such as the
+    DALServiceError of the TAP queries of newer astroquery) or its table
+    fails this chunk only and is recorded in the failures of the cache.
 
+    :param celestial_objs: Names of one chunk of the bulk query.
+    :return: Dictionary of the resolved names to the values of their rows,
+             or None if the query failed.
+    """
+    try:
+        result = get_client(BULK_FIELDS).query_objects(celestial_objs)
+        return _match_rows(result, celestial_objs)
+    except Exception as e:
+        Logger.log(f"Simbad query of {len(celestial_objs)} objects failed!", 40)
+        Logger.log(f"{type(e).__name__}: {str(e)}", 40)
+        reason = f"SIMBAD query failed: {type(e).__name__}"
+        get_cache().put_failures("simbad", {obj: reason for obj in celestial_objs})
         return None
 
 
-def get_constellation(celestial_obj: str) -> str:
-    """
-    This function returns the TLA of the constellation from the passed object.
-    :param celestial_obj: name celestial object to retrieve the TLA.
-    :return: TLA of the constellation.
+def _match_rows(result: astropy.table.Table, celestial_objs: list) -> dict:
     """
-    astroquery.simbad.Simbad.reset_votable_fields()
-    Logger.log(f"Retrieving constellation for {celestial_obj}...")
-    const_abbrvs = json.loads(
-        open(Path(Const.ROOT_DIR, "data", "ConstellAbbrevs.json"), "r").read()
-    )
-    try:
-        astroquery.simbad.Simbad.remove_votable_fields("coordinates")
-        constellation = str(
-            astroquery.simbad.Simbad.query_object(f"{celestial_obj}")[0][0]
-        ).split()[-1][:-1]
-        Logger.log(f"Retrieved constellation abbreviation for {celestial_obj}!\n")
-        try:
-            constellation = const_abbrvs[str(constellation).lower()]
-        except KeyError as e:
-            Logger.log(
-                f"{constellation} not found in constellation abbreviation dictionary",
-                50,
-            )
-            Logger.log(str(e), 50)
-        return constellation
+    Match the rows of a bulk query to the names that were asked for.
 
-    # Occurs when the object is not in SIMBAS's database
-    except TypeError as type_err:
-        Logger.log(
-            f"Error parsing the data for {celestial_obj}. "
-            + f"Simbad only contains info on stars.\n\n{str(type_err)}",
-            50,
+    :param result: Table returned by query_objects, None if nothing resolved.
+    :param celestial_objs: Names of the query.
+    :return: Dictionary of the names to the values of their rows.
+    """
+    if result is None or len(result) == 0:
+        return dict()
+    columns = dict()
+    for key, candidates in BULK_COLUMNS.items():
+        columns[key] = next(
+            (column for column in candidates if column in result.colnames), None
         )
-        sys.exit()
 
-    # Occurs for multiple stars
-    except ValueError as value_err:
-        Logger.log(
-            f"Error converting constellation for {celestial_obj}."
-            + f"\n\n{str(value_err)}",
-            50,
+    wanted = {_normalize(obj): obj for obj in celestial_objs}
+    rows = dict()
+    for index, row in enumerate(result):
+        if columns["typed_id"] is not None:
+            celestial_obj = wanted.get(_normalize(_to_str(row[columns["typed_id"]])))
+        elif index < len(celestial_objs):
+            # Without the typed identifier the rows follow the query order
+            celestial_obj = celestial_objs[index]
+        else:
+            celestial_obj = None
+        if celestial_obj is None or celestial_obj in rows:
+            continue
+        values = {
+            key: _to_str(row[column]) if column is not None else ""
+            for key, column in columns.items()
+            if key in ("main_id", "otype")
+        }
+        values.update(
+            (key, _to_float(row[column]) if column is not None else np.nan)
+            for key, column in columns.items()
+            if key in ("flux", "ra", "dec", "parallax")
         )
-        sys.exit()
+        # Unresolved names come back as rows without coordinates
+        if np.isnan(values["ra"]) or np.isnan(values["dec"]):
+            continue
+        rows[celestial_obj] = values
+    return rows
 
 
-def get_ra_dec(celestial_obj: str) -> list:
-    """
-    This function uses simbad to retrieve the right ascension
-    and declination from the object passed as an argument.
-    :param celestial_obj: name of the celestial
-                          object to retrieve the ra and dec.
-    :return: List of the right ascension and declination.
-    """
-    astroquery.simbad.Simbad.reset_votable_fields()
-    astroquery.simbad.Simbad.remove_votable_fields("main_id")
-    Logger.log(f"Retrieving right ascension and declination for {celestial_obj}...")
-    ras = astroquery.simbad.Simbad.query_object(f"{celestial_obj}")[0][0].split()
-    try:
-        ra = [int(float(r)) for r in ras]
-    except ValueError as value_err:
-        Logger.log(f"{value_err}", 50)
-        exit()
-    decs = astroquery.simbad.Simbad.query_object(f"{celestial_obj}")[0][1].split()
-    dec = [int(float(d)) for d in decs]
-    ra_dec = [ra, dec]
-    Logger.log(f"Retrieved ra and dec for {celestial_obj}!\n")
-    return ra_dec
-
-
-def get_distance(celestial_obj: str) -> float:
-    """
-    Calculate the distance in Pm.
-    :param celestial_obj: Object to query simbad.
-    :return: Distance of the object in Pm.
-    """
-    astroquery.simbad.Simbad.reset_votable_fields()
-    astroquery.simbad.Simbad.add_votable_fields("parallax")
-    astroquery.simbad.Simbad.remove_votable_fields("main_id")
-    astroquery.simbad.Simbad.remove_votable_fields("coordinates")
-    Logger.log(f"Retrieving distance for {celestial_obj}...")
-    parallax = astroquery.simbad.Simbad.query_object(celestial_obj)[0][0]
-    Logger.log(f"\tFound parallax of {parallax} mas...")
-
-    if parallax is None:
-        return None
+def _normalize(identifier: str) -> str:
+    return " ".join(identifier.lower().split())
+
 
-    parsec_distance = astropy.coordinates.Distance(parallax=parallax*astropy.units.mas)
-    Logger.log(f"\tFound distance of {parsec_distance.value} pc...")
-    Logger.log(f"\tReporting distance of {parsec_distance.to(astropy.units.Pm).value} Pm...")
+def _to_str(value) -> str:
+    if np.ma.is_masked(value):
+        return ""
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace").strip()
+    return str(value).strip()
 
-    return int(float(parsec_distance.to(astropy.units.Pm).value))
+
+def _to_float(value) -> float:
+    if np.ma.is_masked(value):
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
@@ -1,49 +1,98 @@
 """This module retrieves the image from the passed star """
 
-import sys
+import asyncio
+import hashlib
+import io
+import threading
 import time
-import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import os
 import bs4
+import PIL.Image
 import requests
 
+from . import http_client
 from .const import Const
 from .logger import Logger
 
+SKYVIEW_URL = "https://skyview.gsfc.nasa.gov/"
 
-def get_skyview_img(celestial_obj: str) -> int:
+# Messages of the codes returned for the objects without an image
+ERRORS = {
+    1: "SkyView is unreachable",
+    2: "the SkyView query failed",
+    3: "the SkyView result page could not be parsed",
+    4: "the image could not be downloaded",
+    5: "unexpected error",
+}
+
+# Bytes of an image written to the cache at once while it downloads
+IMAGE_CHUNK = 1 << 16
+
+
+def get_skyview_img(celestial_obj: str) -> bytes:
     """
     This module retrieves the image from the skyview endpoint
     if it not already cached. After retrieval, it will cache the image.
     :param celestial_obj: Name of object to download.
-    :return: Integer code.
+    :return: Bytes of the JPEG image, None if it could not be retrieved.
+    """
+    return fetch_images([celestial_obj]).get(celestial_obj)
+
+
+def fetch_images(celestial_objs: list) -> dict:
+    """
+    Retrieve the images of the objects, from the cache or with up to
+    `Const.SKYVIEW_CONCURRENCY` objects downloading at once. SkyView is
+    checked once before the first download.
+
+    :param celestial_objs: Names of the objects to download.
+    :return: Dictionary of the names of the objects with an image to the bytes
+             of their JPEG image, handed to the overlay without temporary files.
+    """
+    # A loop of its own, asyncio.run needs Python 3.7
+    loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(_fetch_images(list(celestial_objs)))
+    finally:
+        loop.close()
+    images = dict()
+    for celestial_obj, (code, image) in results.items():
+        if code == 0:
+            images[celestial_obj] = image
+        else:
+            Logger.log(f"No image for {celestial_obj}: {ERRORS[code]}.", 40)
+    Logger.log(f"Retrieved {len(images)} of {len(results)} SkyView images!")
+    return images
+
+
+def skyview_available() -> bool:
+    """
+    :return: True if SkyView answers, checked once per run instead of per object.
+    """
+    try:
+        response = http_client.request("HEAD", SKYVIEW_URL)
+    except requests.exceptions.RequestException as req_except:
+        Logger.log(f"SkyView is unreachable: {str(req_except)}", 40)
+        return False
+    if response.status_code >= 500:
+        Logger.log(f"SkyView returned {response.status_code}!", 40)
+        return False
+    return True
+
+
+def skyview_endpoint(celestial_obj: str) -> str:
+    """
+    :param celestial_obj: Name of the object.
+    :return: URL of the SkyView query of the image of the object.
     """
     width, height = (1080, 1080)
     image_size = 3.5
     b_scale = "Linear"
-    # the image in in cache
-    Logger.log("Establishing connection to skyview server...")
-    t1 = time.time()
-    if (
-        urllib.request.urlopen(
-            "https://skyview.gsfc.nasa.gov/current/cgi/runquery.pl"
-        ).getcode()
-        != 200
-    ):
-        Logger.log(
-            "Error trying to connect to the skyview server "
-            + f"taking {time.time() - t1}.",
-            50,
-        )
-        sys.exit()
-    Logger.log(
-        "Connection to skyview server "
-        + f"successful taking {time.time() - t1} seconds!"
-    )
-
-    endpoint = (
-        "https://skyview.gsfc.nasa.gov/current/cgi/runquery.pl?"
+    return (
+        SKYVIEW_URL
+        + "current/cgi/runquery.pl?"
         + f"Position={celestial_obj.replace(' ', '%20')}"
         "&coordinates=J2000&coordinates=&projection=Tan&" + f"pixels={width}%2C{height}"
         f"&size={image_size}&float=on&scaling={b_scale}&resolver=SIMBAD-NED&"
@@ -53,46 +102,212 @@ def get_skyview_img(celestial_obj: str) -> int:
         "survey=Mellinger+Red&survey=Mellinger+Green&survey=Mellinger+Blue&"
         "IOSmooth=&contour=&contourSmooth=&ebins=null"
     )
-    Logger.log(endpoint)
-    try:
+
+
+async def _fetch_images(celestial_objs: list) -> dict:
+    """
+    :param celestial_objs: Names of the objects to download.
+    :return: Dictionary of the names to their integer code and image bytes.
+    """
+    results = dict()
+    missing = list()
+    for celestial_obj in celestial_objs:
+        # The same query always returns the same image
+        image = read_cached_image(_image_path(celestial_obj))
+        if image is not None:
+            Logger.log(f"Found the image of {celestial_obj} in the cache!")
+            results[celestial_obj] = (0, image)
+        else:
+            missing.append(celestial_obj)
+    if len(missing) == 0:
+        return results
+
+    limit = max(Const.SKYVIEW_CONCURRENCY, 1)
+    loop = asyncio.get_event_loop()
+    # The blocking requests run on as many threads as objects in flight
+    with ThreadPoolExecutor(max_workers=limit) as executor:
+        if not await loop.run_in_executor(executor, skyview_available):
+            results.update({celestial_obj: (1, None) for celestial_obj in missing})
+            return results
+        semaphore = asyncio.Semaphore(limit)
+        downloaded = await asyncio.gather(
+            *[_download_image(obj, executor, semaphore) for obj in missing],
+            return_exceptions=True,
+        )
+    for celestial_obj, result in zip(missing, downloaded):
+        if isinstance(result, Exception):
+            Logger.log(f"{type(result).__name__}: {str(result)}", 50)
+            result = (5, None)
+        results[celestial_obj] = result
+    return results
+
+
+async def _download_image(celestial_obj: str, executor, semaphore) -> tuple:
+    """
+    Query SkyView for the image of an object and download it into the cache.
+
+    :param celestial_obj: Name of the object.
+    :param executor: Executor running the blocking requests.
+    :param semaphore: Semaphore bounding the objects in flight.
+    :return: Tuple of the integer code and the bytes of the image.
+    """
+    loop = asyncio.get_event_loop()
+    endpoint = skyview_endpoint(celestial_obj)
+    async with semaphore:
+        try:
+            t1 = time.time()
+            Logger.log(f"Downloading webpage for {celestial_obj}...")
+            image_request = await loop.run_in_executor(
+                executor, lambda: http_client.get(endpoint).text
+            )
+        except requests.exceptions.RequestException as req_except:
+            Logger.log(f"{str(req_except)}", 50)
+            Logger.log("Error searching for object.", 50)
+            return 2, None
+        Logger.log(f"Downloaded successfully in {time.time() - t1} seconds!")
+
+        Logger.log("Parsing webpage...")
+        try:
+            img_url = SKYVIEW_URL + bs4.BeautifulSoup(
+                image_request, features="html.parser"
+            ).find("td", attrs={"colspan": 3, "align": "left"}).find("a", href=True)[
+                "href"
+            ].replace(
+                "../", ""
+            )
+            Logger.log("Webpage parsed!")
+        except (AttributeError, TypeError) as attrib_except:
+            Logger.log(
+                "Error trying to parse the web page of "
+                + f"{celestial_obj}!\n\n{str(attrib_except)}\n",
+                50,
+            )
+            return 3, None
+
+        Logger.log(f"Downloading image of {celestial_obj}...")
         t1 = time.time()
-        Logger.log(f"Downloading webpage for {celestial_obj}...")
-        image_request = requests.get(endpoint).text
-    except requests.exceptions.RequestException as req_except:
-        Logger.log(f"{str(req_except)}", 50)
-        Logger.log("Error searching for object.", 50)
-        return 2
-    Logger.log(f"Downloaded successfully in {time.time() - t1} seconds!")
+        try:
+            image = await loop.run_in_executor(
+                executor, _stream_image, img_url, _image_path(celestial_obj)
+            )
+        except requests.exceptions.RequestException as req_except:
+            Logger.log(f"{str(req_except)}", 50)
+            Logger.log(f"Error downloading the image of {celestial_obj}.", 50)
+            return 4, None
+        Logger.log(f"Downloaded successfully in {time.time() - t1} seconds!")
+    if image is None:
+        Logger.log(f"The image of {celestial_obj} is corrupt!", 50)
+        return 4, None
+    return 0, image
+
 
-    Logger.log("Parsing webpage...")
+def _stream_image(url: str, image_path: Path) -> bytes:
+    """
+    Stream an image into the cache in chunks, then read it back for the
+    overlay.
+
+    :param url: URL of the image.
+    :param image_path: Path of the image in the cache.
+    :return: Bytes of the image, None if it is corrupt.
+    :raises requests.exceptions.HTTPError: If the response is an error.
+    """
+    with http_client.get(url, stream=True) as response:
+        response.raise_for_status()
+        _write_image(image_path, response.iter_content(chunk_size=IMAGE_CHUNK))
+    # Corrupt images are removed from the cache
+    return read_cached_image(image_path)
+
+
+def _image_path(celestial_obj: str) -> Path:
+    """
+    :param celestial_obj: Name of the object.
+    :return: Path of the image of the object in the cache.
+    """
+    return Path(image_cache_dir(), f"{image_key(skyview_endpoint(celestial_obj))}.jpg")
+
+
+def _is_image(image: bytes) -> bool:
+    """
+    :param image: Bytes of an image.
+    :return: True if PIL can decode the image.
+    """
     try:
-        img_url = "https://skyview.gsfc.nasa.gov/" + bs4.BeautifulSoup(
-            image_request, features="html.parser"
-        ).find("td", attrs={"colspan": 3, "align": "left"}).find("a", href=True)[
-            "href"
-        ].replace(
-            "../", ""
-        )
-        Logger.log("Webpage parsed!")
-    except AttributeError as attrib_except:
-        Logger.log(
-            "Error trying to parse the web page of "
-            + f"{celestial_obj}!\n\n{str(attrib_except)}\n",
-            50,
-        )
-        return 3
-
-    Logger.log(f"Downloading image of {celestial_obj}...")
-    t1 = time.time()
-    if not os.path.isdir(Path(Const.SLIDESHOW_DIR, "PySkySlideshow", "garbage")):
-        os.makedirs(Path(Const.SLIDESHOW_DIR, "PySkySlideshow", "garbage"))
-    urllib.request.urlretrieve(
-        img_url,
-        Path(
-            Const.SLIDESHOW_DIR,
-            "PySkySlideshow",
-            "garbage",
-            f"{celestial_obj}.temp.jpg",
-        ),
-    )
-    Logger.log(f"Downloaded successfully in {time.time() - t1} seconds!")
+        with PIL.Image.open(io.BytesIO(image)) as img:
+            img.verify()
+    except (OSError, SyntaxError):
+        return False
+    return True
+
+
+def _write_image(image_path: Path, chunks) -> None:
+    """
+    Write an image to the cache chunk by chunk, next to its path and moved
+    in place once complete.
+
+    :param image_path: Path of the image in the cache.
+    :param chunks: Iterable of the bytes of the image.
+    """
+    os.makedirs(image_path.parent, exist_ok=True)
+    temp_path = f"{image_path}.{os.getpid()}.{threading.get_ident()}.part"
+    try:
+        with open(temp_path, "wb") as out_file:
+            for chunk in chunks:
+                out_file.write(chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    os.replace(temp_path, image_path)
+
+
+def image_cache_dir() -> Path:
+    """
+    :return: Directory of the downloaded images, named by the hash of their query.
+    """
+    return Path(Const.ROOT_DIR, "data", "images")
+
+
+def image_key(endpoint: str) -> str:
+    """
+    :param endpoint: URL of the query with all its parameters.
+    :return: SHA-256 identifying the image of the query in the cache.
+    """
+    return hashlib.sha256(endpoint.encode("utf-8")).hexdigest()
+
+
+def read_cached_image(image_path: Path) -> bytes:
+    """
+    Read an image of the cache, removing it if it expired or is corrupt so
+    it is downloaded again.
+
+    :param image_path: Path of the image in the cache.
+    :return: Bytes of the image, None if it cannot be used.
+    """
+    if not os.path.isfile(image_path):
+        return None
+    if time.time() - os.path.getmtime(image_path) > Const.CACHE_TTL_DAYS * 86400.0:
+        Logger.log(f"Cached image `{image_path.name}` expired.")
+        os.remove(image_path)
+        return None
+    with open(image_path, "rb") as image_file:
+        image = image_file.read()
+    if not _is_image(image):
+        Logger.log(f"Cached image `{image_path.name}` is corrupt.", 30)
+        os.remove(image_path)
+        return None
+    return image
+
+
+def evict_images() -> int:
+    """
+    Remove the images of the cache older than Const.CACHE_TTL_DAYS.
+
+    :return: Number of images removed.
+    """
+    if not os.path.isdir(image_cache_dir()):
+        return 0
+    evicted = 0
+    for image_path in Path(image_cache_dir()).glob("*.jpg"):
+        if time.time() - os.path.getmtime(image_path) > Const.CACHE_TTL_DAYS * 86400.0:
+            os.remove(image_path)
+            evicted += 1
+    return evicted
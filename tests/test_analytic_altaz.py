@@ -0,0 +1,102 @@
+"""Tests for the `analytic_altaz` module."""
+
+import unittest
+from unittest import mock
+
+import astropy.units as u
+import numpy as np
+from astropy.coordinates import AltAz, EarthLocation, SkyCoord
+from astropy.time import Time
+
+from pysky import analytic_altaz
+from pysky.check_sky import visibility_timeline
+from pysky.const import Const
+from pysky.observing_context import ObservingContext
+
+LONGITUDE = -75.0
+
+TIMES = Time(["2020-01-01 22:00", "2020-01-02 04:00", "2020-01-02 10:00"])
+
+WINDOW = {
+    "START_YEAR": "2020",
+    "START_MONTH": "01",
+    "START_DAY": "01",
+    "START_TIME": "22:00",
+    "END_YEAR": "2020",
+    "END_MONTH": "01",
+    "END_DAY": "02",
+    "END_TIME": "10:00",
+    "LATITUDE": 40.0,
+    "LONGITUDE": LONGITUDE,
+    "ELEVATION": 0.0,
+}
+
+
+def _grid() -> tuple:
+    """
+    :return: Tuple of the right ascensions and declinations of a grid of the
+             sky, as columns.
+    """
+    ra, dec = np.meshgrid(
+        np.arange(0.0, 360.0, 30.0), np.arange(-80.0, 81.0, 20.0)
+    )
+    return ra.reshape((-1, 1)), dec.reshape((-1, 1))
+
+
+class TestAnalyticAltaz(unittest.TestCase):
+    def test_within_error_bound(self):
+        """The engine matches the astropy AltAz transform over the sky."""
+        ra, dec = _grid()
+        for latitude in (-60.0, 0.0, 40.0, 70.0):
+            location = EarthLocation.from_geodetic(
+                lon=LONGITUDE * u.deg, lat=latitude * u.deg
+            )
+            reference = SkyCoord(ra=ra * u.deg, dec=dec * u.deg).transform_to(
+                AltAz(obstime=TIMES, location=location)
+            )
+            alt, az = analytic_altaz.altaz(
+                ra, dec, TIMES.jd, latitude, LONGITUDE
+            )
+            error = analytic_altaz.angular_error(
+                alt, az, reference.alt.degree, reference.az.degree
+            )
+            self.assertLessEqual(np.max(error), analytic_altaz.ERROR_BOUND)
+
+    def test_angular_error(self):
+        error = analytic_altaz.angular_error(
+            [0.0, 89.0], [10.0, 0.0], [0.0, 89.0], [20.0, 180.0]
+        )
+        np.testing.assert_allclose(error, [10.0, 2.0])
+
+
+class TestAccuracyCheck(unittest.TestCase):
+    def test_reports_error_within_bound(self):
+        with mock.patch.multiple(Const, **WINDOW):
+            context = ObservingContext()
+        ra, dec = _grid()
+        error = analytic_altaz.accuracy_check(ra, dec, context)
+        self.assertGreater(error, 0.0)
+        self.assertLessEqual(error, analytic_altaz.ERROR_BOUND)
+
+    def test_timeline_matches_astropy_engine(self):
+        """Rise and set times of both engines differ by under a minute."""
+        with mock.patch.multiple(Const, **WINDOW):
+            context = ObservingContext()
+        ra, dec = _grid()
+        timelines = dict()
+        for engine in ("", "analytic"):
+            with mock.patch.object(Const, "ENGINE", engine):
+                timelines[engine] = visibility_timeline(ra, dec, 2.0, context)
+        for key in ("rise", "set"):
+            np.testing.assert_array_equal(
+                np.isnan(timelines[""][key]),
+                np.isnan(timelines["analytic"][key]),
+            )
+            difference = (
+                timelines[""][key] - timelines["analytic"][key]
+            ) * 86400
+            self.assertLessEqual(np.nanmax(np.abs(difference)), 60.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
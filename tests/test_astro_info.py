@@ -0,0 +1,49 @@
+"""Tests for the `astro_info` module."""
+import unittest
+from unittest import mock
+
+import astropy.coordinates
+import astropy.units as u
+import numpy as np
+from astropy.time import Time
+
+from pysky import astro_info
+from pysky.const import Const
+
+LOCATION = astropy.coordinates.EarthLocation.from_geodetic(
+    lon=10.0 * u.deg, lat=40.0 * u.deg, height=100.0 * u.m
+)
+
+
+class TestGetBodies(unittest.TestCase):
+    def setUp(self):
+        # The builtin ephemeris needs no download
+        patches = (
+            mock.patch.object(Const, "EPHEMERIS_ENGINE", "local"),
+            mock.patch.object(Const, "LOCAL_EPHEMERIS", "builtin"),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_matches_get_body(self):
+        """The batched positions are the ones of astropy body by body."""
+        times = Time("2020-01-01 18:00") + np.arange(0, 420, 30) * u.min
+        bodies = ["sun", "moon", "mars", "jupiter"]
+        positions = astro_info.get_bodies(bodies, times, LOCATION)
+        self.assertEqual(list(positions), bodies)
+        for body in bodies:
+            expected = astropy.coordinates.get_body(body, times, LOCATION)
+            self.assertEqual(positions[body].shape, times.shape)
+            separation = positions[body].separation(expected).arcsec
+            self.assertLess(np.max(separation), 1e-3)
+
+    def test_single_time_and_unknown_body(self):
+        times = Time("2020-01-01 18:00")
+        positions = astro_info.get_bodies(["moon", "vega"], times, LOCATION)
+        self.assertEqual(list(positions), ["moon"])
+        self.assertEqual(positions["moon"].shape, ())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+"""Tests for the `cache` module."""
+import itertools
+import json
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from pysky import cache
+from pysky.const import Const
+
+VEGA = {"Type": "Star", "Coordinates": {"ra": 279.2, "dec": 38.8}}
+
+
+class CacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name, "cache.sqlite3")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open(self) -> cache.Cache:
+        """
+        :return: Cache of the temporary database, closed after the test.
+        """
+        opened = cache.Cache(self.path)
+        self.addCleanup(opened.close)
+        return opened
+
+
+class TestStats(CacheTestCase):
+    def test_hits_are_counted_once(self):
+        objects = self.open()
+        objects.put("Vega", VEGA)
+        objects.get_many(["Vega", "Deneb"])
+        objects.get_many(["Vega", "Deneb"], count=False)
+        self.assertEqual((objects.hits, objects.misses), (1, 1))
+
+
+class TestExpiry(CacheTestCase):
+    def test_static_data_expires_after_ttl(self):
+        objects = self.open()
+        with mock.patch.object(Const, "CACHE_TTL_DAYS", -1.0):
+            objects.put("Vega", VEGA)
+        objects.put("Deneb", VEGA)
+        self.assertEqual(list(objects.get_many(["Vega", "Deneb"])), ["Deneb"])
+        self.assertEqual(objects.evict(), 1)
+        self.assertEqual(objects.names(), ["Deneb"])
+
+    def test_ephemeris_data_belongs_to_its_window(self):
+        objects = self.open()
+        objects.put("Mars", VEGA, "window", 0.0)
+        self.assertIsNotNone(objects.get("Mars", window_key="window"))
+        self.assertIsNone(objects.get("Mars", window_key="other"))
+        self.assertEqual(objects.evict("other"), 1)
+        self.assertNotIn("Mars", objects)
+
+
+class TestLeastRecentlyUsed(CacheTestCase):
+    def test_least_recently_used_are_evicted(self):
+        objects = self.open()
+        # Every call to time.time is a second later than the previous one
+        clock = itertools.count(1.6e9, 1.0)
+        with mock.patch.object(
+            cache.time, "time", side_effect=lambda: next(clock)
+        ), mock.patch.object(Const, "CACHE_MAX_OBJECTS", 3):
+            for name in ("Vega", "Deneb", "Altair"):
+                objects.put(name, VEGA)
+            objects.get("Vega")
+            objects.put("Sirius", VEGA)
+            self.assertEqual(objects.names(), ["Altair", "Sirius", "Vega"])
+            self.assertEqual(objects.evictions, 1)
+
+
+class TestMigrations(CacheTestCase):
+    def version(self) -> int:
+        connection = sqlite3.connect(str(self.path))
+        try:
+            return connection.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            connection.close()
+
+    def test_imports_legacy_file(self):
+        legacy_path = Path(self.directory.name, "cache")
+        legacy_path.write_text(json.dumps({"Vega": VEGA, "Broken": "-"}))
+        objects = self.open()
+        self.assertEqual(objects.names(), ["Vega"])
+        self.assertEqual(objects.get("Vega"), VEGA)
+        self.assertFalse(legacy_path.exists())
+        renamed = Path(self.directory.name, "cache.legacy.json")
+        self.assertTrue(renamed.exists())
+        self.assertEqual(self.version(), cache.SCHEMA_VERSION)
+
+    def test_migrates_version_1(self):
+        connection = sqlite3.connect(str(self.path))
+        connection.execute(
+            "CREATE TABLE objects (name TEXT PRIMARY KEY, "
+            + "record TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        connection.executemany(
+            "INSERT INTO objects VALUES (?, ?, ?)",
+            [
+                ("Vega", json.dumps(VEGA), 1.6e9),
+                ("Mars", json.dumps({"Type": "Planet"}), 1.6e9),
+            ],
+        )
+        connection.execute("PRAGMA user_version=1")
+        connection.commit()
+        connection.close()
+        with mock.patch.object(Const, "CACHE_TTL_DAYS", 1e5):
+            objects = self.open()
+            # Planets are queried again, the rest keeps its update time
+            self.assertEqual(objects.names(), ["Vega"])
+            self.assertEqual(objects.get("Vega"), VEGA)
+        objects.put_failures("simbad", {"Deneb": "Not found"})
+        objects.put_ephemeris("499", "0,0,0", 60, {0: {"RA": 1.0}})
+        self.assertEqual(self.version(), cache.SCHEMA_VERSION)
+
+    def test_newer_schema_is_refused(self):
+        connection = sqlite3.connect(str(self.path))
+        connection.execute(f"PRAGMA user_version={cache.SCHEMA_VERSION + 1}")
+        connection.close()
+        with self.assertRaises(RuntimeError):
+            cache.Cache(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+"""Tests for the `catalog_compile` module."""
+
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+from pysky import catalog_compile
+
+CATALOG = """name,ra,dec,vmag
+Vega,18 36 56.3,+38 47 01,0.03
+Blank,,+10 00 00,5.0
+Deneb,20 41 25.9,+45 16 49,1.25
+Short,12 00 00
+Sirius,06 45 08.9,-16 42 58,-1.46
+"""
+
+
+class TestLargeCatalog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = Path(self.directory.name, "stars.csv")
+        self.source.write_text(CATALOG)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_blank_and_short_rows_are_dropped(self):
+        table_path = Path(self.directory.name, "stars.npy")
+        names_path = Path(self.directory.name, "stars.names.npy")
+        # Two rows per chunk so the bad rows are spread over the stream
+        with mock.patch.object(catalog_compile, "CHUNK_ROWS", 2):
+            rows = catalog_compile._compile_large_catalog(
+                self.source, table_path, names_path
+            )
+        self.assertEqual(rows, 3)
+        table = np.load(table_path)
+        names = np.load(names_path).tobytes().decode("utf-8")
+        starts = np.concatenate(([0], table["name_end"][:-1]))
+        self.assertEqual(
+            [names[s:e] for s, e in zip(starts, table["name_end"])],
+            ["Sirius", "Vega", "Deneb"],
+        )
+        np.testing.assert_allclose(table["dec"][0], -16.716, atol=1e-3)
+
+    def test_blank_angle_is_nan(self):
+        angles = catalog_compile._to_degrees(["10 00 00", ""], hours=True)
+        self.assertEqual(angles[0], 150.0)
+        self.assertTrue(np.isnan(angles[1]))
+
+
+class TestCompileCatalog(unittest.TestCase):
+    def test_southern_declination(self):
+        """The sign of a declination applies to its minutes and seconds."""
+        table, strings = catalog_compile._compile_catalog(
+            {
+                "M4": {
+                    "Coordinates": {
+                        "ra": [16, 23, 35.22],
+                        "dec": [-26, 31, 32],
+                    },
+                    "Brightness": 5.6,
+                },
+                "M13": {
+                    "Coordinates": {
+                        "ra": [16, 41, 41.24],
+                        "dec": [36, 27, 35],
+                    },
+                },
+            }
+        )
+        np.testing.assert_allclose(
+            table["dec"], [-26.5256, 36.4597], atol=1e-4
+        )
+        np.testing.assert_allclose(
+            table["ra"], [245.8968, 250.4218], atol=1e-4
+        )
+        self.assertEqual(strings[table["Name"][0]], "M4")
+
+    def test_negative_zero_degrees(self):
+        angle = catalog_compile.sexagesimal_to_degrees([-0.0, 30, 0], False)
+        self.assertEqual(angle, -0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
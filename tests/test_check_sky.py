@@ -0,0 +1,132 @@
+"""Tests for the `check_sky` module."""
+import unittest
+from unittest import mock
+
+import astropy.units as u
+import numpy as np
+from astroplan import FixedTarget
+from astropy.coordinates import SkyCoord
+
+from pysky.check_sky import _bisect, _hermite, visibility_timeline
+from pysky.const import Const
+from pysky.observing_context import ObservingContext
+
+# Night of the window, at a northern site
+WINDOW = {
+    "START_YEAR": "2020",
+    "START_MONTH": "01",
+    "START_DAY": "01",
+    "START_TIME": "22:00",
+    "END_YEAR": "2020",
+    "END_MONTH": "01",
+    "END_DAY": "02",
+    "END_TIME": "10:00",
+    "LATITUDE": 40.0,
+    "LONGITUDE": -75.0,
+    "ELEVATION": 0.0,
+}
+
+# sec(z) limit of 2, an altitude of 30 degrees
+SECZ_MAX = 2.0
+MIN_ALT = 30.0 * u.deg
+
+# Largest difference in seconds with the times astroplan finds
+TIME_TOLERANCE = 60.0
+
+
+class TestVisibilityTimeline(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with mock.patch.multiple(Const, ENGINE="", **WINDOW):
+            cls.context = ObservingContext()
+        middle = cls.context.start_time + (
+            cls.context.end_time - cls.context.start_time
+        ) / 2
+        # Transits in the middle of the window
+        cls.ra = cls.context.observer.local_sidereal_time(middle).degree
+
+    def timeline(self, ra: float, dec: float) -> dict:
+        """
+        :return: Timeline of the object, as floats and bools.
+        """
+        with mock.patch.object(Const, "ENGINE", ""):
+            timeline = visibility_timeline(
+                np.array([ra]), np.array([dec]), SECZ_MAX, self.context
+            )
+        return {key: value[0] for key, value in timeline.items()}
+
+    def assertSameTime(self, jd: float, expected: object):
+        self.assertLessEqual(abs(jd - expected.jd) * 86400.0, TIME_TOLERANCE)
+
+    def test_rising_and_setting_object(self):
+        timeline = self.timeline(self.ra, 0.0)
+        target = FixedTarget(SkyCoord(ra=self.ra * u.deg, dec=0.0 * u.deg))
+        observer = self.context.observer
+        start = self.context.start_time
+        self.assertTrue(timeline["visible"])
+        self.assertSameTime(
+            timeline["rise"],
+            observer.target_rise_time(
+                start, target, which="next", horizon=MIN_ALT
+            ),
+        )
+        self.assertSameTime(
+            timeline["set"],
+            observer.target_set_time(
+                start, target, which="next", horizon=MIN_ALT
+            ),
+        )
+        self.assertSameTime(
+            timeline["transit"],
+            observer.target_meridian_transit_time(
+                start, target, which="next"
+            ),
+        )
+        # Culminates at 90 - |40 - 0| degrees
+        self.assertAlmostEqual(timeline["max_alt"], 50.0, delta=0.05)
+
+    def test_circumpolar_object(self):
+        """Always above the limit, so it neither rises nor sets."""
+        timeline = self.timeline(10.0, 85.0)
+        self.assertTrue(timeline["visible"])
+        self.assertTrue(np.isnan(timeline["rise"]))
+        self.assertTrue(np.isnan(timeline["set"]))
+        self.assertGreater(timeline["max_alt"], MIN_ALT.value)
+
+    def test_never_rising_object(self):
+        timeline = self.timeline(self.ra, -70.0)
+        self.assertFalse(timeline["visible"])
+        self.assertTrue(np.isnan(timeline["rise"]))
+        self.assertTrue(np.isnan(timeline["set"]))
+        self.assertLess(timeline["max_alt"], MIN_ALT.value)
+
+
+class TestRootFinder(unittest.TestCase):
+    def test_hermite_is_exact_for_cubics(self):
+        x = np.arange(6.0)
+        values = np.vstack([x**3 - 2 * x, -(x**2)])
+        slopes = np.vstack([3 * x**2 - 2, -2 * x])
+        position = np.array([2.25, 4.5])
+        value, derivative = _hermite(values, slopes, position)
+        np.testing.assert_allclose(value, [2.25**3 - 4.5, -(4.5**2)])
+        np.testing.assert_allclose(derivative, [3 * 2.25**2 - 2, -9.0])
+
+    def test_bisect_rows(self):
+        roots = _bisect(
+            lambda x: x**2 - np.array([2.0, 3.0]),
+            np.array([1.0, 1.0]),
+            np.array([2.0, 2.0]),
+            True,
+            40,
+        )
+        np.testing.assert_allclose(roots, np.sqrt([2.0, 3.0]))
+
+    def test_bisect_decreasing(self):
+        root = _bisect(
+            lambda x: 1.0 - x, np.zeros(1), np.full(1, 3.0), False, 40
+        )
+        np.testing.assert_allclose(root, [1.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
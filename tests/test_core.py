@@ -0,0 +1,52 @@
+"""Tests for the `core` module."""
+import tempfile
+import unittest
+from pathlib import Path
+
+from pysky.cache import Cache
+from pysky.core import run_records
+
+WINDOW_KEY = "2020-01-01T18:00:00.000/2020-01-02T01:00:00.000@0.0,0.0,0.0"
+
+
+class TestRunRecords(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = Cache(Path(self.directory.name, "cache.sqlite3"))
+        self.cache.put_many(
+            {
+                "Vega": {"Coordinates": {"ra": 279.2, "dec": 38.8}},
+                "Deneb": {"Coordinates": {"ra": 310.4, "dec": 45.3}},
+            }
+        )
+        # Ephemeris data of the window, expiring in 2100
+        self.cache.put_many(
+            {"Mars": {"Coordinates": {"ra": 236.5, "dec": -19.5}}},
+            WINDOW_KEY,
+            4102444800.0,
+        )
+
+    def tearDown(self):
+        self.cache.close()
+        self.directory.cleanup()
+
+    def test_removed_star_is_not_reported(self):
+        """A star left out of the run stays cached but is not reported."""
+        records = run_records(self.cache, ["Vega", "Mars"], WINDOW_KEY)
+        self.assertEqual(list(records), ["Mars", "Vega"])
+        self.assertNotIn("Deneb", records)
+        self.assertIn("Deneb", self.cache)
+
+    def test_other_window_is_not_reported(self):
+        """Ephemeris data of another window is not reported."""
+        records = run_records(self.cache, ["Vega", "Mars"], "other-window")
+        self.assertEqual(list(records), ["Vega"])
+
+    def test_report_is_not_counted(self):
+        """Reading the records of the report leaves the hit rate alone."""
+        run_records(self.cache, ["Vega", "Mars"], WINDOW_KEY)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+"""Tests for the `http_client` module against the stand-in server."""
+import json
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import requests
+
+from pysky import http_client, replay
+from pysky.const import Const
+
+URL = "https://skyview.gsfc.nasa.gov/current/cgi/query.pl"
+
+
+class StandInTestCase(unittest.TestCase):
+    """Runs a stand-in server answering from a temporary corpus."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.server = replay.serve(0)
+        patches = (
+            mock.patch.multiple(
+                Const,
+                REPLAY_DIR=self.directory.name,
+                STAND_IN_URL=f"http://127.0.0.1:{self.server.server_port}",
+                NETWORK_MODE="live",
+                REPLAY_LATENCY=0.0,
+                REPLAY_FAILURE_RATE=0.0,
+                HTTP_RETRIES=3,
+            ),
+            # No waiting between the retries
+            mock.patch.object(http_client, "BACKOFF_BASE", 0.0),
+            # Fresh sessions and buckets for every test
+            mock.patch.dict(http_client._SESSIONS, clear=True),
+            mock.patch.dict(http_client._BUCKETS, clear=True),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.hits = mock.Mock(side_effect=replay.inject_faults)
+        patch = mock.patch.object(replay, "inject_faults", self.hits)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def record(self, status: int, body: bytes, headers=None) -> None:
+        """
+        Store the response of a GET of URL in the corpus.
+        """
+        key = replay.request_key("GET", URL, None)
+        directory = Path(self.directory.name, "skyview")
+        directory.mkdir(exist_ok=True)
+        Path(directory, f"{key}.body").write_bytes(body)
+        entry = {
+            "method": "GET",
+            "url": URL,
+            "status": status,
+            "reason": "Recorded",
+            "headers": headers or dict(),
+        }
+        Path(directory, f"{key}.json").write_text(json.dumps(entry))
+
+
+class TestRetries(StandInTestCase):
+    def test_retries_injected_failures(self):
+        """503 responses are retried until the recorded one is served."""
+        self.record(200, b"SkyView")
+        self.hits.side_effect = [True, True, False]
+        response = http_client.get(URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"SkyView")
+        self.assertEqual(self.hits.call_count, 3)
+
+    def test_gives_up_after_the_retries(self):
+        """The last 503 is returned once every retry failed."""
+        self.record(200, b"SkyView")
+        with mock.patch.object(Const, "REPLAY_FAILURE_RATE", 1.0):
+            response = http_client.get(URL)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.hits.call_count, Const.HTTP_RETRIES + 1)
+
+    def test_honours_retry_after(self):
+        """A 429 is retried after the seconds of its Retry-After header."""
+        self.record(429, b"", {"Retry-After": "0.3"})
+        with mock.patch.object(Const, "HTTP_RETRIES", 1):
+            t1 = time.monotonic()
+            response = http_client.get(URL)
+            elapsed = time.monotonic() - t1
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(self.hits.call_count, 2)
+        self.assertGreaterEqual(elapsed, 0.3)
+
+    def test_retry_after_is_capped(self):
+        response = requests.Response()
+        response.headers["Retry-After"] = "3600"
+        self.assertEqual(
+            http_client._retry_after(response, 0), http_client.BACKOFF_MAX
+        )
+
+
+class TestTimeout(StandInTestCase):
+    def test_default_timeout(self):
+        """Requests without a timeout get Const.HTTP_TIMEOUT."""
+        self.record(200, b"SkyView")
+        with mock.patch.multiple(
+            Const, REPLAY_LATENCY=0.5, HTTP_TIMEOUT=0.1, HTTP_RETRIES=0
+        ):
+            with self.assertRaises(requests.exceptions.Timeout):
+                http_client.get(URL)
+
+
+class TestRateLimit(StandInTestCase):
+    def test_requests_are_rate_limited(self):
+        """Past its burst, a service is sent `rate` requests per second."""
+        self.record(200, b"SkyView")
+        with mock.patch.dict(
+            http_client.SERVICES["skyview"], rate=20.0, burst=2
+        ):
+            t1 = time.monotonic()
+            for _ in range(6):
+                self.assertEqual(http_client.get(URL).status_code, 200)
+            elapsed = time.monotonic() - t1
+        # The 4 requests past the burst wait 1/20 s each
+        self.assertGreaterEqual(elapsed, 0.19)
+
+    def test_bucket_refills(self):
+        bucket = http_client.TokenBucket(rate=50.0, burst=1)
+        self.assertEqual(bucket.acquire(), 0.0)
+        self.assertGreater(bucket.acquire(), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
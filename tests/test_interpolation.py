@@ -0,0 +1,159 @@
+"""Tests for the `interpolation` module."""
+import unittest
+
+import numpy as np
+
+from pysky import interpolation
+
+TOLERANCE = 0.01
+
+# Minutes of the observing window
+WINDOW = 420.0
+
+LATITUDE = 40.0
+
+
+def _star(ra: float, dec: float, epochs: np.ndarray) -> dict:
+    """
+    :param ra: Right ascension in degrees.
+    :param dec: Declination in degrees.
+    :param epochs: Minutes since the start of the window.
+    :return: Table of a fixed star seen from LATITUDE, transiting in the
+             middle of the window.
+    """
+    hour_angle = interpolation.SIDEREAL_RATE * (epochs - WINDOW / 2)
+    dec_rad, lat_rad = np.radians(dec), np.radians(LATITUDE)
+    el = np.arcsin(
+        np.sin(dec_rad) * np.sin(lat_rad)
+        + np.cos(dec_rad) * np.cos(lat_rad) * np.cos(hour_angle)
+    )
+    az = np.arctan2(
+        -np.cos(dec_rad) * np.sin(hour_angle),
+        np.sin(dec_rad) * np.cos(lat_rad)
+        - np.cos(dec_rad) * np.sin(lat_rad) * np.cos(hour_angle),
+    )
+    return {
+        "epoch": epochs,
+        "RA": np.full(len(epochs), ra),
+        "DEC": np.full(len(epochs), dec),
+        "AZ": np.mod(np.degrees(az), 360.0),
+        "EL": np.degrees(el),
+    }
+
+
+def _grid(step: int) -> np.ndarray:
+    """
+    :param step: Minutes between the samples.
+    :return: Epochs covering the window with two more samples on both sides.
+    """
+    return np.arange(-2 * step, WINDOW + 2 * step + 1, step, dtype=float)
+
+
+def _on_sky(values: dict, exact: dict) -> float:
+    """
+    :param values: Interpolated AZ and EL columns.
+    :param exact: Exact AZ and EL columns.
+    :return: Largest angle in degrees between the two sets of positions.
+    """
+    az1, el1, az2, el2 = map(
+        np.radians, (values["AZ"], values["EL"], exact["AZ"], exact["EL"])
+    )
+    cosine = np.sin(el1) * np.sin(el2) + np.cos(el1) * np.cos(el2) * np.cos(
+        az1 - az2
+    )
+    return float(np.max(np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0)))))
+
+
+def _wrapped_difference(first, second) -> np.ndarray:
+    """
+    :return: Absolute differences in degrees of angles wrapping at 360.
+    """
+    return np.abs((np.asarray(first) - second + 180.0) % 360.0 - 180.0)
+
+
+class TestChooseStep(unittest.TestCase):
+    def test_step_is_one_of_steps(self):
+        step = interpolation.choose_step(TOLERANCE, WINDOW)
+        self.assertIn(step, interpolation.STEPS)
+
+    def test_short_window_gets_three_steps(self):
+        self.assertLessEqual(interpolation.choose_step(TOLERANCE, 30.0), 10)
+
+    def test_tighter_tolerance_gets_finer_step(self):
+        self.assertLess(
+            interpolation.choose_step(TOLERANCE / 100, WINDOW),
+            interpolation.choose_step(TOLERANCE, WINDOW),
+        )
+
+    def test_finer_step(self):
+        self.assertEqual(interpolation.finer_step(30), 15)
+        self.assertIsNone(interpolation.finer_step(1))
+
+
+class TestInterpolationAccuracy(unittest.TestCase):
+    def setUp(self):
+        self.step = interpolation.choose_step(TOLERANCE, WINDOW)
+        self.dense = np.arange(0.0, WINDOW + 0.5, 0.5)
+
+    def test_adapted_step_is_within_tolerance(self):
+        """Interpolated stars match a dense table once the step is refined
+        until the estimated error is within tolerance."""
+        for dec in (-20.0, 10.0, 30.0, 60.0):
+            step = self.step
+            table = _star(120.0, dec, _grid(step))
+            while interpolation.interpolation_error(table) > TOLERANCE:
+                step = interpolation.finer_step(step)
+                table = _star(120.0, dec, _grid(step))
+            values = interpolation.EphemerisInterpolator(table)(self.dense)
+            exact = _star(120.0, dec, self.dense)
+            self.assertLessEqual(_on_sky(values, exact), TOLERANCE)
+
+    def test_estimate_covers_the_error(self):
+        """The estimate asks for a finer step when the step is too coarse."""
+        table = _star(120.0, 30.0, _grid(60))
+        values = interpolation.EphemerisInterpolator(table)(self.dense)
+        exact = _star(120.0, 30.0, self.dense)
+        self.assertGreater(_on_sky(values, exact), TOLERANCE)
+        self.assertGreater(interpolation.interpolation_error(table), TOLERANCE)
+
+    def test_near_zenith_azimuth_is_weighted(self):
+        """The swinging azimuth near the zenith counts as an angle on the
+        sky, so a step well within tolerance is not refined further."""
+        table = _star(120.0, LATITUDE - 2.0, _grid(5))
+        self.assertLessEqual(
+            interpolation.interpolation_error(table), TOLERANCE
+        )
+        values = interpolation.EphemerisInterpolator(table)(self.dense)
+        exact = _star(120.0, LATITUDE - 2.0, self.dense)
+        self.assertLessEqual(_on_sky(values, exact), TOLERANCE)
+
+    def test_right_ascension_wrap(self):
+        """A right ascension crossing 360 degrees interpolates smoothly."""
+
+        def moving(epochs):
+            table = _star(0.0, 5.0, epochs)
+            # About the rate of the Moon, crossing 360 mid-window
+            table["RA"] = np.mod(
+                358.0 + 0.0092 * epochs + 0.5 * np.sin(epochs / 600.0), 360.0
+            )
+            return table
+
+        table = moving(_grid(self.step))
+        self.assertLessEqual(
+            interpolation.interpolation_error(table), TOLERANCE
+        )
+        values = interpolation.EphemerisInterpolator(table)(self.dense)
+        self.assertTrue(np.all((values["RA"] >= 0.0) & (values["RA"] < 360.0)))
+        error = _wrapped_difference(values["RA"], moving(self.dense)["RA"])
+        self.assertLessEqual(np.max(error), TOLERANCE)
+
+    def test_outside_samples_is_nan(self):
+        table = _star(120.0, 10.0, _grid(self.step))
+        values = interpolation.EphemerisInterpolator(table)(
+            [table["epoch"][0] - 1.0]
+        )
+        self.assertTrue(np.isnan(values["EL"][0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
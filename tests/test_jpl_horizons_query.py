@@ -0,0 +1,63 @@
+"""Tests for the `jpl_horizons_query` module."""
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from pysky import cache, jpl_horizons_query
+from pysky.const import Const
+
+# Observing window of the queries
+WINDOW = {
+    "START_YEAR": "2020",
+    "START_MONTH": "01",
+    "START_DAY": "01",
+    "START_TIME": "18:00",
+    "END_YEAR": "2020",
+    "END_MONTH": "01",
+    "END_DAY": "02",
+    "END_TIME": "01:00",
+}
+
+
+class TestEphemerisQuery(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = cache.Cache(Path(self.directory.name, "cache.sqlite3"))
+        patches = (
+            mock.patch.object(cache, "_CACHE", self.cache),
+            mock.patch.multiple(Const, **WINDOW),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.cache.close()
+        self.directory.cleanup()
+
+    def test_unresolved_body_is_recorded(self):
+        """Horizons failing to resolve a body skips it in the next runs."""
+        with mock.patch.object(
+            jpl_horizons_query,
+            "_fetch_table",
+            side_effect=ValueError("Ambiguous target name"),
+        ):
+            result = jpl_horizons_query.ephemeris_query("Mars")
+        self.assertEqual(result, (None, None))
+        failures = self.cache.get_failures("horizons", ["Mars"])
+        self.assertEqual(failures, {"Mars": "Ambiguous target name"})
+
+    def test_build_error_is_not_recorded(self):
+        """An error building the ephemeris locally is not a failure."""
+        # The table misses every column to_ephemeris reads
+        with mock.patch.object(
+            jpl_horizons_query, "_sample", return_value=dict()
+        ):
+            result = jpl_horizons_query.ephemeris_query("Mars")
+        self.assertEqual(result, (None, None))
+        self.assertEqual(self.cache.get_failures("horizons", ["Mars"]), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+"""Tests of the keys of the replay corpus."""
+import unittest
+
+from requests import Request
+
+from pysky.replay import request_key
+
+URL = "https://simbad.u-strasbg.fr/simbad/sim-script"
+
+
+def _prepared(files):
+    """
+    :param files: Fields of the multipart body.
+    :return: Prepared POST request with a random boundary.
+    """
+    return Request("POST", URL, files=files).prepare()
+
+
+def _key(request):
+    """
+    :param request: Prepared request.
+    :return: Key of the request in the corpus.
+    """
+    content_type = request.headers["Content-Type"]
+    return request_key(request.method, request.url, request.body, content_type)
+
+
+class TestRequestKey(unittest.TestCase):
+    def test_multipart_boundary_is_ignored(self):
+        first = _prepared({"script": ("script", b"query id Vega")})
+        second = _prepared({"script": ("script", b"query id Vega")})
+        self.assertNotEqual(first.body, second.body)
+        self.assertEqual(_key(first), _key(second))
+
+    def test_multipart_contents_are_keyed(self):
+        first = _prepared({"script": ("script", b"query id Vega")})
+        second = _prepared({"script": ("script", b"query id Deneb")})
+        self.assertNotEqual(_key(first), _key(second))
+
+    def test_urlencoded_field_order_is_ignored(self):
+        content_type = "application/x-www-form-urlencoded"
+        self.assertEqual(
+            request_key("POST", URL, "a=1&b=2", content_type),
+            request_key("POST", URL, "b=2&a=1", content_type),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+"""Tests for the `simbad` module."""
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from pysky import cache, simbad
+
+
+class ServiceError(Exception):
+    """Stands in for the DALServiceError of a SIMBAD outage."""
+
+
+class FailingClient(object):
+    def __init__(self, *fields):
+        pass
+
+    def query_objects(self, celestial_objs):
+        if "Vega" in celestial_objs:
+            raise ServiceError("SIMBAD is down")
+        return None
+
+
+class TestQueryChunk(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = cache.Cache(Path(self.directory.name, "cache.sqlite3"))
+        patches = (
+            mock.patch.object(cache, "_CACHE", self.cache),
+            mock.patch.object(simbad, "BULK_CHUNK", 1),
+            mock.patch.object(simbad, "get_client", FailingClient),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.cache.close()
+        self.directory.cleanup()
+
+    def test_failed_chunk_does_not_abort_batch(self):
+        """A chunk raising any error is recorded, the others resolve."""
+        resolved = simbad.resolve_objects(["Vega", "Deneb"])
+        unresolved = resolved.meta["unresolved"]
+        self.assertEqual(unresolved, {"Deneb": "Not found in SIMBAD"})
+        failures = self.cache.get_failures("simbad", ["Vega", "Deneb"])
+        self.assertEqual(list(failures), ["Vega"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""Tests for the `skyview` module."""
+import io
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import PIL.Image
+
+from pysky import http_client, skyview
+from pysky.const import Const
+
+PAGE = (
+    '<table><tr><td colspan="3" align="left">'
+    '<a href="../tempspace/fits/skv1.jpg">Quicklook</a></td></tr></table>'
+)
+
+
+def _jpeg() -> bytes:
+    """
+    :return: Bytes of a small JPEG image.
+    """
+    buffer = io.BytesIO()
+    PIL.Image.new("RGB", (64, 64), (10, 20, 30)).save(buffer, format="jpeg")
+    return buffer.getvalue()
+
+
+class FakeResponse(object):
+    """Response of SkyView handing its body out in small chunks."""
+
+    def __init__(self, body: bytes):
+        self.text = body.decode("latin-1")
+        self.body = body
+        self.chunk_sizes = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        self.chunk_sizes.append(chunk_size)
+        for first in range(0, len(self.body), 100):
+            yield self.body[first:][:100]
+
+
+class TestFetchImages(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        # Holds the log of the application
+        Path(self.directory.name, "data").mkdir()
+        patches = (
+            mock.patch.object(Const, "ROOT_DIR", self.directory.name),
+            mock.patch.object(skyview, "skyview_available", lambda: True),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _fetch(self, image: bytes) -> dict:
+        """
+        :param image: Body of the image SkyView answers with.
+        :return: Images returned by fetch_images for Vega.
+        """
+        self.image_response = FakeResponse(image)
+
+        def get(url, stream=False):
+            if url.endswith(".jpg"):
+                self.assertTrue(stream)
+                return self.image_response
+            return FakeResponse(PAGE.encode("utf-8"))
+
+        with mock.patch.object(http_client, "get", get):
+            return skyview.fetch_images(["Vega"])
+
+    def test_image_is_streamed_into_cache(self):
+        image = _jpeg()
+        self.assertEqual(self._fetch(image), {"Vega": image})
+        self.assertEqual(
+            self.image_response.chunk_sizes, [skyview.IMAGE_CHUNK]
+        )
+        cached = list(Path(skyview.image_cache_dir()).iterdir())
+        self.assertEqual(len(cached), 1)
+        self.assertEqual(cached[0].read_bytes(), image)
+
+    def test_corrupt_image_is_not_cached(self):
+        self.assertEqual(self._fetch(b"<html>Not an image</html>"), {})
+        self.assertEqual(list(Path(skyview.image_cache_dir()).iterdir()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()